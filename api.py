@@ -1,24 +1,48 @@
 """FastAPI server for the RAG system."""
-from fastapi import FastAPI, HTTPException, File, UploadFile
+from fastapi import FastAPI, HTTPException, File, UploadFile, Response, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse
+from fastapi import Request
+from starlette.routing import Match
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, AsyncIterator, Awaitable, Tuple
 import time
 import os
+import json
+import asyncio
+import threading
+import base64
+import hashlib
+import numpy as np
 from embeddings import EmbeddingService
-from vector_store import VectorStore
+from vector_store import VectorStore, metadata_filter
 from llm_service import LLMService
 from transcription_service import TranscriptionService
 from ingestion_service import IngestionService
 from deletion_service import DeletionService
 from database import init_db
+from concurrency import run_blocking, run_cancellable, iterate_blocking, shutdown_executors, AsyncSingleFlight, StageOverloaded
+from cache import AnswerCache, ChunkEmbeddingCache, corpus_version
+from timing import StageTimer
+from deadline import Deadline, DeadlineExceeded
+from rate_governor import INTERACTIVE
+from voice_session import UtteranceDetector, VoiceSession
+from compression import StreamAwareGZipMiddleware
+import metrics
 import config
 import tempfile
 import shutil
 from pathlib import Path
 
+try:
+    # orjson (in requirements.txt) encodes large chunk payloads several times
+    # faster than json; the fallback only guards installs that skipped it
+    import orjson  # noqa: F401
+    from fastapi.responses import ORJSONResponse as FastJSONResponse
+except ImportError:
+    FastJSONResponse = JSONResponse
+
 # Initialize FastAPI app
 app = FastAPI(title="Voice to RAG API", version="1.0.0")
 
@@ -33,6 +57,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress JSON responses for clients that accept gzip (SSE streams are left as is)
+app.add_middleware(
+    StreamAwareGZipMiddleware,
+    minimum_size=config.GZIP_MINIMUM_SIZE,
+    compresslevel=config.GZIP_COMPRESS_LEVEL
+)
+
 # Serve static files
 static_dir = os.path.join(os.path.dirname(__file__), "static")
 if os.path.exists(static_dir):
@@ -47,6 +78,19 @@ transcription_service = None
 ingestion_service = None
 deletion_service = None
 
+# Semantic answer cache shared by all /query requests
+answer_cache = AnswerCache(
+    max_size=config.ANSWER_CACHE_MAX_SIZE,
+    similarity_threshold=config.ANSWER_CACHE_SIMILARITY,
+    ttl_seconds=config.ANSWER_CACHE_TTL_SECONDS,
+    stale_ttl_seconds=config.ANSWER_CACHE_STALE_SECONDS
+) if config.ANSWER_CACHE_ENABLED else None
+_revalidating = set()
+_background_tasks = set()
+
+# Coalesces identical /query requests that arrive while one is in flight
+_inflight_queries = AsyncSingleFlight()
+
 def get_embedding_service():
     """Get or initialize embedding service."""
     global embedding_service
@@ -96,17 +140,195 @@ except Exception as e:
     print(f"Warning: Database initialization error (may be OK if already exists): {e}")
 
 
+def _route_label(request: Request) -> str:
+    """Route path template for metrics labels (bounded cardinality)."""
+    for route in app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return getattr(route, "path", "unmatched")
+    return "unmatched"
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Record per-route latency and in-flight requests."""
+    route = _route_label(request)
+    metrics.HTTP_REQUESTS_IN_FLIGHT.inc(route=route)
+    start = time.perf_counter()
+    status = "500"
+    try:
+        response = await call_next(request)
+        status = str(response.status_code)
+        return response
+    finally:
+        metrics.HTTP_REQUESTS_IN_FLIGHT.dec(route=route)
+        metrics.HTTP_REQUEST_DURATION.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=route,
+            status=status
+        )
+
+
+def _embedding_cache_stats() -> Dict[tuple, float]:
+    """Scrape-time embedding cache values."""
+    cache = embedding_service.cache if embedding_service is not None else None
+    if cache is None:
+        return {}
+    stats = cache.stats()
+    return {
+        (name,): stats[name]
+        for name in ("size", "bytes", "hits", "misses", "evictions", "expirations", "hit_ratio")
+    }
+
+
+def _chunk_embedding_cache() -> Optional[ChunkEmbeddingCache]:
+    """Persistent chunk embedding cache used by ingestion (once ingestion has started)."""
+    if ingestion_service is None:
+        return None
+    return ingestion_service.embedding_service.chunk_cache
+
+
+def _chunk_embedding_cache_stats() -> Dict[tuple, float]:
+    """Scrape-time chunk embedding cache values."""
+    cache = _chunk_embedding_cache()
+    if cache is None:
+        return {}
+    stats = cache.stats()
+    return {
+        (name,): stats[name]
+        for name in ("size", "bytes", "hits", "misses", "evictions", "hit_ratio")
+    }
+
+
+def _answer_cache_stats() -> Dict[tuple, float]:
+    """Scrape-time answer cache values."""
+    if answer_cache is None:
+        return {}
+    stats = answer_cache.stats()
+    return {
+        (name,): stats[name]
+        for name in ("size", "hits", "stale_hits", "misses", "evictions", "hit_ratio")
+    }
+
+
+def _vector_store_size() -> Dict[tuple, float]:
+    """Scrape-time Chroma collection size (only once the store is open)."""
+    if vector_store is None:
+        return {}
+    return {(): vector_store.collection.count()}
+
+
+metrics.gauge("rag_embedding_cache", "Query embedding cache statistics", ("stat",), callback=_embedding_cache_stats)
+metrics.gauge("rag_chunk_embedding_cache", "Persistent chunk embedding cache statistics", ("stat",), callback=_chunk_embedding_cache_stats)
+metrics.gauge("rag_answer_cache", "Semantic answer cache statistics", ("stat",), callback=_answer_cache_stats)
+metrics.gauge("rag_vector_store_chunks", "Chunks in the Chroma collection", callback=_vector_store_size)
+metrics.gauge(
+    "rag_query_coalesced",
+    "Identical /query requests served by an in-flight run (cumulative)",
+    callback=lambda: {(): _inflight_queries.coalesced}
+)
+REQUESTS_CANCELLED = metrics.counter(
+    "rag_http_requests_cancelled_total",
+    "Requests abandoned because the client disconnected before the response",
+    ("route",)
+)
+
+
+@app.exception_handler(StageOverloaded)
+async def stage_overloaded_handler(request: Request, exc: StageOverloaded):
+    """Shed load: tell the client to come back instead of queueing without bound."""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded_handler(request: Request, exc: DeadlineExceeded):
+    """Report a request that ran out of time before anything useful was produced."""
+    return JSONResponse(status_code=504, content={"detail": f"{exc}. Please try again."})
+
+
+@app.on_event("shutdown")
+def shutdown():
+    """Release the stage thread pools."""
+    shutdown_executors(wait=False)
+
+
 class QueryRequest(BaseModel):
     """Request model for query endpoint."""
     text: str
+    # Response shaping (defaults return the full response)
+    fields: Optional[List[str]] = None  # Top-level fields to return, e.g. ["answer", "citations"]
+    citation_text: bool = True  # False sends citations as references without the chunk text
+    snippet_chars: Optional[int] = None  # Truncate chunk and citation text to this many characters
 
 
 class QueryResponse(BaseModel):
-    """Response model for query endpoint."""
+    """Response model for query endpoint (fields may be omitted via QueryRequest.fields)."""
+    answer: str
+    citations: List[Dict[str, Any]]
+    retrieved_chunks: List[Dict[str, Any]]
+    latency_ms: float
+    partial: bool = False  # True if the deadline passed before the answer was generated
+    timings: Optional[Dict[str, Any]] = None  # Per-stage milliseconds, embedding_cached, answer_cached
+
+
+class VoiceQueryResponse(BaseModel):
+    """Response model for voice query endpoint."""
+    transcript: str
+    language: str = "en"
     answer: str
     citations: List[Dict[str, Any]]
     retrieved_chunks: List[Dict[str, Any]]
     latency_ms: float
+    partial: bool = False
+    timings: Optional[Dict[str, Any]] = None  # Includes transcription_ms
+
+
+class BatchQueryRequest(BaseModel):
+    """Request model for batch query endpoint."""
+    queries: List[str]
+
+
+class BatchQueryResult(BaseModel):
+    """Result for one query in a batch."""
+    index: int
+    success: bool
+    answer: Optional[str] = None
+    citations: List[Dict[str, Any]] = []
+    retrieved_chunks: List[Dict[str, Any]] = []
+    error: Optional[str] = None
+
+
+class BatchQueryResponse(BaseModel):
+    """Response model for batch query endpoint."""
+    results: List[BatchQueryResult]
+    total: int
+    succeeded: int
+    latency_ms: float
+    timings: Optional[Dict[str, Any]] = None
+
+
+class SearchRequest(BaseModel):
+    """Request model for retrieval-only search."""
+    text: str
+    top_k: Optional[int] = None  # Results per page (default TOP_K, at most SEARCH_MAX_TOP_K)
+    min_similarity: Optional[float] = None  # Drop results below this cosine similarity
+    document_ids: Optional[List[int]] = None  # Only search these documents (ids as listed by /documents)
+    document_titles: Optional[List[str]] = None
+    cursor: Optional[str] = None  # next_cursor of the previous page
+    snippet_chars: Optional[int] = None  # Truncate chunk text to this many characters
+
+
+class SearchResponse(BaseModel):
+    """Response model for search endpoint."""
+    results: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None  # None on the last page
+    latency_ms: float
+    timings: Optional[Dict[str, Any]] = None
 
 
 class TranscribeResponse(BaseModel):
@@ -114,6 +336,7 @@ class TranscribeResponse(BaseModel):
     transcript: str
     confidence: Optional[float] = None
     language: str = "en"
+    timings: Optional[Dict[str, Any]] = None
 
 
 class DocumentUploadResponse(BaseModel):
@@ -125,6 +348,7 @@ class DocumentUploadResponse(BaseModel):
     message: str
     error: Optional[str] = None
     already_exists: bool = False
+    timings: Optional[Dict[str, Any]] = None  # read, write, hash, parse, chunk, embed, sqlite, chroma
 
 
 class DocumentInfo(BaseModel):
@@ -171,6 +395,11 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "query": "/query",
+            "query_stream": "/query/stream",
+            "query_batch": "/query/batch",
+            "search": "/search",
+            "voice_query": "/voice-query",
+            "voice_session": "/ws/voice",
             "transcribe": "/transcribe",
             "documents": {
                 "upload": "/documents/upload",
@@ -178,6 +407,7 @@ async def root():
                 "delete": "/documents/{document_id}"
             },
             "health": "/health",
+            "metrics": "/metrics",
             "ui": "/static/index.html"
         }
     }
@@ -189,31 +419,97 @@ async def health():
     return {"status": "healthy"}
 
 
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics in text exposition format."""
+    # Rendering may count the Chroma collection; keep it off the event loop
+    body = await run_blocking("database", metrics.REGISTRY.render)
+    return Response(content=body, media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Report embedding and answer cache statistics."""
+    embedding_cache = embedding_service.cache if embedding_service is not None else None
+    chunk_embedding_cache = _chunk_embedding_cache()
+    return {
+        "embedding_cache": embedding_cache.stats() if embedding_cache is not None else None,
+        # Counts the SQLite table; keep it off the event loop
+        "chunk_embedding_cache": (
+            await run_blocking("database", chunk_embedding_cache.stats)
+            if chunk_embedding_cache is not None else None
+        ),
+        "answer_cache": answer_cache.stats() if answer_cache is not None else None
+    }
+
+
+async def _transcribe(
+    audio_bytes: bytes,
+    timer: StageTimer,
+    filename: str = "audio.webm",
+    deadline: Optional[Deadline] = None
+) -> Dict[str, Any]:
+    """
+    Transcribe uploaded audio.
+    
+    Args:
+        audio_bytes: Audio file content
+        timer: Request timer; records the transcription stage
+        filename: Upload name whose extension identifies the audio format
+        deadline: Optional request deadline
+        
+    Returns:
+        Dict with transcript, confidence and language
+        
+    Raises:
+        HTTPException: 400 for empty audio or rejected requests, 500 otherwise
+    """
+    if not audio_bytes:
+        raise HTTPException(status_code=400, detail="Audio file is empty")
+    
+    try:
+        with timer.stage("transcription"):
+            return await _run_stage(
+                "transcription",
+                deadline,
+                get_transcription_service().transcribe_audio,
+                audio_bytes,
+                filename=filename
+            )
+    except (StageOverloaded, DeadlineExceeded):
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Transcription error: {str(e)}")
+
+
 @app.post("/transcribe", response_model=TranscribeResponse)
-async def transcribe(audio: UploadFile = File(...)):
+async def transcribe(response: Response, audio: UploadFile = File(...)):
     """
     Transcribe audio file to text using OpenAI Whisper API.
     
     Accepts audio files in various formats (webm, mp3, wav, etc.)
     Returns transcribed text with language detection.
     """
+    timer = StageTimer()
     try:
         # Read audio file
-        audio_bytes = await audio.read()
-        
-        if not audio_bytes or len(audio_bytes) == 0:
-            raise HTTPException(status_code=400, detail="Audio file is empty")
+        with timer.stage("read"):
+            audio_bytes = await audio.read()
         
         # Transcribe audio
-        result = get_transcription_service().transcribe_audio(audio_bytes)
+        result = await _transcribe(audio_bytes, timer)
         
+        response.headers["Server-Timing"] = timer.server_timing_header()
         return TranscribeResponse(
             transcript=result["transcript"],
             confidence=result.get("confidence"),
-            language=result.get("language", "en")
+            language=result.get("language", "en"),
+            timings=timer.to_dict()
         )
     
-    except HTTPException:
+    except (HTTPException, StageOverloaded, DeadlineExceeded):
         raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -221,8 +517,466 @@ async def transcribe(audio: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"Transcription error: {str(e)}")
 
 
+NO_RESULTS_ANSWER = "I couldn't find any relevant information in the documents to answer your question. Please try rephrasing your query or check if relevant documents have been ingested."
+PARTIAL_ANSWER = "The answer could not be generated within the request deadline. The most relevant passages are included below."
+
+
+def _low_relevance_answer() -> str:
+    """Answer returned when every retrieved chunk is below the similarity threshold."""
+    return f"I found some information, but the relevance is low (similarity < {config.SIMILARITY_THRESHOLD * 100}%). Please try rephrasing your question or check if more relevant documents are available."
+
+
+def _filter_chunks(retrieved_chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Keep chunks at or above the similarity threshold."""
+    return [
+        chunk for chunk in retrieved_chunks
+        if chunk.get("similarity_score", 0) >= config.SIMILARITY_THRESHOLD
+    ]
+
+
+async def _run_stage(
+    stage: str,
+    deadline: Optional[Deadline],
+    func,
+    /,
+    *args,
+    cancellable: bool = False,
+    **kwargs
+) -> Any:
+    """
+    run_blocking bounded by the request deadline.
+    
+    func is also passed the deadline (as the deadline keyword) so its upstream
+    request times out; this bound covers time spent queued for a worker too.
+    With cancellable, func is run with run_cancellable and can stop early if
+    the request is abandoned.
+    
+    Raises:
+        DeadlineExceeded: If the deadline passes first
+    """
+    run = run_cancellable if cancellable else run_blocking
+    if deadline is None:
+        return await run(stage, func, *args, **kwargs)
+    deadline.check(stage)
+    try:
+        return await asyncio.wait_for(
+            run(stage, func, *args, deadline=deadline, **kwargs),
+            deadline.remaining()
+        )
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(stage)
+
+
+def _request_deadline(http_request: Request) -> Optional[Deadline]:
+    """
+    Deadline for a request from the X-Request-Deadline-Ms header or REQUEST_DEADLINE_MS.
+    
+    Returns:
+        Deadline, or None if neither sets a budget
+        
+    Raises:
+        HTTPException: If the header is not a positive integer
+    """
+    header = http_request.headers.get("X-Request-Deadline-Ms")
+    if header is None:
+        budget_ms = config.REQUEST_DEADLINE_MS
+    else:
+        try:
+            budget_ms = int(header)
+        except ValueError:
+            budget_ms = 0
+        if budget_ms <= 0:
+            raise HTTPException(status_code=400, detail="X-Request-Deadline-Ms must be a positive integer")
+    if budget_ms <= 0:
+        return None
+    return Deadline(min(budget_ms, config.REQUEST_DEADLINE_MAX_MS) / 1000)
+
+
+async def _wait_for_disconnect(http_request: Request) -> None:
+    """Return once the client has disconnected (the request body must already be read)."""
+    while True:
+        message = await http_request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def _cancel_on_disconnect(http_request: Request, work: Awaitable[Any]) -> Any:
+    """
+    Await work, cancelling it if the client disconnects first.
+    
+    Cancellation drops the request's queued stage calls and signals running
+    completions to stop, so nobody pays for an answer that cannot be delivered.
+    
+    Args:
+        http_request: Request whose body has been read
+        work: Coroutine producing the response data
+        
+    Returns:
+        Result of work
+        
+    Raises:
+        HTTPException: 499 if the client disconnected (never seen by the client)
+    """
+    task = asyncio.ensure_future(work)
+    watcher = asyncio.ensure_future(_wait_for_disconnect(http_request))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            REQUESTS_CANCELLED.inc(route=_route_label(http_request))
+    if task.cancelled():
+        raise HTTPException(status_code=499, detail="Client closed request")
+    return task.result()
+
+
+async def _embed_query(query_text: str, timer: StageTimer, deadline: Optional[Deadline] = None) -> np.ndarray:
+    """
+    Generate the query embedding.
+    
+    Args:
+        query_text: Stripped, non-empty query text
+        timer: Request timer; records the embedding stage and embedding_cached
+        deadline: Optional request deadline
+        
+    Returns:
+        Query embedding
+        
+    Raises:
+        HTTPException: If embedding fails
+    """
+    try:
+        with timer.stage("embedding"):
+            return await _run_stage(
+                "embedding",
+                deadline,
+                get_embedding_service().generate_embedding,
+                query_text,
+                timer=timer
+            )
+    except (StageOverloaded, DeadlineExceeded):
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to generate embedding: {str(e)}. Please check your OpenAI API key and connection."
+        )
+
+
+async def _search(
+    query_embedding: np.ndarray,
+    timer: StageTimer,
+    deadline: Optional[Deadline] = None
+) -> List[Dict[str, Any]]:
+    """
+    Retrieve top-k chunks for a query embedding.
+    
+    Args:
+        query_embedding: Query embedding
+        timer: Request timer; records the search stage
+        deadline: Optional request deadline
+        
+    Returns:
+        Retrieved chunks with similarity scores
+        
+    Raises:
+        HTTPException: If retrieval fails
+    """
+    try:
+        with timer.stage("search"):
+            return await _run_stage(
+                "search",
+                deadline,
+                get_vector_store().search,
+                query_embedding
+            )
+    except (StageOverloaded, DeadlineExceeded):
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to retrieve documents: {str(e)}. Please check the vector database."
+        )
+
+
+async def _retrieve(query_text: str, timer: StageTimer, deadline: Optional[Deadline] = None) -> List[Dict[str, Any]]:
+    """
+    Embed the query and retrieve top-k chunks.
+    
+    Args:
+        query_text: Stripped, non-empty query text
+        timer: Request timer; records embedding and search stages
+        deadline: Optional request deadline
+        
+    Returns:
+        Retrieved chunks with similarity scores
+        
+    Raises:
+        HTTPException: If embedding or retrieval fails
+    """
+    query_embedding = await _embed_query(query_text, timer, deadline)
+    return await _search(query_embedding, timer, deadline)
+
+
+async def _answer_and_cache(
+    query_text: str,
+    query_embedding: np.ndarray,
+    version: int,
+    timer: StageTimer,
+    deadline: Optional[Deadline] = None
+) -> Dict[str, Any]:
+    """
+    Retrieve and generate an answer, caching it if the LLM produced it.
+    
+    Args:
+        query_text: Query text
+        query_embedding: Query embedding
+        version: Corpus version read before retrieval
+        timer: Request timer
+        deadline: Optional request deadline
+        
+    Returns:
+        Dict with answer, citations, retrieved_chunks and partial
+    """
+    retrieved_chunks = await _search(query_embedding, timer, deadline)
+    result = await _generate_answer(query_text, retrieved_chunks, timer, deadline, cancellable=True)
+    payload = {
+        "answer": result["answer"],
+        "citations": result["citations"],
+        "retrieved_chunks": retrieved_chunks,
+        "partial": result.get("partial", False)
+    }
+    # Fallback and partial answers are cheap or incomplete; only cache full LLM answers
+    if answer_cache is not None and _filter_chunks(retrieved_chunks) and not payload["partial"]:
+        answer_cache.set(query_embedding, payload, version)
+    return payload
+
+
+async def _query_pipeline(query_text: str, timer: StageTimer, deadline: Optional[Deadline] = None) -> tuple:
+    """
+    Run the full query pipeline.
+    
+    Args:
+        query_text: Stripped, non-empty query text
+        timer: Timer of the request running the pipeline
+        deadline: Optional deadline of the request running the pipeline
+        
+    Returns:
+        Tuple of (dict with answer, citations and retrieved_chunks; timer)
+    """
+    # Step 1: Generate query embedding
+    query_embedding = await _embed_query(query_text, timer, deadline)
+    
+    # Serve a semantically equivalent cached answer if the corpus is unchanged
+    version = corpus_version.get()
+    cached = None
+    if answer_cache is not None:
+        with timer.stage("answer_cache"):
+            cached = answer_cache.get(query_embedding, version)
+    timer.annotate("answer_cached", cached is not None)
+    if cached is not None:
+        if cached["stale"]:
+            _schedule_revalidation(cached["key"], query_text, query_embedding)
+        return cached["result"], timer
+    
+    # Steps 2-3: Retrieve top-k chunks and generate answer with citations
+    return await _answer_and_cache(query_text, query_embedding, version, timer, deadline), timer
+
+
+def _normalize_query(query_text: str) -> str:
+    """Key for coalescing identical questions (case and whitespace insensitive)."""
+    return " ".join(query_text.lower().split())
+
+
+def _schedule_revalidation(cache_key: int, query_text: str, query_embedding: np.ndarray) -> None:
+    """Regenerate a stale cached answer in the background (once per entry)."""
+    if cache_key in _revalidating:
+        return
+    _revalidating.add(cache_key)
+    
+    async def revalidate():
+        try:
+            await _answer_and_cache(query_text, query_embedding, corpus_version.get(), StageTimer())
+        except Exception as e:
+            print(f"Warning: Background answer revalidation failed: {e}")
+        finally:
+            _revalidating.discard(cache_key)
+    
+    task = asyncio.create_task(revalidate())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def _generate_answer(
+    query_text: str,
+    retrieved_chunks: List[Dict[str, Any]],
+    timer: StageTimer,
+    deadline: Optional[Deadline] = None,
+    cancellable: bool = False
+) -> Dict[str, Any]:
+    """
+    Generate an answer from retrieved chunks.
+    
+    Falls back to a fixed answer without calling the LLM when nothing was
+    retrieved or every chunk is below the similarity threshold, and to a
+    partial result (passages only) when the deadline passes first.
+    
+    Args:
+        query_text: Query text
+        retrieved_chunks: Chunks returned by the vector store
+        timer: Request timer; records filter and llm stages
+        deadline: Optional request deadline
+        cancellable: Abandon the completion upstream if this coroutine is cancelled
+        
+    Returns:
+        Dict with answer and citations (and partial=True on timeout)
+        
+    Raises:
+        HTTPException: If answer generation fails
+    """
+    if not retrieved_chunks:
+        return {"answer": NO_RESULTS_ANSWER, "citations": []}
+    
+    # Filter chunks by similarity threshold
+    with timer.stage("filter"):
+        filtered_chunks = _filter_chunks(retrieved_chunks)
+    
+    if not filtered_chunks:
+        return {"answer": _low_relevance_answer(), "citations": []}
+    
+    try:
+        with timer.stage("llm"):
+            return await _run_stage(
+                "llm",
+                deadline,
+                get_llm_service().generate_answer,
+                query_text,
+                filtered_chunks,
+                cancellable=cancellable
+            )
+    except DeadlineExceeded:
+        # Retrieval finished in time; return its passages rather than nothing
+        return {"answer": PARTIAL_ANSWER, "citations": [], "partial": True}
+    except StageOverloaded:
+        raise
+    except Exception as e:
+        # If LLM fails, return retrieved chunks with error message
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to generate answer: {str(e)}. Retrieved passages are available but answer generation failed. Please check your OpenAI API key and try again."
+        )
+
+
+def _validate_query_text(request: QueryRequest) -> str:
+    """Return stripped query text or raise 400 if empty."""
+    query_text = request.text.strip() if request.text else ""
+    
+    if not query_text:
+        raise HTTPException(status_code=400, detail="Query text cannot be empty")
+    return query_text
+
+
+async def _run_query(query_text: str, timer: StageTimer, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+    """
+    Answer a question, sharing the run with identical questions in flight.
+    
+    Args:
+        query_text: Stripped, non-empty query text
+        timer: Request timer; gets the stages of the shared run if coalesced
+        deadline: Optional request deadline. The shared run is bounded by the
+            deadline of the request that started it; if that cuts it short,
+            a request with time left runs the pipeline itself.
+        
+    Returns:
+        Dict with answer, citations, retrieved_chunks and partial
+    """
+    try:
+        result, pipeline_timer = await _inflight_queries.do(
+            _normalize_query(query_text),
+            lambda: _query_pipeline(query_text, timer, deadline)
+        )
+    except DeadlineExceeded:
+        if deadline is not None and deadline.expired():
+            raise
+        result, pipeline_timer = await _query_pipeline(query_text, timer, deadline)
+    else:
+        if pipeline_timer is not timer and result.get("partial") and not (deadline is not None and deadline.expired()):
+            # Another request's deadline truncated the shared answer; ours has time left
+            result, pipeline_timer = await _query_pipeline(query_text, timer, deadline)
+    if pipeline_timer is not timer:
+        # Report the stages of the shared run this request waited on
+        timer.stages.update(pipeline_timer.stages)
+        timer.flags.update(pipeline_timer.flags)
+        timer.annotate("coalesced", True)
+    return result
+
+
+def _truncate(text: str, max_chars: Optional[int]) -> str:
+    """Cut text to max_chars, marking the cut with an ellipsis."""
+    if max_chars is None or len(text) <= max_chars:
+        return text
+    return text[:max_chars].rstrip() + "..."
+
+
+def _validate_shaping(request: QueryRequest) -> None:
+    """Raise 400 for unknown fields or a negative snippet length."""
+    if request.fields is not None:
+        unknown = set(request.fields) - set(QueryResponse.model_fields)
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown response fields: {', '.join(sorted(unknown))}. "
+                       f"Valid fields: {', '.join(QueryResponse.model_fields)}"
+            )
+    if request.snippet_chars is not None and request.snippet_chars < 0:
+        raise HTTPException(status_code=400, detail="snippet_chars cannot be negative")
+
+
+def _shape_query_response(payload: Dict[str, Any], request: QueryRequest) -> Dict[str, Any]:
+    """
+    Apply the request's response shaping options.
+    
+    Args:
+        payload: Full response (answer, citations, retrieved_chunks, latency_ms, partial, timings)
+        request: Query request with fields, citation_text and snippet_chars
+        
+    Returns:
+        New dict; cached chunk and citation dicts are copied, never modified
+    """
+    if request.fields is not None:
+        # A partial answer is always flagged so clients never mistake it for a full one
+        payload = {
+            key: value for key, value in payload.items()
+            if key in request.fields or (key == "partial" and value)
+        }
+    
+    if "citations" in payload:
+        citations = []
+        for citation in payload["citations"]:
+            if not request.citation_text:
+                citation = {key: value for key, value in citation.items() if key != "text"}
+            elif request.snippet_chars is not None and "text" in citation:
+                citation = dict(citation, text=_truncate(citation["text"], request.snippet_chars))
+            citations.append(citation)
+        payload["citations"] = citations
+    
+    if "retrieved_chunks" in payload and request.snippet_chars is not None:
+        payload["retrieved_chunks"] = [
+            dict(chunk, text=_truncate(chunk.get("text", ""), request.snippet_chars))
+            for chunk in payload["retrieved_chunks"]
+        ]
+    return payload
+
+
+def _sse_event(event: str, data: Any) -> str:
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
 @app.post("/query", response_model=QueryResponse)
-async def query(request: QueryRequest):
+async def query(request: QueryRequest, http_request: Request):
     """
     Process a text query and return a grounded answer with citations.
     
@@ -230,82 +984,509 @@ async def query(request: QueryRequest):
     1. Generate query embedding
     2. Retrieve top-k chunks
     3. Generate answer with citations
+    
+    Clients on slow links can shrink the response with `fields`,
+    `citation_text=false` and `snippet_chars`.
+    
+    The request must finish within X-Request-Deadline-Ms (default
+    REQUEST_DEADLINE_MS). If answer generation runs out of time the retrieved
+    passages are returned with partial=true; if retrieval does, the response
+    is 504. If the client disconnects first, the remaining work is cancelled.
     """
     start_time = time.time()
     
-    query_text = request.text.strip() if request.text else ""
-    
-    if not query_text:
-        raise HTTPException(status_code=400, detail="Query text cannot be empty")
+    query_text = _validate_query_text(request)
+    _validate_shaping(request)
+    deadline = _request_deadline(http_request)
     
+    timer = StageTimer()
     try:
-        # Step 1: Generate query embedding
+        result = await _cancel_on_disconnect(http_request, _run_query(query_text, timer, deadline))
+        
+        latency_ms = (time.time() - start_time) * 1000
+        
+        # Encode directly instead of re-validating every chunk through QueryResponse
+        payload = _shape_query_response({
+            "answer": result["answer"],
+            "citations": result["citations"],
+            "retrieved_chunks": result["retrieved_chunks"],
+            "latency_ms": latency_ms,
+            "partial": result.get("partial", False),
+            "timings": timer.to_dict()
+        }, request)
+        return FastJSONResponse(
+            content=payload,
+            headers={"Server-Timing": timer.server_timing_header()}
+        )
+    
+    except (HTTPException, StageOverloaded, DeadlineExceeded):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Unexpected error processing query: {str(e)}")
+
+
+@app.post("/query/batch", response_model=BatchQueryResponse)
+async def query_batch(request: BatchQueryRequest, response: Response):
+    """
+    Answer many queries in one request.
+    
+    All valid queries are embedded with one embeddings call and retrieved with
+    one multi-vector collection query. Answers are then generated concurrently,
+    at most BATCH_QUERY_CONCURRENCY at a time. Results are returned in input
+    order; an empty query or a failed answer only fails its own item.
+    """
+    start_time = time.time()
+    timer = StageTimer()
+    
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="At least one query is required")
+    if len(request.queries) > config.BATCH_QUERY_MAX_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many queries: {len(request.queries)}. Maximum batch size: {config.BATCH_QUERY_MAX_SIZE}"
+        )
+    
+    results: List[Optional[BatchQueryResult]] = [None] * len(request.queries)
+    valid: List[tuple] = []
+    for index, text in enumerate(request.queries):
+        query_text = text.strip() if text else ""
+        if query_text:
+            valid.append((index, query_text))
+        else:
+            results[index] = BatchQueryResult(index=index, success=False, error="Query text cannot be empty")
+    
+    if valid:
+        texts = [query_text for _, query_text in valid]
+        
+        # Step 1: Embed all queries in one request
         try:
-            query_embedding = get_embedding_service().generate_embedding(query_text)
+            with timer.stage("embedding"):
+                query_embeddings = await run_blocking(
+                    "embedding",
+                    get_embedding_service().generate_embeddings_batch,
+                    texts,
+                    INTERACTIVE
+                )
+        except (StageOverloaded, DeadlineExceeded):
+            raise
         except Exception as e:
             raise HTTPException(
                 status_code=500,
-                detail=f"Failed to generate embedding: {str(e)}. Please check your OpenAI API key and connection."
+                detail=f"Failed to generate embeddings: {str(e)}. Please check your OpenAI API key and connection."
             )
         
-        # Step 2: Retrieve top-k chunks
+        # Step 2: Retrieve for all queries in one collection query
         try:
-            retrieved_chunks = get_vector_store().search(query_embedding)
+            with timer.stage("search"):
+                retrieved_lists = await run_blocking(
+                    "search",
+                    get_vector_store().search_batch,
+                    query_embeddings
+                )
+        except (StageOverloaded, DeadlineExceeded):
+            raise
         except Exception as e:
             raise HTTPException(
                 status_code=500,
                 detail=f"Failed to retrieve documents: {str(e)}. Please check the vector database."
             )
         
-        if not retrieved_chunks:
-            return QueryResponse(
-                answer="I couldn't find any relevant information in the documents to answer your question. Please try rephrasing your query or check if relevant documents have been ingested.",
-                citations=[],
-                retrieved_chunks=[],
-                latency_ms=(time.time() - start_time) * 1000
-            )
+        # Step 3: Generate answers with bounded concurrency
+        semaphore = asyncio.Semaphore(config.BATCH_QUERY_CONCURRENCY)
         
-        # Filter chunks by similarity threshold
-        filtered_chunks = [
-            chunk for chunk in retrieved_chunks
-            if chunk.get("similarity_score", 0) >= config.SIMILARITY_THRESHOLD
-        ]
-        
-        if not filtered_chunks:
-            return QueryResponse(
-                answer=f"I found some information, but the relevance is low (similarity < {config.SIMILARITY_THRESHOLD * 100}%). Please try rephrasing your question or check if more relevant documents are available.",
-                citations=[],
-                retrieved_chunks=retrieved_chunks,
-                latency_ms=(time.time() - start_time) * 1000
+        async def answer_one(index: int, query_text: str, retrieved_chunks: List[Dict[str, Any]]) -> None:
+            async with semaphore:
+                try:
+                    result = await _generate_answer(query_text, retrieved_chunks, StageTimer())
+                except (HTTPException, StageOverloaded) as e:
+                    results[index] = BatchQueryResult(
+                        index=index,
+                        success=False,
+                        retrieved_chunks=retrieved_chunks,
+                        error=e.detail if isinstance(e, HTTPException) else str(e)
+                    )
+                    return
+            results[index] = BatchQueryResult(
+                index=index,
+                success=True,
+                answer=result["answer"],
+                citations=result["citations"],
+                retrieved_chunks=retrieved_chunks
             )
         
-        # Step 3: Generate answer with citations
+        with timer.stage("llm"):
+            await asyncio.gather(*(
+                answer_one(index, query_text, retrieved_chunks)
+                for (index, query_text), retrieved_chunks in zip(valid, retrieved_lists)
+            ))
+    
+    response.headers["Server-Timing"] = timer.server_timing_header()
+    return BatchQueryResponse(
+        results=results,
+        total=len(results),
+        succeeded=sum(1 for result in results if result.success),
+        latency_ms=(time.time() - start_time) * 1000,
+        timings=timer.to_dict()
+    )
+
+
+def _search_fingerprint(query_text: str, request: SearchRequest) -> str:
+    """Identity of a search's result list, so a cursor cannot be used with another search."""
+    key = json.dumps([
+        _normalize_query(query_text),
+        request.min_similarity,
+        sorted(request.document_ids or []),
+        sorted(request.document_titles or [])
+    ])
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def _encode_cursor(offset: int, fingerprint: str, version: int) -> str:
+    """Opaque cursor for the page starting at offset."""
+    data = json.dumps({"offset": offset, "search": fingerprint, "version": version})
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, fingerprint: str) -> int:
+    """
+    Offset encoded in a cursor.
+    
+    Raises:
+        HTTPException: If the cursor is malformed, belongs to another search,
+            or the documents changed since it was issued
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        offset, search, version = int(data["offset"]), data["search"], data["version"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if search != fingerprint or offset < 0:
+        raise HTTPException(status_code=400, detail="Cursor does not belong to this search")
+    if version != corpus_version.get():
+        raise HTTPException(status_code=409, detail="Documents changed since this cursor was issued. Please restart the search.")
+    return offset
+
+
+@app.post("/search", response_model=SearchResponse)
+async def search(request: SearchRequest, http_request: Request):
+    """
+    Return ranked passages without generating an answer.
+    
+    Only the query embedding (usually cached) and one vector search run, so
+    this is suitable for type-ahead and bulk tooling. Pages are fetched with
+    next_cursor until it is null; pagination ends after SEARCH_MAX_DEPTH
+    results or at the first result below min_similarity.
+    """
+    start_time = time.time()
+    
+    query_text = request.text.strip() if request.text else ""
+    if not query_text:
+        raise HTTPException(status_code=400, detail="Query text cannot be empty")
+    top_k = config.TOP_K if request.top_k is None else request.top_k
+    if not 1 <= top_k <= config.SEARCH_MAX_TOP_K:
+        raise HTTPException(status_code=400, detail=f"top_k must be between 1 and {config.SEARCH_MAX_TOP_K}")
+    if request.snippet_chars is not None and request.snippet_chars < 0:
+        raise HTTPException(status_code=400, detail="snippet_chars cannot be negative")
+    
+    fingerprint = _search_fingerprint(query_text, request)
+    offset = _decode_cursor(request.cursor, fingerprint) if request.cursor else 0
+    deadline = _request_deadline(http_request)
+    # Chroma has no offset, so fetch through the end of this page (plus one to
+    # know whether another page exists) and slice
+    depth = min(offset + top_k + 1, config.SEARCH_MAX_DEPTH)
+    where = metadata_filter(request.document_ids, request.document_titles)
+    
+    timer = StageTimer()
+    version = corpus_version.get()
+    try:
+        query_embedding = await _cancel_on_disconnect(http_request, _embed_query(query_text, timer, deadline))
+        with timer.stage("search"):
+            ranked = await _cancel_on_disconnect(http_request, _run_stage(
+                "search",
+                deadline,
+                get_vector_store().search,
+                query_embedding,
+                top_k=depth,
+                where=where
+            ))
+    except (HTTPException, StageOverloaded, DeadlineExceeded):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to retrieve documents: {str(e)}. Please check the vector database.")
+    
+    if request.min_similarity is not None:
+        ranked = [chunk for chunk in ranked if chunk["similarity_score"] >= request.min_similarity]
+    
+    page = ranked[offset:offset + top_k]
+    if request.snippet_chars is not None:
+        page = [dict(chunk, text=_truncate(chunk.get("text", ""), request.snippet_chars)) for chunk in page]
+    has_more = len(ranked) > offset + top_k and offset + top_k < config.SEARCH_MAX_DEPTH
+    
+    return FastJSONResponse(
+        content={
+            "results": page,
+            "next_cursor": _encode_cursor(offset + top_k, fingerprint, version) if has_more else None,
+            "latency_ms": (time.time() - start_time) * 1000,
+            "timings": timer.to_dict()
+        },
+        headers={"Server-Timing": timer.server_timing_header()}
+    )
+
+
+@app.post("/query/stream")
+async def query_stream(request: QueryRequest, http_request: Request):
+    """
+    Stream a grounded answer as Server-Sent Events.
+    
+    Retrieval runs before the stream opens, so embedding and search failures
+    are reported with a normal HTTP error status. Events, in order:
+    - chunks: {"retrieved_chunks": [...]}
+    - token: {"text": "..."} per answer delta
+    - citation: citation object, as soon as its [n] marker is complete
+    - done: {"answer", "citations", "latency_ms", "timings"}
+    
+    The Server-Timing header carries the retrieval stages; the done event has
+    the full breakdown including first_token_ms and llm_ms.
+    - error: {"detail": "..."} if generation fails mid-stream
+    
+    If the client disconnects, retrieval or generation is abandoned and the
+    upstream completion is closed.
+    """
+    start_time = time.time()
+    
+    query_text = _validate_query_text(request)
+    
+    timer = StageTimer()
+    try:
+        retrieved_chunks = await _cancel_on_disconnect(http_request, _retrieve(query_text, timer))
+    except (HTTPException, StageOverloaded, DeadlineExceeded):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Unexpected error processing query: {str(e)}")
+    
+    return _event_stream_response(
+        _answer_events(query_text, retrieved_chunks, timer, start_time),
+        timer
+    )
+
+
+async def _answer_events(
+    query_text: str,
+    retrieved_chunks: List[Dict[str, Any]],
+    timer: StageTimer,
+    start_time: float
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Generate the chunks/token/citation/done events for retrieved chunks.
+    
+    Args:
+        query_text: Query text
+        retrieved_chunks: Chunks returned by the vector store
+        timer: Request timer; records filter, first_token_ms and llm
+        start_time: Request start (time.time()) for latency_ms
+        
+    Yields:
+        (event name, data) pairs; an error event ends the stream if generation fails
+    """
+    with timer.stage("filter"):
+        filtered_chunks = _filter_chunks(retrieved_chunks)
+    
+    yield ("chunks", {"retrieved_chunks": retrieved_chunks})
+    
+    if not retrieved_chunks or not filtered_chunks:
+        answer = NO_RESULTS_ANSWER if not retrieved_chunks else _low_relevance_answer()
+        yield ("token", {"text": answer})
+        result = {"answer": answer, "citations": []}
+    else:
+        result = None
+        generation_start = time.perf_counter()
+        # Set if the consumer goes away (client disconnect), so the worker
+        # stops the upstream stream at the next delta instead of finishing it
+        cancelled = threading.Event()
         try:
-            result = get_llm_service().generate_answer(query_text, filtered_chunks)
+            events = get_llm_service().generate_answer_stream(query_text, filtered_chunks, cancelled=cancelled)
+            async for event in iterate_blocking("llm", events):
+                if event["type"] == "token":
+                    if "first_token_ms" not in timer.flags:
+                        timer.annotate("first_token_ms", round(timer.total_ms(), 2))
+                    yield ("token", {"text": event["text"]})
+                elif event["type"] == "citation":
+                    yield ("citation", event["citation"])
+                elif event["type"] == "answer":
+                    result = {"answer": event["answer"], "citations": event["citations"]}
         except Exception as e:
-            # If LLM fails, return retrieved chunks with error message
-            raise HTTPException(
-                status_code=500,
-                detail=f"Failed to generate answer: {str(e)}. Retrieved passages are available but answer generation failed. Please check your OpenAI API key and try again."
-            )
+            yield ("error", {
+                "detail": f"Failed to generate answer: {str(e)}. Retrieved passages are available but answer generation failed."
+            })
+            return
+        finally:
+            cancelled.set()
+        timer.add("llm", (time.perf_counter() - generation_start) * 1000)
+    
+    yield ("done", {
+        "answer": result["answer"],
+        "citations": result["citations"],
+        "latency_ms": (time.time() - start_time) * 1000,
+        "timings": timer.to_dict()
+    })
+
+
+def _event_stream_response(events: AsyncIterator[Tuple[str, Any]], timer: StageTimer) -> StreamingResponse:
+    """Send (event name, data) pairs as an unbuffered SSE response (Server-Timing has the stages so far)."""
+    async def sse():
+        async for event, data in events:
+            yield _sse_event(event, data)
+    
+    return StreamingResponse(
+        sse(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            "Server-Timing": timer.server_timing_header()
+        }
+    )
+
+
+@app.post("/voice-query", response_model=VoiceQueryResponse)
+async def voice_query(
+    response: Response,
+    http_request: Request,
+    audio: UploadFile = File(...),
+    stream: bool = False
+):
+    """
+    Answer a spoken question in one round trip.
+    
+    Transcription, embedding, search and answer generation run server-side as
+    one pipeline, so the client uploads audio once and gets the transcript and
+    the answer together.
+    
+    With ?stream=true the response is the /query/stream event stream preceded
+    by a transcript event: {"transcript", "language"}. Transcription and
+    retrieval failures are reported with a normal HTTP error status.
+    
+    X-Request-Deadline-Ms bounds the whole request as for /query; in stream
+    mode it bounds transcription and retrieval.
+    """
+    start_time = time.time()
+    deadline = _request_deadline(http_request)
+    
+    timer = StageTimer()
+    try:
+        with timer.stage("read"):
+            audio_bytes = await audio.read()
         
-        latency_ms = (time.time() - start_time) * 1000
+        transcription = await _cancel_on_disconnect(
+            http_request,
+            _transcribe(audio_bytes, timer, deadline=deadline)
+        )
+        transcript = (transcription.get("transcript") or "").strip()
+        if not transcript:
+            raise HTTPException(status_code=400, detail="No speech detected in audio")
+        language = transcription.get("language", "en")
         
-        return QueryResponse(
+        if stream:
+            retrieved_chunks = await _cancel_on_disconnect(http_request, _retrieve(transcript, timer, deadline))
+            
+            async def events():
+                yield ("transcript", {"transcript": transcript, "language": language})
+                async for event in _answer_events(transcript, retrieved_chunks, timer, start_time):
+                    yield event
+            
+            return _event_stream_response(events(), timer)
+        
+        result = await _cancel_on_disconnect(http_request, _run_query(transcript, timer, deadline))
+        
+        response.headers["Server-Timing"] = timer.server_timing_header()
+        return VoiceQueryResponse(
+            transcript=transcript,
+            language=language,
             answer=result["answer"],
             citations=result["citations"],
-            retrieved_chunks=retrieved_chunks,
-            latency_ms=latency_ms
+            retrieved_chunks=result["retrieved_chunks"],
+            latency_ms=(time.time() - start_time) * 1000,
+            partial=result.get("partial", False),
+            timings=timer.to_dict()
         )
     
-    except HTTPException:
+    except (HTTPException, StageOverloaded, DeadlineExceeded):
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Unexpected error processing query: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Unexpected error processing voice query: {str(e)}")
+
+
+@app.websocket("/ws/voice")
+async def voice_websocket(websocket: WebSocket):
+    """
+    Streaming voice session.
+    
+    The client sends binary frames of 16-bit little-endian mono PCM while the
+    user speaks (VOICE_SAMPLE_RATE Hz unless a start message says otherwise)
+    and may send JSON control messages:
+    - {"type": "start", "sample_rate": 48000}: set the sample rate
+    - {"type": "stop"}: end the current utterance without waiting for silence
+    
+    The server replies with JSON messages {"event": ..., "data": ...}:
+    - partial_transcript: {"text"} as segments are transcribed; retrieval starts on it
+    - transcript: {"transcript", "final": true} once end of speech is detected
+    - chunks, token, citation, done, error: as in /query/stream
+    """
+    await websocket.accept()
+    
+    async def send(event: str, data: Any) -> None:
+        await websocket.send_json({"event": event, "data": data})
+    
+    async def transcribe_wav(wav_bytes: bytes, timer: StageTimer) -> Dict[str, Any]:
+        return await _transcribe(wav_bytes, timer, filename="audio.wav")
+    
+    session = VoiceSession(
+        send=send,
+        transcribe=transcribe_wav,
+        retrieve=_retrieve,
+        answer=_answer_events
+    )
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes") is not None:
+                await session.feed_audio(message["bytes"])
+                continue
+            
+            try:
+                control = json.loads(message.get("text") or "")
+            except ValueError:
+                control = None
+            if not isinstance(control, dict):
+                await send("error", {"detail": "Control messages must be JSON objects"})
+                continue
+            if control.get("type") == "start" and not session.detector.speaking:
+                sample_rate = control.get("sample_rate", config.VOICE_SAMPLE_RATE)
+                if not isinstance(sample_rate, int) or not 8000 <= sample_rate <= 48000:
+                    await send("error", {"detail": "sample_rate must be an integer between 8000 and 48000"})
+                    continue
+                session.detector = UtteranceDetector(sample_rate=sample_rate)
+            elif control.get("type") == "stop":
+                await session.stop()
+    finally:
+        # Stop transcription and generation the client will never see
+        await session.close()
+
+
+def _write_temp_file(temp_fd: int, file_content: bytes) -> None:
+    """Write uploaded bytes to an open temporary file descriptor."""
+    with os.fdopen(temp_fd, 'wb') as temp_file:
+        temp_file.write(file_content)
+        temp_file.flush()
+        os.fsync(temp_file.fileno())  # Ensure data is written to disk
 
 
 @app.post("/documents/upload", response_model=DocumentUploadResponse)
 async def upload_document(
+    response: Response,
     file: UploadFile = File(...),
     title: Optional[str] = None
 ):
@@ -329,9 +1510,11 @@ async def upload_document(
     
     # Create temporary file
     temp_path = None
+    timer = StageTimer()
     try:
         # Read file content
-        file_content = await file.read()
+        with timer.stage("read"):
+            file_content = await file.read()
         
         # Check file size
         if len(file_content) > MAX_FILE_SIZE:
@@ -345,11 +1528,13 @@ async def upload_document(
         temp_fd, temp_path = tempfile.mkstemp(suffix=suffix)
         
         try:
-            # Write file content
-            with os.fdopen(temp_fd, 'wb') as temp_file:
-                temp_file.write(file_content)
-                temp_file.flush()
-                os.fsync(temp_file.fileno())  # Ensure data is written to disk
+            # Write file content off the event loop (large uploads + fsync)
+            with timer.stage("write"):
+                await run_blocking("ingestion", _write_temp_file, temp_fd, file_content)
+        except (StageOverloaded, DeadlineExceeded):
+            # Rejected before the writer took ownership of the descriptor
+            os.close(temp_fd)
+            raise
         except Exception as e:
             # Clean up if write fails
             if temp_path and Path(temp_path).exists():
@@ -380,7 +1565,16 @@ async def upload_document(
             title = Path(original_filename).stem
         
         try:
-            result = get_ingestion_service().ingest_document(temp_path, custom_title=title, original_filename=original_filename)
+            result = await run_blocking(
+                "ingestion",
+                get_ingestion_service().ingest_document,
+                temp_path,
+                custom_title=title,
+                original_filename=original_filename,
+                timer=timer
+            )
+        except (StageOverloaded, DeadlineExceeded):
+            raise
         except Exception as e:
             # Clean up temp file on ingestion error
             if temp_path and Path(temp_path).exists():
@@ -407,6 +1601,7 @@ async def upload_document(
                 status_code = 500
             raise HTTPException(status_code=status_code, detail=result["message"])
         
+        response.headers["Server-Timing"] = timer.server_timing_header()
         return DocumentUploadResponse(
             success=True,
             document_id=result["document_id"],
@@ -414,10 +1609,11 @@ async def upload_document(
             chunks_created=result["chunks_created"],
             message=result["message"],
             error=None,
-            already_exists=result.get("already_exists", False)
+            already_exists=result.get("already_exists", False),
+            timings=timer.to_dict()
         )
     
-    except HTTPException:
+    except (HTTPException, StageOverloaded, DeadlineExceeded):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error uploading document: {str(e)}")
@@ -431,6 +1627,54 @@ async def upload_document(
                 print(f"Warning: Could not delete temporary file {temp_path}: {cleanup_error}")
 
 
+def _list_documents_sync() -> DocumentsListResponse:
+    """Load document metadata from SQLite (blocking)."""
+    from database import get_db_session, Document, Chunk
+    import os
+    
+    db_session = get_db_session()
+    try:
+        documents = db_session.query(Document).order_by(Document.created_at.desc()).all()
+        
+        doc_list = []
+        for doc in documents:
+            # Get file information
+            file_path_obj = Path(doc.file_path)
+            file_name = file_path_obj.name
+            file_type = file_path_obj.suffix.lower().lstrip('.') or 'unknown'
+            
+            # Get file size if file exists
+            file_size = None
+            if file_path_obj.exists():
+                try:
+                    file_size = file_path_obj.stat().st_size
+                except:
+                    pass
+            
+            # Count chunks for this document
+            chunks_count = db_session.query(Chunk).filter_by(document_id=doc.id).count()
+            
+            doc_list.append(
+                DocumentInfo(
+                    id=doc.id,
+                    title=doc.title,
+                    file_name=file_name,
+                    file_path=doc.file_path,
+                    file_type=file_type,
+                    file_size=file_size,
+                    chunks_count=chunks_count,
+                    created_at=doc.created_at
+                )
+            )
+        
+        return DocumentsListResponse(
+            documents=doc_list,
+            total=len(doc_list)
+        )
+    finally:
+        db_session.close()
+
+
 @app.get("/documents", response_model=DocumentsListResponse)
 async def list_documents():
     """
@@ -439,51 +1683,9 @@ async def list_documents():
     Returns list of documents with file names, types, sizes, and chunk counts.
     """
     try:
-        from database import get_db_session, Document, Chunk
-        import os
-        
-        db_session = get_db_session()
-        try:
-            documents = db_session.query(Document).order_by(Document.created_at.desc()).all()
-            
-            doc_list = []
-            for doc in documents:
-                # Get file information
-                file_path_obj = Path(doc.file_path)
-                file_name = file_path_obj.name
-                file_type = file_path_obj.suffix.lower().lstrip('.') or 'unknown'
-                
-                # Get file size if file exists
-                file_size = None
-                if file_path_obj.exists():
-                    try:
-                        file_size = file_path_obj.stat().st_size
-                    except:
-                        pass
-                
-                # Count chunks for this document
-                chunks_count = db_session.query(Chunk).filter_by(document_id=doc.id).count()
-                
-                doc_list.append(
-                    DocumentInfo(
-                        id=doc.id,
-                        title=doc.title,
-                        file_name=file_name,
-                        file_path=doc.file_path,
-                        file_type=file_type,
-                        file_size=file_size,
-                        chunks_count=chunks_count,
-                        created_at=doc.created_at
-                    )
-                )
-            
-            return DocumentsListResponse(
-                documents=doc_list,
-                total=len(doc_list)
-            )
-        finally:
-            db_session.close()
-    
+        return await run_blocking("database", _list_documents_sync)
+    except (StageOverloaded, DeadlineExceeded):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error listing documents: {str(e)}")
 
@@ -500,7 +1702,11 @@ async def delete_document(document_id: int):
         Deletion status and information
     """
     try:
-        result = get_deletion_service().delete_document(document_id)
+        result = await run_blocking(
+            "database",
+            get_deletion_service().delete_document,
+            document_id
+        )
         
         if not result["success"]:
             status_code = 404 if result["error"] == "DOCUMENT_NOT_FOUND" else 500
@@ -515,7 +1721,7 @@ async def delete_document(document_id: int):
             error=None
         )
     
-    except HTTPException:
+    except (HTTPException, StageOverloaded, DeadlineExceeded):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting document: {str(e)}")
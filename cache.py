@@ -1,27 +1,65 @@
-"""Simple in-memory cache for query embeddings."""
-from typing import Dict, Optional
+"""Caches for query embeddings, document chunk embeddings and generated answers."""
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 import hashlib
+import sqlite3
+import sys
+import threading
 import time
+import numpy as np
+import config
 
 
 class EmbeddingCache:
-    """Simple LRU-style cache for query embeddings."""
+    """
+    Thread-safe LRU cache for query embeddings with a TTL and a memory budget.
     
-    def __init__(self, max_size: int = 100, ttl_seconds: int = 3600):
+    Query text is normalized (whitespace collapsed, lower-cased) before keying,
+    so trivially different spellings of a question share one entry.
+    """
+    
+    def __init__(self, max_size: int = 100, ttl_seconds: int = 3600, max_bytes: Optional[int] = None):
         """
         Initialize cache.
         
         Args:
             max_size: Maximum number of cached items
             ttl_seconds: Time to live in seconds (default 1 hour)
+            max_bytes: Approximate memory budget for cached vectors (None for no budget)
         """
-        self.cache: Dict[str, Dict] = {}
+        self.cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()  # key -> entry, least recently used first
         self.max_size = max_size
         self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._bytes = 0
+        self._lock = threading.Lock()
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+    
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """Collapse whitespace and lower-case query text."""
+        return " ".join(query.split()).lower()
     
     def _hash_query(self, query: str) -> str:
-        """Generate hash for query text."""
-        return hashlib.md5(query.encode()).hexdigest()
+        """Generate hash for normalized query text."""
+        return hashlib.md5(self.normalize_query(query).encode()).hexdigest()
+    
+    @staticmethod
+    def _size_of(embedding) -> int:
+        """Approximate memory held by an embedding."""
+        if hasattr(embedding, "nbytes"):
+            return int(embedding.nbytes)
+        # A list holds a pointer per element plus a boxed float each
+        return sys.getsizeof(embedding) + len(embedding) * sys.getsizeof(0.0)
+    
+    def _remove(self, key: str) -> None:
+        """Remove entry (lock held)."""
+        entry = self.cache.pop(key)
+        self._bytes -= entry["bytes"]
     
     def get(self, query: str) -> Optional[list]:
         """
@@ -35,44 +73,577 @@ class EmbeddingCache:
         """
         key = self._hash_query(query)
         
-        if key not in self.cache:
-            return None
-        
-        entry = self.cache[key]
-        
-        # Check if expired
-        if time.time() - entry["timestamp"] > self.ttl_seconds:
-            del self.cache[key]
-            return None
-        
-        return entry["embedding"]
+        with self._lock:
+            entry = self.cache.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            
+            # Check if expired
+            if time.time() - entry["timestamp"] > self.ttl_seconds:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return entry["embedding"]
     
     def set(self, query: str, embedding: list) -> None:
         """
-        Cache embedding for query.
+        Cache embedding for query, evicting least recently used entries as needed.
         
         Args:
             query: Query text
             embedding: Embedding vector
         """
         key = self._hash_query(query)
+        size = self._size_of(embedding)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
         
-        # Remove oldest entry if cache is full
-        if len(self.cache) >= self.max_size and key not in self.cache:
-            # Remove oldest entry (simple approach: remove first)
-            oldest_key = next(iter(self.cache))
-            del self.cache[oldest_key]
-        
-        self.cache[key] = {
-            "embedding": embedding,
-            "timestamp": time.time()
-        }
+        with self._lock:
+            if key in self.cache:
+                self._remove(key)
+            
+            while self.cache and (
+                len(self.cache) >= self.max_size
+                or (self.max_bytes is not None and self._bytes + size > self.max_bytes)
+            ):
+                self._remove(next(iter(self.cache)))
+                self.evictions += 1
+            
+            self.cache[key] = {
+                "embedding": embedding,
+                "timestamp": time.time(),
+                "bytes": size
+            }
+            self._bytes += size
     
     def clear(self) -> None:
         """Clear all cached entries."""
-        self.cache.clear()
+        with self._lock:
+            self.cache.clear()
+            self._bytes = 0
     
     def size(self) -> int:
         """Get current cache size."""
         return len(self.cache)
+    
+    def bytes(self) -> int:
+        """Approximate memory held by cached vectors."""
+        return self._bytes
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get hit/miss/eviction/expiration counters and size."""
+        lookups = self.hits + self.misses
+        return {
+            "size": self.size(),
+            "max_size": self.max_size,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
 
+
+class ChunkEmbeddingCache:
+    """
+    Persistent, content-addressed cache for document chunk embeddings.
+    
+    Vectors are stored as float32 blobs in SQLite, keyed by a hash of the
+    model and the exact chunk text, so re-ingesting a document (or rebuilding
+    the vector store) only embeds chunks whose text actually changed. Least
+    recently used entries are evicted to stay within the size limits.
+    
+    The database is opened on first use. Storage errors are reported and
+    treated as misses so a broken cache never fails an ingestion.
+    """
+    
+    # Stay well under SQLite's limit on bound parameters per statement
+    _LOOKUP_BATCH = 500
+    
+    def __init__(
+        self,
+        path: str,
+        model: str,
+        dimensions: Optional[int] = None,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None
+    ):
+        """
+        Initialize cache.
+        
+        Args:
+            path: SQLite database file
+            model: Embedding model; part of every key
+            dimensions: Requested embedding size, if shortened; part of every key
+            max_entries: Maximum number of stored vectors (None for no limit)
+            max_bytes: Maximum total size of stored vectors (None for no limit)
+        """
+        self.path = path
+        self.model = model
+        self.dimensions = dimensions
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        # Running totals of stored entries and vector bytes; counted once when
+        # the database is opened so writes never scan the table
+        self._count = 0
+        self._bytes = 0
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def _connection(self) -> sqlite3.Connection:
+        """Open the database and create the table (lock held)."""
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunk_embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS chunk_embeddings_last_used ON chunk_embeddings (last_used)")
+            conn.commit()
+            self._count, self._bytes = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM chunk_embeddings"
+            ).fetchone()
+            self._conn = conn
+        return self._conn
+    
+    def _key(self, text: str) -> str:
+        """Content address of a chunk text under this cache's model and size."""
+        model = self.model if self.dimensions is None else f"{self.model}@{self.dimensions}"
+        return hashlib.sha256(f"{model}\0{text}".encode()).hexdigest()
+    
+    def get_many(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """
+        Look up embeddings for chunk texts.
+        
+        Args:
+            texts: Chunk texts
+            
+        Returns:
+            One float32 vector per text, or None where the text is not cached
+        """
+        keys = [self._key(text) for text in texts]
+        unique = list(dict.fromkeys(keys))
+        found: Dict[str, np.ndarray] = {}
+        
+        with self._lock:
+            try:
+                conn = self._connection()
+                for start in range(0, len(unique), self._LOOKUP_BATCH):
+                    batch = unique[start:start + self._LOOKUP_BATCH]
+                    placeholders = ",".join("?" * len(batch))
+                    rows = conn.execute(
+                        f"SELECT key, vector FROM chunk_embeddings WHERE key IN ({placeholders})",
+                        batch
+                    ).fetchall()
+                    for key, blob in rows:
+                        found[key] = np.frombuffer(blob, dtype="<f4")
+                if found:
+                    now = time.time()
+                    conn.executemany(
+                        "UPDATE chunk_embeddings SET last_used = ? WHERE key = ?",
+                        [(now, key) for key in found]
+                    )
+                    conn.commit()
+            except sqlite3.Error as e:
+                print(f"Warning: Chunk embedding cache lookup failed: {e}")
+                found = {}
+            
+            vectors = [found.get(key) for key in keys]
+            hits = sum(vector is not None for vector in vectors)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return vectors
+    
+    def set_many(self, texts: Sequence[str], vectors: Sequence[np.ndarray]) -> None:
+        """
+        Store embeddings for chunk texts, evicting least recently used entries as needed.
+        
+        Args:
+            texts: Chunk texts
+            vectors: One embedding per text
+        """
+        now = time.time()
+        # Later duplicates of a text overwrite earlier ones, as the insert would
+        blobs = {
+            self._key(text): np.asarray(vector, dtype="<f4").tobytes()
+            for text, vector in zip(texts, vectors)
+        }
+        if not blobs:
+            return
+        keys = list(blobs)
+        
+        with self._lock:
+            try:
+                conn = self._connection()
+                count, total = self._count, self._bytes
+                # Entries being replaced leave the totals first
+                for start in range(0, len(keys), self._LOOKUP_BATCH):
+                    batch = keys[start:start + self._LOOKUP_BATCH]
+                    placeholders = ",".join("?" * len(batch))
+                    for (size,) in conn.execute(
+                        f"SELECT LENGTH(vector) FROM chunk_embeddings WHERE key IN ({placeholders})",
+                        batch
+                    ):
+                        count -= 1
+                        total -= size
+                conn.executemany(
+                    "INSERT OR REPLACE INTO chunk_embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                    [(key, blob, now) for key, blob in blobs.items()]
+                )
+                count += len(blobs)
+                total += sum(len(blob) for blob in blobs.values())
+                count, total, evicted = self._evict(conn, count, total)
+                conn.commit()
+            except sqlite3.Error as e:
+                print(f"Warning: Chunk embedding cache update failed: {e}")
+                if self._conn is not None:
+                    self._conn.rollback()
+                return
+            self._count, self._bytes = count, total
+            self.evictions += evicted
+    
+    def _within_limits(self, count: int, total: int) -> bool:
+        """Whether count entries of total bytes fit the size limits."""
+        return (
+            (self.max_entries is None or count <= self.max_entries)
+            and (self.max_bytes is None or total <= self.max_bytes)
+        )
+    
+    def _evict(self, conn: sqlite3.Connection, count: int, total: int) -> Tuple[int, int, int]:
+        """
+        Delete least recently used entries until within limits (lock held).
+        
+        Args:
+            conn: Open connection (changes are committed by the caller)
+            count: Stored entries before eviction
+            total: Stored vector bytes before eviction
+            
+        Returns:
+            (count, total, evicted) after eviction
+        """
+        if self._within_limits(count, total):
+            return count, total, 0
+        
+        # Walk from the oldest entry; only the entries evicted are read
+        victims = []
+        cursor = conn.execute("SELECT key, LENGTH(vector) FROM chunk_embeddings ORDER BY last_used")
+        for key, size in cursor:
+            if self._within_limits(count, total):
+                break
+            victims.append((key,))
+            count -= 1
+            total -= size
+        cursor.close()
+        conn.executemany("DELETE FROM chunk_embeddings WHERE key = ?", victims)
+        return count, total, len(victims)
+    
+    def clear(self) -> None:
+        """Delete all stored embeddings."""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM chunk_embeddings")
+            conn.commit()
+            self._count, self._bytes = 0, 0
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get size and hit/miss/eviction counters (counters are per process)."""
+        with self._lock:
+            size, stored = self._count, self._bytes
+        lookups = self.hits + self.misses
+        return {
+            "size": size,
+            "max_size": self.max_entries,
+            "bytes": stored,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
+    
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class CorpusVersion:
+    """
+    Counter bumped whenever the document corpus changes.
+    
+    Cached answers record the version they were generated under and are never
+    served once documents have been added or deleted since. With a path the
+    counter is kept in that SQLite database, so changes made by another
+    process (such as the ingest.py CLI) are seen too: get() rereads it at most
+    every refresh_seconds. Without a path it is local to this process.
+    """
+    
+    # Reads happen on the request path; give up quickly while a writer holds the lock
+    READ_TIMEOUT_SECONDS = 0.05
+    
+    def __init__(self, path: Optional[str] = None, refresh_seconds: float = 1.0):
+        """
+        Initialize counter at version 0 (or the version stored at path).
+        
+        Args:
+            path: SQLite database shared with other processes (None for a process-local counter)
+            refresh_seconds: Longest time get() serves a version without rereading path
+        """
+        self.path = path
+        self.refresh_seconds = refresh_seconds
+        self._value = 0
+        self._read_at: Optional[float] = None
+        self._lock = threading.Lock()
+    
+    def _connect(self, timeout: float) -> sqlite3.Connection:
+        """Open the database holding the counter, creating its row if needed."""
+        conn = sqlite3.connect(self.path, timeout=timeout)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS corpus_version "
+            "(id INTEGER PRIMARY KEY CHECK (id = 0), value INTEGER NOT NULL)"
+        )
+        conn.execute("INSERT OR IGNORE INTO corpus_version (id, value) VALUES (0, 0)")
+        return conn
+    
+    def get(self) -> int:
+        """Get current corpus version."""
+        if self.path is None:
+            return self._value
+        now = time.monotonic()
+        if self._read_at is not None and now - self._read_at < self.refresh_seconds:
+            return self._value
+        with self._lock:
+            try:
+                conn = self._connect(self.READ_TIMEOUT_SECONDS)
+                try:
+                    (self._value,) = conn.execute("SELECT value FROM corpus_version WHERE id = 0").fetchone()
+                    conn.commit()
+                finally:
+                    conn.close()
+            except sqlite3.Error as e:
+                # Keep serving the last version read; try again after refresh_seconds
+                print(f"Warning: Could not read corpus version: {e}")
+            self._read_at = now
+            return self._value
+    
+    def bump(self) -> int:
+        """
+        Increment corpus version.
+        
+        Returns:
+            New version
+        """
+        with self._lock:
+            if self.path is not None:
+                try:
+                    conn = self._connect(timeout=5.0)
+                    try:
+                        conn.execute("UPDATE corpus_version SET value = value + 1 WHERE id = 0")
+                        (self._value,) = conn.execute("SELECT value FROM corpus_version WHERE id = 0").fetchone()
+                        conn.commit()
+                    finally:
+                        conn.close()
+                    self._read_at = time.monotonic()
+                    return self._value
+                except sqlite3.Error as e:
+                    print(f"Warning: Could not store corpus version: {e}")
+            self._value += 1
+            return self._value
+
+
+corpus_version = CorpusVersion(config.DATABASE_PATH, config.CORPUS_VERSION_REFRESH_SECONDS)
+
+
+class AnswerCache:
+    """Semantic cache for generated answers, looked up by nearest query embedding."""
+    
+    def __init__(
+        self,
+        max_size: int = 1000,
+        similarity_threshold: float = 0.95,
+        ttl_seconds: int = 3600,
+        stale_ttl_seconds: int = 600
+    ):
+        """
+        Initialize cache.
+        
+        Args:
+            max_size: Maximum number of cached answers (least recently used are evicted)
+            similarity_threshold: Minimum cosine similarity for a cached query to match
+            ttl_seconds: Time an answer is served as fresh
+            stale_ttl_seconds: Additional time an answer may be served as stale
+                while it is being regenerated in the background
+        """
+        self.max_size = max_size
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.stale_ttl_seconds = stale_ttl_seconds
+        
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()  # slot -> entry, LRU order
+        self._vectors: Optional[np.ndarray] = None  # (max_size, dim) unit vectors
+        self._valid: Optional[np.ndarray] = None  # slot occupancy mask
+        self._version = 0
+        
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def _normalize(self, embedding) -> Optional[np.ndarray]:
+        """Convert embedding to a float32 unit vector."""
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = float(np.linalg.norm(vector))
+        if norm == 0.0:
+            return None
+        return vector / norm
+    
+    def _reset(self, dim: Optional[int] = None) -> None:
+        """Drop all entries (and re-allocate for a new dimension if given)."""
+        self._entries.clear()
+        if dim is not None:
+            self._vectors = np.zeros((self.max_size, dim), dtype=np.float32)
+            self._valid = np.zeros(self.max_size, dtype=bool)
+        elif self._valid is not None:
+            self._valid[:] = False
+    
+    def _check_version(self, version: int) -> None:
+        """Invalidate everything if the corpus changed since entries were stored."""
+        if version != self._version:
+            self._reset()
+            self._version = version
+    
+    def _remove(self, slot: int) -> None:
+        """Remove entry in slot."""
+        del self._entries[slot]
+        self._valid[slot] = False
+    
+    def get(self, query_embedding, version: int) -> Optional[Dict[str, Any]]:
+        """
+        Find a cached answer for a semantically equivalent query.
+        
+        Args:
+            query_embedding: Query embedding vector
+            version: Current corpus version
+            
+        Returns:
+            Dict with "result", "similarity", "stale" and "key", or None on miss
+        """
+        query_vector = self._normalize(query_embedding)
+        
+        with self._lock:
+            self._check_version(version)
+            
+            if query_vector is None or not self._entries or query_vector.shape[0] != self._vectors.shape[1]:
+                self.misses += 1
+                return None
+            
+            similarities = self._vectors @ query_vector
+            similarities[~self._valid] = -np.inf
+            slot = int(np.argmax(similarities))
+            similarity = float(similarities[slot])
+            
+            if similarity < self.similarity_threshold:
+                self.misses += 1
+                return None
+            
+            entry = self._entries[slot]
+            age = time.time() - entry["timestamp"]
+            if age > self.ttl_seconds + self.stale_ttl_seconds:
+                self._remove(slot)
+                self.misses += 1
+                return None
+            
+            stale = age > self.ttl_seconds
+            if stale:
+                self.stale_hits += 1
+            else:
+                self.hits += 1
+            self._entries.move_to_end(slot)
+            
+            return {
+                "result": entry["result"],
+                "similarity": similarity,
+                "stale": stale,
+                "key": slot
+            }
+    
+    def set(self, query_embedding, result: Dict[str, Any], version: int) -> None:
+        """
+        Cache an answer.
+        
+        Args:
+            query_embedding: Query embedding vector
+            result: Answer payload to return on later hits
+            version: Corpus version the answer was generated under
+        """
+        query_vector = self._normalize(query_embedding)
+        if query_vector is None:
+            return
+        
+        with self._lock:
+            if version < self._version:
+                # Generated against an older corpus; never store it
+                return
+            self._check_version(version)
+            
+            if self._vectors is None or self._vectors.shape[1] != query_vector.shape[0]:
+                self._reset(dim=query_vector.shape[0])
+            
+            # Replace an existing near-identical entry instead of adding a duplicate
+            slot = None
+            if self._entries:
+                similarities = self._vectors @ query_vector
+                similarities[~self._valid] = -np.inf
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    slot = best
+            
+            if slot is None:
+                if len(self._entries) >= self.max_size:
+                    oldest_slot = next(iter(self._entries))
+                    self._remove(oldest_slot)
+                    self.evictions += 1
+                slot = int(np.argmin(self._valid))
+            
+            self._vectors[slot] = query_vector
+            self._valid[slot] = True
+            self._entries[slot] = {"result": result, "timestamp": time.time()}
+            self._entries.move_to_end(slot)
+    
+    def clear(self) -> None:
+        """Clear all cached entries."""
+        with self._lock:
+            self._reset()
+    
+    def size(self) -> int:
+        """Get current cache size."""
+        return len(self._entries)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters and size."""
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "size": self.size(),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+            "corpus_version": self._version
+        }
@@ -0,0 +1,40 @@
+"""Response compression that leaves event streams unbuffered."""
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, GZipResponder
+from starlette.types import Message, Receive, Scope, Send
+
+
+class _StreamAwareGZipResponder(GZipResponder):
+    """GZip responder that passes text/event-stream responses through untouched."""
+
+    async def send_with_gzip(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            content_type = Headers(raw=message["headers"]).get("content-type", "")
+            await super().send_with_gzip(message)
+            if content_type.startswith("text/event-stream"):
+                # gzip buffers until its block fills, which would hold back SSE
+                # tokens; reuse the pass-through path for pre-encoded bodies
+                self.content_encoding_set = True
+            return
+        await super().send_with_gzip(message)
+
+
+class StreamAwareGZipMiddleware(GZipMiddleware):
+    """
+    GZip compression for clients that send Accept-Encoding: gzip.
+
+    Identical to Starlette's GZipMiddleware except that Server-Sent-Events
+    responses are never compressed, so streamed tokens reach the client as
+    soon as they are produced.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            headers = Headers(scope=scope)
+            if "gzip" in headers.get("Accept-Encoding", ""):
+                responder = _StreamAwareGZipResponder(
+                    self.app, self.minimum_size, compresslevel=self.compresslevel
+                )
+                await responder(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
@@ -0,0 +1,598 @@
+"""Concurrency helpers: bounded stage executors, admission control, in-flight call coalescing, micro-batching and adaptive limits."""
+import asyncio
+import functools
+import math
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, Iterator, List, Optional
+import metrics
+import config
+
+
+# Worker threads per pipeline stage. Each stage gets its own pool so a burst of
+# slow work in one stage (e.g. PDF ingestion) cannot starve another (e.g. search).
+STAGE_WORKERS = {
+    "embedding": config.EMBEDDING_WORKERS,
+    "search": config.SEARCH_WORKERS,
+    "llm": config.LLM_WORKERS,
+    "transcription": config.TRANSCRIPTION_WORKERS,
+    "ingestion": config.INGESTION_WORKERS,
+    "database": config.DATABASE_WORKERS,
+}
+
+# Calls allowed to wait for a worker per stage. Once a stage has this many
+# calls waiting, new calls are rejected instead of piling up behind slow
+# (e.g. rate limited and retrying) OpenAI requests.
+STAGE_QUEUE_SIZES = {
+    "embedding": config.EMBEDDING_QUEUE_SIZE,
+    "search": config.SEARCH_QUEUE_SIZE,
+    "llm": config.LLM_QUEUE_SIZE,
+    "transcription": config.TRANSCRIPTION_QUEUE_SIZE,
+    "ingestion": config.INGESTION_QUEUE_SIZE,
+    "database": config.DATABASE_QUEUE_SIZE,
+}
+
+_executors: Dict[str, ThreadPoolExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+class StageOverloaded(Exception):
+    """Raised when a stage's workers are busy and its wait queue is full."""
+
+    def __init__(self, stage: str, retry_after: int):
+        """
+        Initialize error.
+
+        Args:
+            stage: Stage that rejected the call
+            retry_after: Suggested seconds before retrying
+        """
+        super().__init__(f"The server is busy ({stage} queue is full). Please retry in {retry_after} seconds.")
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+class Cancelled(Exception):
+    """Raised by a blocking call that stopped early because its caller went away."""
+
+    def __init__(self, stage: str):
+        """
+        Initialize error.
+
+        Args:
+            stage: Stage whose work was abandoned
+        """
+        super().__init__(f"{stage} was cancelled because the request was abandoned")
+        self.stage = stage
+
+
+class _StageLoad:
+    """Waiting and running call counts for one stage."""
+
+    def __init__(self):
+        """Initialize counters."""
+        self.lock = threading.Lock()
+        self.waiting = 0
+        self.running = 0
+        self.avg_seconds = 0.0  # Moving average of call duration, for Retry-After
+
+
+_load: Dict[str, _StageLoad] = {stage: _StageLoad() for stage in STAGE_WORKERS}
+
+QUEUE_WAIT = metrics.histogram(
+    "rag_stage_queue_wait_seconds",
+    "Time calls waited for a stage worker",
+    ("stage",)
+)
+REJECTED = metrics.counter(
+    "rag_stage_rejected_total",
+    "Calls rejected because the stage queue was full",
+    ("stage",)
+)
+CANCELLED = metrics.counter(
+    "rag_stage_cancelled_total",
+    "Calls abandoned (dropped from the queue or signalled to stop) because their caller was cancelled",
+    ("stage",)
+)
+metrics.gauge(
+    "rag_stage_queue_depth",
+    "Calls waiting for a stage worker",
+    ("stage",),
+    callback=lambda: {(stage,): load.waiting for stage, load in _load.items()}
+)
+metrics.gauge(
+    "rag_stage_running",
+    "Calls running in a stage worker",
+    ("stage",),
+    callback=lambda: {(stage,): load.running for stage, load in _load.items()}
+)
+
+
+def get_executor(stage: str) -> ThreadPoolExecutor:
+    """
+    Get or create the thread pool for a pipeline stage.
+
+    Args:
+        stage: Stage name (one of STAGE_WORKERS)
+
+    Returns:
+        Thread pool executor for the stage
+    """
+    if stage not in STAGE_WORKERS:
+        raise ValueError(f"Unknown stage: {stage}")
+
+    executor = _executors.get(stage)
+    if executor is None:
+        with _executors_lock:
+            executor = _executors.get(stage)
+            if executor is None:
+                executor = ThreadPoolExecutor(
+                    max_workers=STAGE_WORKERS[stage],
+                    thread_name_prefix=f"rag-{stage}"
+                )
+                _executors[stage] = executor
+    return executor
+
+
+def _admit(stage: str) -> _StageLoad:
+    """
+    Reserve a queue slot for a call, or reject it.
+
+    Args:
+        stage: Stage name
+
+    Returns:
+        The stage's load counters (waiting already incremented)
+
+    Raises:
+        StageOverloaded: If the stage's workers are busy and its queue is full
+    """
+    load = _load[stage]
+    with load.lock:
+        if load.waiting + load.running >= STAGE_WORKERS[stage] + STAGE_QUEUE_SIZES[stage]:
+            # Roughly how long until the calls ahead of this one have drained
+            drain_seconds = load.avg_seconds * (load.waiting + 1) / STAGE_WORKERS[stage]
+            REJECTED.inc(stage=stage)
+            raise StageOverloaded(stage, max(1, math.ceil(drain_seconds)))
+        load.waiting += 1
+    return load
+
+
+def _enter(stage: str) -> _StageLoad:
+    """Count an already-admitted call as waiting without admission control."""
+    load = _load[stage]
+    with load.lock:
+        load.waiting += 1
+    return load
+
+
+def _tracked(stage: str, load: _StageLoad, func: Callable[[], Any], timed: bool = True) -> Callable[[], Any]:
+    """
+    Wrap func so its call moves from waiting to running.
+    
+    When timed, its queue wait and duration are also recorded (continuation
+    steps of a stream are not, so they do not skew the Retry-After estimate).
+    """
+    queued_at = time.perf_counter()
+
+    def run() -> Any:
+        started = time.perf_counter()
+        if timed:
+            QUEUE_WAIT.observe(started - queued_at, stage=stage)
+        with load.lock:
+            load.waiting -= 1
+            load.running += 1
+        try:
+            return func()
+        finally:
+            elapsed = time.perf_counter() - started
+            with load.lock:
+                load.running -= 1
+                if timed:
+                    load.avg_seconds = elapsed if not load.avg_seconds else 0.9 * load.avg_seconds + 0.1 * elapsed
+
+    return run
+
+
+async def _submit(stage: str, func: Callable[[], Any], admit: bool = True) -> Any:
+    """Run func in the stage's pool, through admission control if admit is set."""
+    try:
+        return await _submit_uncounted(stage, func, admit)
+    except asyncio.CancelledError:
+        # Cancelling the wrapped future also drops the call if it is still queued
+        CANCELLED.inc(stage=stage)
+        raise
+
+
+async def _submit_uncounted(stage: str, func: Callable[[], Any], admit: bool) -> Any:
+    """_submit without cancellation accounting."""
+    executor = get_executor(stage)
+    # Calls that skip admission (the rest of an admitted stream) still occupy
+    # the stage's workers, so they count towards its load
+    load = _admit(stage) if admit else _enter(stage)
+    try:
+        future = executor.submit(_tracked(stage, load, func, timed=admit))
+    except BaseException:
+        with load.lock:
+            load.waiting -= 1
+        raise
+
+    def release_if_cancelled(done: Future) -> None:
+        # A call cancelled while still queued never runs, so free its slot here
+        if done.cancelled():
+            with load.lock:
+                load.waiting -= 1
+
+    future.add_done_callback(release_if_cancelled)
+    return await asyncio.wrap_future(future)
+
+
+async def run_blocking(stage: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Run a blocking callable in the stage's thread pool and await the result.
+
+    Args:
+        stage: Stage name used to select the thread pool
+        func: Blocking callable
+        *args: Positional arguments for func
+        **kwargs: Keyword arguments for func
+
+    Returns:
+        Whatever func returns (exceptions are re-raised in the caller)
+
+    Raises:
+        StageOverloaded: If the stage is at capacity and its queue is full
+    """
+    return await _submit(stage, functools.partial(func, *args, **kwargs))
+
+
+async def run_cancellable(stage: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    run_blocking for callables that can stop early.
+
+    func is passed a threading.Event as its cancelled keyword argument. The
+    event is set if the awaiting coroutine is cancelled (e.g. the client
+    disconnected) while func is running, so func can abandon its upstream
+    request instead of finishing work nobody will read.
+
+    Args:
+        stage: Stage name used to select the thread pool
+        func: Blocking callable accepting cancelled=threading.Event
+        *args: Positional arguments for func
+        **kwargs: Keyword arguments for func
+
+    Returns:
+        Whatever func returns
+    """
+    cancelled = threading.Event()
+    try:
+        return await run_blocking(stage, func, *args, cancelled=cancelled, **kwargs)
+    except asyncio.CancelledError:
+        cancelled.set()
+        raise
+
+
+async def iterate_blocking(stage: str, iterator: Iterator[Any]) -> AsyncIterator[Any]:
+    """
+    Consume a blocking iterator from the stage's thread pool.
+
+    Each next() call runs in the pool, so a generator that waits on the network
+    between items (e.g. a streamed completion) never blocks the event loop.
+
+    Args:
+        stage: Stage name used to select the thread pool
+        iterator: Blocking iterator or generator
+
+    Yields:
+        Items produced by the iterator
+
+    Raises:
+        StageOverloaded: If the stage is full when the first item is requested
+    """
+    sentinel = object()
+    iterator = iter(iterator)
+    admitted = False
+    try:
+        while True:
+            # Only the first item goes through admission control; a stream
+            # that has started is never rejected halfway
+            item = await _submit(stage, functools.partial(next, iterator, sentinel), admit=not admitted)
+            admitted = True
+            if item is sentinel:
+                break
+            yield item
+    finally:
+        # Let generators release their resources if the consumer stops early
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            try:
+                await _submit(stage, close, admit=False)
+            except ValueError:
+                # Generator is still executing in a worker (cancelled mid-next);
+                # it is closed when garbage collected instead
+                pass
+
+
+def shutdown_executors(wait: bool = True) -> None:
+    """Shut down all stage thread pools."""
+    with _executors_lock:
+        for executor in _executors.values():
+            executor.shutdown(wait=wait)
+        _executors.clear()
+
+
+class SingleFlight:
+    """
+    Deduplicate concurrent identical blocking calls.
+    
+    The first caller for a key runs the function; callers arriving while it is
+    in flight wait on the same future and receive the same result or exception.
+    """
+    
+    def __init__(self):
+        """Initialize in-flight call table."""
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self.coalesced = 0
+    
+    def do(self, key: Hashable, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run func once per key among concurrent callers.
+        
+        Args:
+            key: Identity of the call
+            func: Blocking callable
+            *args: Positional arguments for func
+            **kwargs: Keyword arguments for func
+            
+        Returns:
+            Result of the shared call
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+            else:
+                self.coalesced += 1
+        
+        if not leader:
+            return future.result()
+        
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+BATCH_SIZE = metrics.histogram(
+    "rag_microbatch_size",
+    "Items per micro-batched call",
+    ("batcher",),
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048)
+)
+BATCH_WAIT = metrics.histogram(
+    "rag_microbatch_wait_seconds",
+    "Time items waited for their micro-batch to be sent",
+    ("batcher",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+)
+
+
+class _Batch:
+    """Items collected for one batched call."""
+    
+    def __init__(self):
+        """Initialize empty batch."""
+        self.items: List[Any] = []
+        self.futures: List[Future] = []
+        self.queued_at: List[float] = []
+        self.full = threading.Event()
+
+
+class MicroBatcher:
+    """
+    Combine concurrent blocking calls into batched calls.
+    
+    The first caller to arrive opens a batch and waits up to max_wait_seconds
+    (or until max_batch_size items have joined), then runs the batch function
+    on every collected item in its own thread. Callers arriving while a batch
+    is running open the next one, so batches never wait on each other.
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[List[Any]], List[Any]],
+        max_batch_size: int,
+        max_wait_seconds: float
+    ):
+        """
+        Initialize batcher.
+        
+        Args:
+            name: Label for the batch size and wait metrics
+            func: Blocking callable mapping a list of items to a list of results in the same order
+            max_batch_size: Items per batch
+            max_wait_seconds: How long the first item waits for others to join
+        """
+        self.name = name
+        self.func = func
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_seconds = max(0.0, max_wait_seconds)
+        self._lock = threading.Lock()
+        self._open: Optional[_Batch] = None
+    
+    def submit(self, item: Any, timeout: Optional[float] = None) -> Any:
+        """
+        Add an item to the open batch and wait for its result.
+        
+        Args:
+            item: Input for func
+            timeout: Seconds to wait for the result once the batch is sent by
+                another caller (None waits indefinitely)
+            
+        Returns:
+            func's result for this item
+            
+        Raises:
+            TimeoutError: If timeout passes first
+        """
+        future = Future()
+        with self._lock:
+            batch = self._open
+            leader = batch is None
+            if leader:
+                batch = self._open = _Batch()
+            batch.items.append(item)
+            batch.futures.append(future)
+            batch.queued_at.append(time.perf_counter())
+            if len(batch.items) >= self.max_batch_size:
+                self._open = None
+                batch.full.set()
+        
+        if leader:
+            batch.full.wait(self.max_wait_seconds)
+            with self._lock:
+                if self._open is batch:
+                    self._open = None
+            self._run(batch)
+        return future.result(timeout)
+    
+    def _run(self, batch: _Batch) -> None:
+        """Call func on a closed batch and resolve its futures."""
+        sent_at = time.perf_counter()
+        BATCH_SIZE.observe(len(batch.items), batcher=self.name)
+        for queued_at in batch.queued_at:
+            BATCH_WAIT.observe(sent_at - queued_at, batcher=self.name)
+        
+        try:
+            results = self.func(batch.items)
+            if len(results) != len(batch.items):
+                raise ValueError(f"{self.name} batch returned {len(results)} results for {len(batch.items)} items")
+        except BaseException as e:
+            for future in batch.futures:
+                future.set_exception(e)
+            return
+        for future, result in zip(batch.futures, results):
+            future.set_result(result)
+
+
+CONCURRENCY_LIMIT = metrics.gauge(
+    "rag_adaptive_concurrency_limit",
+    "Current limit of an adaptive concurrency limiter",
+    ("limiter",)
+)
+CONCURRENCY_BACKOFFS = metrics.counter(
+    "rag_adaptive_concurrency_backoffs_total",
+    "Times an adaptive concurrency limiter halved its limit",
+    ("limiter",)
+)
+
+
+class AdaptiveConcurrencyLimit:
+    """
+    Concurrency limit that adapts to upstream overload (AIMD).
+    
+    Each successful call raises the limit by 1/limit, so it grows by about
+    one per round of calls. Each overloaded call (e.g. HTTP 429) halves it.
+    The limit stays between 1 and max_limit. Callers beyond the current limit
+    block until a slot frees up.
+    """
+    
+    def __init__(self, name: str, max_limit: int, initial_limit: Optional[int] = None):
+        """
+        Initialize limiter.
+        
+        Args:
+            name: Label for the limit and backoff metrics
+            max_limit: Upper bound on concurrent calls
+            initial_limit: Starting limit (defaults to max_limit)
+        """
+        self.name = name
+        self.max_limit = max(1, max_limit)
+        self.limit = float(min(self.max_limit, initial_limit or self.max_limit))
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        CONCURRENCY_LIMIT.set(self.limit, limiter=name)
+    
+    def acquire(self) -> None:
+        """Block until a slot is free under the current limit."""
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+    
+    def release(self, overloaded: bool = False) -> None:
+        """
+        Free a slot and adapt the limit.
+        
+        Args:
+            overloaded: Whether the call was rejected as overload (halves the limit)
+        """
+        with self._cond:
+            self.in_flight -= 1
+            if overloaded:
+                self.limit = max(1.0, self.limit / 2)
+                CONCURRENCY_BACKOFFS.inc(limiter=self.name)
+            else:
+                self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            CONCURRENCY_LIMIT.set(self.limit, limiter=self.name)
+            self._cond.notify_all()
+
+
+class AsyncSingleFlight:
+    """
+    Deduplicate concurrent identical coroutine calls on the event loop.
+    
+    The shared work runs as its own task, so a caller that is cancelled does not
+    cancel the work other callers are waiting on. The work is cancelled once
+    every caller waiting on it has been cancelled.
+    """
+    
+    def __init__(self):
+        """Initialize in-flight task table."""
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self._waiters: Dict[asyncio.Task, int] = {}
+        self.coalesced = 0
+    
+    async def do(self, key: Hashable, coro_factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Await coro_factory() once per key among concurrent callers.
+        
+        Args:
+            key: Identity of the call
+            coro_factory: Zero-argument callable returning the coroutine to run
+            
+        Returns:
+            Result of the shared call
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(coro_factory())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.coalesced += 1
+        
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._waiters[task] == 1:
+                # Nobody is left to read the result
+                task.cancel()
+            raise
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
@@ -10,8 +10,44 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY") or os.getenv("OPENAI_KEY") or os.ge
 # Note: API key validation happens when services are initialized, not here
 
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+# Where embeddings are computed: "openai" (EMBEDDING_MODEL via the API), or on local CPU with
+# "hashing" (feature hashing, no weights) or "sentence-transformers" (weights at LOCAL_EMBEDDING_MODEL_PATH)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")
+LOCAL_EMBEDDING_MODEL_PATH = os.getenv("LOCAL_EMBEDDING_MODEL_PATH", "models/all-MiniLM-L6-v2")
+LOCAL_EMBEDDING_BATCH_SIZE = int(os.getenv("LOCAL_EMBEDDING_BATCH_SIZE", "256"))  # Texts vectorized per call
+# Output size for models that support shortened embeddings (e.g. 512 for text-embedding-3-small);
+# unset keeps the model's native size. Changing it requires migrate_embeddings.py
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS")) if os.getenv("EMBEDDING_DIMENSIONS") else None
+# Wire format for embedding vectors: "base64" (packed float32) or "float" (JSON numbers)
+EMBEDDING_ENCODING_FORMAT = os.getenv("EMBEDDING_ENCODING_FORMAT", "base64")
 LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4")
 
+# Embedding Request Limits
+# Document chunks are packed into embeddings requests that stay within these limits
+EMBEDDING_REQUEST_MAX_INPUTS = int(os.getenv("EMBEDDING_REQUEST_MAX_INPUTS", "2048"))
+EMBEDDING_REQUEST_MAX_TOKENS = int(os.getenv("EMBEDDING_REQUEST_MAX_TOKENS", "300000"))
+EMBEDDING_INPUT_MAX_TOKENS = int(os.getenv("EMBEDDING_INPUT_MAX_TOKENS", "8191"))  # Longer inputs are truncated
+# Requests of one batch sent in parallel; halved on each 429 and grown back on success
+EMBEDDING_REQUEST_CONCURRENCY = int(os.getenv("EMBEDDING_REQUEST_CONCURRENCY", "8"))
+
+# Query Embedding Micro-Batching
+# Concurrent query embeddings are sent as one request of up to this many inputs...
+EMBEDDING_BATCH_MAX_SIZE = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "64"))
+# ...after the first one has waited at most this long for others (0 disables batching)
+EMBEDDING_BATCH_MAX_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_MAX_WAIT_MS", "5"))
+
+# OpenAI Rate Governor
+# Share of each model's request/token budget bulk calls (ingestion) leave for interactive ones (queries)
+RATE_GOVERNOR_INTERACTIVE_RESERVE = float(os.getenv("RATE_GOVERNOR_INTERACTIVE_RESERVE", "0.2"))
+# Longest an interactive call without a deadline waits for budget before failing
+RATE_GOVERNOR_MAX_WAIT_SECONDS = float(os.getenv("RATE_GOVERNOR_MAX_WAIT_SECONDS", "30"))
+RATE_GOVERNOR_RETRY_AFTER_SECONDS = float(os.getenv("RATE_GOVERNOR_RETRY_AFTER_SECONDS", "1"))  # Pause after a 429 without retry-after
+
+# Timeouts
+OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "60"))  # Per OpenAI request when no deadline applies
+REQUEST_DEADLINE_MS = int(os.getenv("REQUEST_DEADLINE_MS", "30000"))  # Default /query budget; X-Request-Deadline-Ms overrides
+REQUEST_DEADLINE_MAX_MS = int(os.getenv("REQUEST_DEADLINE_MAX_MS", "120000"))
+
 # Chunking Configuration
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "500"))
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "100"))
@@ -19,11 +55,66 @@ CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "100"))
 # Retrieval Configuration
 TOP_K = int(os.getenv("TOP_K", "5"))
 SIMILARITY_THRESHOLD = 0.5  # Minimum similarity score for retrieval
+SEARCH_MAX_TOP_K = int(os.getenv("SEARCH_MAX_TOP_K", "100"))  # Largest /search page
+SEARCH_MAX_DEPTH = int(os.getenv("SEARCH_MAX_DEPTH", "1000"))  # /search pagination stops after this many results
+
+# Embedding Cache Configuration
+EMBEDDING_CACHE_MAX_SIZE = int(os.getenv("EMBEDDING_CACHE_MAX_SIZE", "10000"))
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))  # Approximate memory budget
+EMBEDDING_CACHE_TTL_SECONDS = int(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", "3600"))
+
+# Chunk Embedding Cache Configuration
+# Persistent cache of document chunk embeddings, keyed by model and exact chunk text
+CHUNK_EMBEDDING_CACHE_ENABLED = os.getenv("CHUNK_EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+CHUNK_EMBEDDING_CACHE_PATH = os.getenv("CHUNK_EMBEDDING_CACHE_PATH", "embedding_cache.db")
+CHUNK_EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("CHUNK_EMBEDDING_CACHE_MAX_ENTRIES", "500000"))
+CHUNK_EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("CHUNK_EMBEDDING_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))  # Stored vector bytes
+
+# Answer Cache Configuration
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_MAX_SIZE = int(os.getenv("ANSWER_CACHE_MAX_SIZE", "1000"))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))  # Minimum cosine similarity to reuse an answer
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+ANSWER_CACHE_STALE_SECONDS = int(os.getenv("ANSWER_CACHE_STALE_SECONDS", "600"))  # Serve stale while regenerating
+CORPUS_VERSION_REFRESH_SECONDS = float(os.getenv("CORPUS_VERSION_REFRESH_SECONDS", "1.0"))  # How soon other processes' ingests invalidate answers
+
+# Batch Query Configuration
+BATCH_QUERY_MAX_SIZE = int(os.getenv("BATCH_QUERY_MAX_SIZE", "500"))
+BATCH_QUERY_CONCURRENCY = int(os.getenv("BATCH_QUERY_CONCURRENCY", "8"))  # Concurrent answer generations per batch
+
+# Response Configuration
+GZIP_MINIMUM_SIZE = int(os.getenv("GZIP_MINIMUM_SIZE", "1000"))  # Bytes; smaller responses are sent uncompressed
+GZIP_COMPRESS_LEVEL = int(os.getenv("GZIP_COMPRESS_LEVEL", "5"))  # 1-9, higher trades CPU for bytes
+
+# Voice Session Configuration (WebSocket /ws/voice, 16-bit mono PCM)
+VOICE_SAMPLE_RATE = int(os.getenv("VOICE_SAMPLE_RATE", "16000"))
+VOICE_ENERGY_THRESHOLD = float(os.getenv("VOICE_ENERGY_THRESHOLD", "0.01"))  # RMS level that counts as speech
+VOICE_END_SILENCE_MS = int(os.getenv("VOICE_END_SILENCE_MS", "700"))  # Trailing silence that ends an utterance
+VOICE_SEGMENT_MS = int(os.getenv("VOICE_SEGMENT_MS", "2000"))  # Audio per partial transcription while speaking
+VOICE_MAX_UTTERANCE_MS = int(os.getenv("VOICE_MAX_UTTERANCE_MS", "30000"))
 
 # Database Configuration
 DATABASE_PATH = os.getenv("DATABASE_PATH", "metadata.db")
 VECTOR_DB_PATH = os.getenv("VECTOR_DB_PATH", "chroma_db")
 
+# Concurrency Configuration
+# Worker threads per pipeline stage for blocking OpenAI, Chroma, PyMuPDF and SQLite work
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "32"))  # Also bounds query embedding batch size
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", "4"))
+LLM_WORKERS = int(os.getenv("LLM_WORKERS", "16"))
+TRANSCRIPTION_WORKERS = int(os.getenv("TRANSCRIPTION_WORKERS", "4"))
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))
+DATABASE_WORKERS = int(os.getenv("DATABASE_WORKERS", "4"))
+
+# Admission Control
+# Calls allowed to wait for a busy stage; beyond this the API answers 503 with Retry-After
+EMBEDDING_QUEUE_SIZE = int(os.getenv("EMBEDDING_QUEUE_SIZE", "64"))
+SEARCH_QUEUE_SIZE = int(os.getenv("SEARCH_QUEUE_SIZE", "64"))
+LLM_QUEUE_SIZE = int(os.getenv("LLM_QUEUE_SIZE", "32"))
+TRANSCRIPTION_QUEUE_SIZE = int(os.getenv("TRANSCRIPTION_QUEUE_SIZE", "16"))
+INGESTION_QUEUE_SIZE = int(os.getenv("INGESTION_QUEUE_SIZE", "8"))
+DATABASE_QUEUE_SIZE = int(os.getenv("DATABASE_QUEUE_SIZE", "256"))
+
 # Server Configuration
 # Railway and other platforms set PORT environment variable
 HOST = os.getenv("HOST", "0.0.0.0")
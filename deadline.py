@@ -0,0 +1,107 @@
+"""Per-request deadlines shared by every pipeline stage."""
+from typing import Any, Optional
+import time
+from tenacity import RetryCallState
+from tenacity.stop import stop_base
+from tenacity.wait import wait_base
+
+
+# Below this much remaining time another upstream attempt is not worth starting
+MIN_ATTEMPT_SECONDS = 0.25
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a stage cannot finish within the request's deadline."""
+
+    def __init__(self, stage: str):
+        """
+        Initialize error.
+
+        Args:
+            stage: Stage that ran out of time
+        """
+        super().__init__(f"Request deadline exceeded during {stage}")
+        self.stage = stage
+
+
+class Deadline:
+    """Absolute point in time by which a request must be answered."""
+
+    def __init__(self, budget_seconds: float):
+        """
+        Start the clock.
+
+        Args:
+            budget_seconds: Time allowed from now
+        """
+        self.budget_seconds = budget_seconds
+        self.expires_at = time.monotonic() + budget_seconds
+
+    def remaining(self) -> float:
+        """Seconds left (never negative)."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        """Whether the deadline has passed."""
+        return self.remaining() <= 0
+
+    def check(self, stage: str) -> None:
+        """
+        Raise if there is no time left to start a stage.
+
+        Args:
+            stage: Stage about to start
+
+        Raises:
+            DeadlineExceeded: If less than MIN_ATTEMPT_SECONDS remain
+        """
+        if self.remaining() < MIN_ATTEMPT_SECONDS:
+            raise DeadlineExceeded(stage)
+
+
+def with_deadline(client: Any, deadline: Optional[Deadline]) -> Any:
+    """
+    OpenAI client whose requests time out when the deadline does.
+
+    The client's own retries are disabled for deadline-bound calls so a retried
+    request cannot overrun the budget; callers retry within the deadline instead.
+
+    Args:
+        client: OpenAI client
+        deadline: Request deadline, or None for the client's defaults
+
+    Returns:
+        The client itself, or a copy with timeout set to the remaining time
+    """
+    if deadline is None:
+        return client
+    return client.with_options(timeout=deadline.remaining(), max_retries=0)
+
+
+class stop_at_deadline(stop_base):
+    """tenacity stop condition: no time left for another attempt.
+
+    Reads the deadline from the retried function's ``deadline`` keyword argument.
+    """
+
+    def __call__(self, retry_state: RetryCallState) -> bool:
+        deadline = retry_state.kwargs.get("deadline")
+        return deadline is not None and deadline.remaining() < MIN_ATTEMPT_SECONDS
+
+
+class wait_within_deadline(wait_base):
+    """tenacity wait that never sleeps past the point where an attempt could still fit."""
+
+    def __init__(self, wait: wait_base):
+        """
+        Args:
+            wait: Wait strategy to cap (e.g. wait_exponential)
+        """
+        self.wait = wait
+
+    def __call__(self, retry_state: RetryCallState) -> float:
+        seconds = self.wait(retry_state)
+        deadline = retry_state.kwargs.get("deadline")
+        if deadline is not None:
+            seconds = min(seconds, max(0.0, deadline.remaining() - MIN_ATTEMPT_SECONDS))
+        return seconds
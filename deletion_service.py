@@ -2,6 +2,7 @@
 from typing import Dict, Any
 from database import get_db_session, Document, Chunk
 from vector_store import VectorStore
+from cache import corpus_version
 
 
 class DeletionService:
@@ -67,6 +68,9 @@ class DeletionService:
             db_session.delete(document)
             db_session.commit()
             
+            # Invalidate cached answers that may cite the deleted document
+            corpus_version.bump()
+            
             return {
                 "success": True,
                 "document_id": document_id,
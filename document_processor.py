@@ -1,18 +1,56 @@
 """Document processing and chunking."""
 import fitz  # PyMuPDF
 import hashlib
+import re
 import tiktoken
 from typing import List, Dict, Any, Optional
 import config
 from pathlib import Path
 
 
+class WordTokenizer:
+    """
+    Splits text into words with their trailing whitespace.
+    
+    Stands in for tiktoken when a local embedding backend is selected, so
+    ingestion needs no download of the cl100k_base encoding. Decoding joins
+    the pieces back, so chunks keep the text exactly as it was.
+    """
+    
+    _WORD = re.compile(r"\s*\S+\s*|\s+")
+    
+    def encode(self, text: str) -> List[str]:
+        """Split text into word tokens."""
+        return self._WORD.findall(text)
+    
+    def decode(self, tokens: List[str]) -> str:
+        """Join word tokens back into text."""
+        return "".join(tokens)
+
+
+def create_tokenizer(backend: Optional[str] = None):
+    """
+    Tokenizer that chunk sizes are counted in.
+    
+    The OpenAI backend counts cl100k_base tokens, which tiktoken downloads on
+    first use unless TIKTOKEN_CACHE_DIR points at a pre-seeded cache. Local
+    backends count words and never touch the network.
+    
+    Args:
+        backend: Embedding backend name (defaults to config.EMBEDDING_BACKEND)
+    """
+    backend = backend or config.EMBEDDING_BACKEND
+    if backend == "openai":
+        return tiktoken.get_encoding("cl100k_base")
+    return WordTokenizer()
+
+
 class DocumentProcessor:
     """Processes documents and creates chunks."""
     
     def __init__(self):
         """Initialize tokenizer."""
-        self.tokenizer = tiktoken.get_encoding("cl100k_base")
+        self.tokenizer = create_tokenizer()
     
     def process_pdf(self, file_path: str) -> Dict[str, Any]:
         """
@@ -0,0 +1,187 @@
+"""Local CPU embedding backends used in place of the OpenAI API."""
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import List, Optional
+import functools
+import hashlib
+import re
+import numpy as np
+import config
+
+
+OPENAI_BACKEND = "openai"
+
+
+class LocalEmbeddingBackend(ABC):
+    """
+    Interface for embedding texts in-process.
+    
+    Attributes:
+        name: Backend name as selected by EMBEDDING_BACKEND
+        model: Identifier of the model/parameters; part of persistent cache keys
+        dimensions: Size of the vectors returned
+    """
+    
+    name = ""
+    model = ""
+    dimensions = 0
+    
+    @abstractmethod
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed texts.
+        
+        Args:
+            texts: Texts to embed
+        
+        Returns:
+            2-D float32 array of unit vectors, one row per text
+        """
+
+
+_TOKEN = re.compile(r"\w+")
+
+
+@functools.lru_cache(maxsize=1 << 18)
+def _feature_hash(feature: str) -> int:
+    """Stable 64-bit hash of a feature (Python's hash() is salted per process)."""
+    return int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+
+
+class HashingEmbeddingBackend(LocalEmbeddingBackend):
+    """
+    Feature-hashing embedder: needs no weights and no network.
+    
+    Lower-cased word unigrams and bigrams are hashed into a fixed number of
+    signed buckets, counts are dampened with log1p and rows are L2-normalized,
+    so cosine similarity reflects shared vocabulary. Retrieval quality is
+    lexical rather than semantic, but ingestion runs at CPU speed.
+    """
+    
+    name = "hashing"
+    DEFAULT_DIMENSIONS = 768
+    
+    def __init__(self, dimensions: Optional[int] = None):
+        """
+        Initialize embedder.
+        
+        Args:
+            dimensions: Number of hash buckets (defaults to DEFAULT_DIMENSIONS)
+        """
+        self.dimensions = dimensions or self.DEFAULT_DIMENSIONS
+        self.model = f"hashing-v1-{self.dimensions}"
+    
+    @staticmethod
+    def _features(text: str) -> List[str]:
+        """Word unigrams and bigrams of lower-cased text."""
+        words = _TOKEN.findall(text.lower())
+        return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+    
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed texts (see LocalEmbeddingBackend.embed)."""
+        rows, hashes = [], []
+        for row, text in enumerate(texts):
+            features = self._features(text)
+            rows.extend([row] * len(features))
+            hashes.extend(_feature_hash(feature) for feature in features)
+        
+        hashes = np.array(hashes, dtype=np.uint64)
+        columns = (hashes % np.uint64(self.dimensions)).astype(np.intp)
+        # The top bit picks the sign so colliding features tend to cancel out
+        signs = np.where(hashes >> np.uint64(63), 1.0, -1.0).astype(np.float32)
+        
+        counts = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        np.add.at(counts, (np.array(rows, dtype=np.intp), columns), signs)
+        vectors = np.sign(counts) * np.log1p(np.abs(counts))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+class SentenceTransformerBackend(LocalEmbeddingBackend):
+    """Small transformer model run on CPU from weights on local disk."""
+    
+    name = "sentence-transformers"
+    
+    def __init__(self, model_path: str, dimensions: Optional[int] = None):
+        """
+        Load model weights.
+        
+        Args:
+            model_path: Directory with sentence-transformers weights
+            dimensions: Must be None or the model's own size (the output cannot be resized)
+        
+        Raises:
+            ValueError: If sentence-transformers is not installed, the weights
+                are missing, or a different size is requested
+        """
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ValueError(
+                "EMBEDDING_BACKEND=sentence-transformers requires the sentence-transformers package"
+            ) from e
+        if not Path(model_path).exists():
+            raise ValueError(f"No sentence-transformers weights at LOCAL_EMBEDDING_MODEL_PATH={model_path}")
+        
+        self._model = SentenceTransformer(model_path, device="cpu")
+        self.dimensions = self._model.get_sentence_embedding_dimension()
+        if dimensions is not None and dimensions != self.dimensions:
+            raise ValueError(f"{model_path} produces {self.dimensions}-dimension embeddings, not {dimensions}")
+        self.model = f"sentence-transformers:{Path(model_path).name}"
+    
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed texts (see LocalEmbeddingBackend.embed)."""
+        vectors = self._model.encode(
+            texts,
+            batch_size=config.LOCAL_EMBEDDING_BATCH_SIZE,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        )
+        return np.asarray(vectors, dtype=np.float32)
+
+
+def output_dimensions(name: str, dimensions: Optional[int] = None) -> Optional[int]:
+    """
+    Size of the vectors a backend produces, when known without loading it.
+    
+    Args:
+        name: Backend name
+        dimensions: Requested embedding size (EMBEDDING_DIMENSIONS)
+    
+    Returns:
+        dimensions if set, otherwise the fixed default of the hashing backend,
+        or None (the OpenAI model's native size, or a sentence-transformers
+        model whose size is only known once it is loaded)
+    """
+    if dimensions is not None:
+        return dimensions
+    if name == HashingEmbeddingBackend.name:
+        return HashingEmbeddingBackend.DEFAULT_DIMENSIONS
+    return None
+
+
+def create_backend(name: str, dimensions: Optional[int] = None) -> Optional[LocalEmbeddingBackend]:
+    """
+    Build the embedding backend selected by name.
+    
+    Args:
+        name: "openai", "hashing" or "sentence-transformers"
+        dimensions: Requested embedding size (None for the backend's default)
+    
+    Returns:
+        Local backend, or None for the OpenAI API (handled by EmbeddingService)
+    
+    Raises:
+        ValueError: If the backend is unknown or cannot be loaded
+    """
+    if name == OPENAI_BACKEND:
+        return None
+    if name == HashingEmbeddingBackend.name:
+        return HashingEmbeddingBackend(dimensions)
+    if name == SentenceTransformerBackend.name:
+        return SentenceTransformerBackend(config.LOCAL_EMBEDDING_MODEL_PATH, dimensions)
+    raise ValueError(
+        f"Unknown EMBEDDING_BACKEND {name!r}; expected "
+        f"{OPENAI_BACKEND!r}, {HashingEmbeddingBackend.name!r} or {SentenceTransformerBackend.name!r}"
+    )
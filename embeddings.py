@@ -1,66 +1,250 @@
 """Embedding generation using OpenAI."""
+import base64
+import functools
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from openai import OpenAI
+import numpy as np
 import config
-from typing import List, Optional
-from cache import EmbeddingCache
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type, RetryError
-from openai import APIConnectionError, APITimeoutError, APIError
+from typing import Iterator, List, Optional, Tuple
+import tiktoken
+from cache import EmbeddingCache, ChunkEmbeddingCache
+from embedding_backends import create_backend
+from concurrency import SingleFlight, MicroBatcher, AdaptiveConcurrencyLimit
+from timing import StageTimer
+from metrics import OPENAI_CALLS, OPENAI_ERRORS, EMBEDDING_INPUTS_DEDUPLICATED, record_retry
+from deadline import Deadline, DeadlineExceeded, MIN_ATTEMPT_SECONDS, with_deadline, stop_at_deadline, wait_within_deadline
+from rate_governor import governor, INTERACTIVE, BULK, RateBudgetExhausted, estimate_tokens, wait_unless_rate_limited
+from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+from openai import APIConnectionError, APITimeoutError, APIError, RateLimitError, InternalServerError
+
+
+@functools.lru_cache(maxsize=None)
+def _tokenizer() -> tiktoken.Encoding:
+    """The cl100k_base encoder DocumentProcessor chunks with (loaded on first use)."""
+    return tiktoken.get_encoding("cl100k_base")
+
+
+def _as_vector(embedding) -> np.ndarray:
+    """
+    Convert one embedding from a response into a float32 vector.
+    
+    Base64 embeddings are packed little-endian float32 and are viewed in place
+    without parsing; JSON float lists (the "float" format, or endpoints that
+    ignore encoding_format) are converted as a fallback.
+    """
+    if isinstance(embedding, str):
+        return np.frombuffer(base64.b64decode(embedding), dtype="<f4")
+    return np.asarray(embedding, dtype=np.float32)
+
+
+def _as_vectors(data) -> List[np.ndarray]:
+    """Convert every embedding of a response into a float32 vector."""
+    return [_as_vector(item.embedding) for item in data]
+
+
+def _as_matrix(data) -> np.ndarray:
+    """Stack the vectors of an embeddings response into one contiguous float32 array."""
+    vectors = _as_vectors(data)
+    if not vectors:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.stack(vectors).astype(np.float32, copy=False)
 
 
 class EmbeddingService:
     """Handles embedding generation."""
     
-    def __init__(self, use_cache: bool = True):
+    def __init__(self, use_cache: bool = True, dimensions: Optional[int] = None):
         """
-        Initialize OpenAI client.
+        Initialize the embedding backend selected by EMBEDDING_BACKEND.
         
         Args:
-            use_cache: Whether to use embedding cache
+            use_cache: Whether to use the query and chunk embedding caches
+            dimensions: Embedding size to request (defaults to EMBEDDING_DIMENSIONS;
+                None there means the model's native size)
         """
-        if not config.OPENAI_API_KEY:
-            raise ValueError("OPENAI_API_KEY environment variable is required. Please set it in Railway Variables (Settings → Variables) or in your .env file for local development.")
-        self.client = OpenAI(api_key=config.OPENAI_API_KEY)
-        self.model = config.EMBEDDING_MODEL
-        self.cache = EmbeddingCache() if use_cache else None
+        self.backend_name = config.EMBEDDING_BACKEND
+        self.dimensions = dimensions if dimensions is not None else config.EMBEDDING_DIMENSIONS
+        # Local backends embed in-process; None means the OpenAI API
+        self.backend = create_backend(self.backend_name, self.dimensions)
+        if self.backend is None:
+            if not config.OPENAI_API_KEY:
+                raise ValueError("OPENAI_API_KEY environment variable is required. Please set it in Railway Variables (Settings → Variables) or in your .env file for local development.")
+            # No SDK retries: every resend goes through governor.acquire()
+            self.client = OpenAI(
+                api_key=config.OPENAI_API_KEY,
+                timeout=config.OPENAI_TIMEOUT_SECONDS,
+                max_retries=0,
+                http_client=governor.http_client()
+            )
+            self.model = config.EMBEDDING_MODEL
+        else:
+            self.client = None
+            self.model = self.backend.model
+        self._extra_body = {"dimensions": self.dimensions} if self.dimensions is not None else None
+        self.cache = EmbeddingCache(
+            max_size=config.EMBEDDING_CACHE_MAX_SIZE,
+            ttl_seconds=config.EMBEDDING_CACHE_TTL_SECONDS,
+            max_bytes=config.EMBEDDING_CACHE_MAX_BYTES
+        ) if use_cache else None
+        self.chunk_cache = ChunkEmbeddingCache(
+            config.CHUNK_EMBEDDING_CACHE_PATH,
+            self.model,
+            dimensions=self.dimensions,
+            max_entries=config.CHUNK_EMBEDDING_CACHE_MAX_ENTRIES,
+            max_bytes=config.CHUNK_EMBEDDING_CACHE_MAX_BYTES
+        ) if use_cache and config.CHUNK_EMBEDDING_CACHE_ENABLED else None
+        self._inflight = SingleFlight()
+        # Query embeddings from concurrent requests share one API request
+        self._batcher = MicroBatcher(
+            "embedding",
+            self._embed_query_batch,
+            max_batch_size=config.EMBEDDING_BATCH_MAX_SIZE,
+            max_wait_seconds=config.EMBEDDING_BATCH_MAX_WAIT_MS / 1000
+        )
+        # Requests of a split batch run in parallel, backing off when rate limited
+        self._request_limit = AdaptiveConcurrencyLimit("embedding_requests", config.EMBEDDING_REQUEST_CONCURRENCY)
+        self._request_pool = ThreadPoolExecutor(
+            max_workers=max(1, config.EMBEDDING_REQUEST_CONCURRENCY),
+            thread_name_prefix="embedding-request"
+        )
     
     @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=10),
-        retry=retry_if_exception_type((APIConnectionError, APITimeoutError, ConnectionError)),
+        # Retries (and the waits between them) stop short of the request deadline
+        stop=stop_after_attempt(3) | stop_at_deadline(),
+        wait=wait_within_deadline(wait_unless_rate_limited(wait_exponential(multiplier=1, min=2, max=10))),
+        retry=retry_if_exception_type((APIConnectionError, APITimeoutError, ConnectionError, RateLimitError, InternalServerError)),
+        before_sleep=record_retry("embedding"),
         reraise=True
     )
-    def _generate_embedding_with_retry(self, text: str) -> List[float]:
-        """Internal method with retry logic for generating embeddings."""
+    def _generate_query_embeddings_with_retry(
+        self,
+        texts: List[str],
+        deadline: Optional[Deadline] = None
+    ) -> List[np.ndarray]:
+        """Internal method with retry logic for generating query embeddings."""
+        if deadline is not None:
+            deadline.check("embedding")
         try:
-            response = self.client.embeddings.create(
+            # Queries go ahead of ingestion for the shared rate limit budget
+            governor.acquire(
+                self.model,
+                sum(estimate_tokens(text) for text in texts),
+                INTERACTIVE,
+                timeout=deadline.remaining() if deadline is not None else config.RATE_GOVERNOR_MAX_WAIT_SECONDS
+            )
+        except RateBudgetExhausted as e:
+            if deadline is not None:
+                raise DeadlineExceeded("embedding") from e
+            raise
+        OPENAI_CALLS.inc(service="embedding")
+        try:
+            response = with_deadline(self.client, deadline).embeddings.create(
                 model=self.model,
-                input=text
+                input=texts,
+                encoding_format=config.EMBEDDING_ENCODING_FORMAT,
+                # openai 1.3.7 has no dimensions argument; send it in the body
+                extra_body=self._extra_body
             )
-            return response.data[0].embedding
+            return _as_vectors(response.data)
         except (APIConnectionError, APITimeoutError) as e:
+            OPENAI_ERRORS.inc(service="embedding")
+            if deadline is not None and deadline.expired():
+                raise DeadlineExceeded("embedding") from e
             # Convert to ConnectionError for consistent handling
             raise ConnectionError(f"OpenAI API connection error: {str(e)}") from e
+        except Exception:
+            OPENAI_ERRORS.inc(service="embedding")
+            raise
+    
+    def _embed_query_batch(self, items: List[Tuple[str, Optional[Deadline]]]) -> List[np.ndarray]:
+        """
+        Embed the texts collected by the micro-batcher in one request.
+        
+        Args:
+            items: (text, deadline) per waiting caller
+            
+        Returns:
+            One embedding per item
+        """
+        texts = [text for text, _ in items]
+        if self.backend is not None:
+            return list(self.backend.embed(texts))
+        deadlines = [deadline for _, deadline in items]
+        # The request serves the most patient caller; the others stop waiting
+        # for it when their own deadline passes
+        if any(deadline is None for deadline in deadlines):
+            deadline = None
+        else:
+            deadline = max(deadlines, key=lambda d: d.expires_at)
+        return self._generate_query_embeddings_with_retry(texts, deadline=deadline)
+    
+    def _embed_query(self, text: str, deadline: Optional[Deadline] = None) -> np.ndarray:
+        """Embed one text through the micro-batcher."""
+        try:
+            return self._batcher.submit(
+                (text, deadline),
+                timeout=deadline.remaining() if deadline is not None else None
+            )
+        except FutureTimeoutError as e:
+            raise DeadlineExceeded("embedding") from e
     
-    def generate_embedding(self, text: str) -> List[float]:
+    def _embed_coalesced(self, text: str, deadline: Optional[Deadline] = None) -> np.ndarray:
+        """
+        Embed one text, sharing the call with concurrent callers for the same text.
+        
+        The shared call runs under the deadline of the caller that started it.
+        If that deadline passes, callers that still have time embed the text
+        themselves instead of failing with it.
+        """
+        try:
+            return self._inflight.do(text, self._embed_query, text, deadline=deadline)
+        except DeadlineExceeded:
+            if deadline is not None and deadline.expired():
+                raise
+            return self._embed_query(text, deadline=deadline)
+    
+    def generate_embedding(
+        self,
+        text: str,
+        timer: Optional[StageTimer] = None,
+        deadline: Optional[Deadline] = None
+    ) -> np.ndarray:
         """
         Generate embedding for a single text.
         
         Args:
             text: Text to embed
+            timer: Optional request timer; records whether the cache was hit
+            deadline: Optional request deadline; bounds the request and its retries
+            
+        Raises:
+            DeadlineExceeded: If the deadline passes before an embedding is returned
             
         Returns:
-            Embedding vector
+            Embedding vector (1-D float32 array)
         """
         # Check cache first
         if self.cache:
             cached = self.cache.get(text)
             if cached is not None:
+                if timer is not None:
+                    timer.annotate("embedding_cached", True)
                 return cached
         
-        # Generate new embedding with retry logic and error handling
+        if timer is not None:
+            timer.annotate("embedding_cached", False)
+        
+        # Generate new embedding with retry logic and error handling.
+        # Concurrent callers for the same text share one batch item, and
+        # concurrent callers for different texts share one upstream request.
         try:
-            embedding = self._generate_embedding_with_retry(text)
+            embedding = self._embed_coalesced(text, deadline)
+        except DeadlineExceeded:
+            raise
         except ConnectionError as e:
+            if deadline is not None and deadline.remaining() < MIN_ATTEMPT_SECONDS:
+                # Retries stopped because the deadline left no time for another attempt
+                raise DeadlineExceeded("embedding") from e
             # Connection errors after retries
             raise ConnectionError(f"Failed to connect to OpenAI API after retries: {str(e)}. Please check your internet connection and API key.")
         except APIError as e:
@@ -88,39 +272,170 @@ class EmbeddingService:
         
         return embedding
     
+    def _split_requests(self, texts: List[str]) -> Tuple[List[str], List[Tuple[int, int]]]:
+        """
+        Pack texts into consecutive slices that each fit in one embeddings request.
+        
+        A text's UTF-8 length bounds its token count, so batches that clearly
+        fit are sent as they are without tokenizing.
+        
+        Args:
+            texts: Texts to embed
+            
+        Returns:
+            (inputs, slices): the texts, with any over the per-input token limit
+            truncated to it, and (start, end) index ranges, one per request
+        """
+        max_inputs = config.EMBEDDING_REQUEST_MAX_INPUTS
+        max_tokens = config.EMBEDDING_REQUEST_MAX_TOKENS
+        max_input_tokens = config.EMBEDDING_INPUT_MAX_TOKENS
+        
+        byte_lengths = [len(text.encode("utf-8")) for text in texts]
+        if (
+            len(texts) <= max_inputs
+            and sum(byte_lengths) <= max_tokens
+            and max(byte_lengths) <= max_input_tokens
+        ):
+            return texts, [(0, len(texts))]
+        
+        tokenizer = _tokenizer()
+        inputs = list(texts)
+        counts = []
+        for i, tokens in enumerate(tokenizer.encode_batch(texts, disallowed_special=())):
+            if len(tokens) > max_input_tokens:
+                # The API rejects the whole request for one over-long input
+                inputs[i] = tokenizer.decode(tokens[:max_input_tokens])
+                counts.append(max_input_tokens)
+            else:
+                counts.append(len(tokens))
+        
+        slices = []
+        start = 0
+        request_tokens = 0
+        for i, count in enumerate(counts):
+            if i > start and (i - start >= max_inputs or request_tokens + count > max_tokens):
+                slices.append((start, i))
+                start = i
+                request_tokens = 0
+            request_tokens += count
+        slices.append((start, len(counts)))
+        return inputs, slices
+    
     @retry(
         stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=10),
-        retry=retry_if_exception_type((APIConnectionError, APITimeoutError, ConnectionError)),
+        # After a 429 the governor's budget wait paces the retry instead of a blind backoff
+        wait=wait_unless_rate_limited(wait_exponential(multiplier=1, min=2, max=10)),
+        retry=retry_if_exception_type((APIConnectionError, APITimeoutError, ConnectionError, RateLimitError, InternalServerError)),
+        before_sleep=record_retry("embedding"),
         reraise=True
     )
-    def _generate_embeddings_batch_with_retry(self, texts: List[str]) -> List[List[float]]:
-        """Internal method with retry logic for generating batch embeddings."""
+    def _generate_embeddings_batch_with_retry(self, texts: List[str], priority: int = BULK) -> np.ndarray:
+        """Internal method with retry logic for generating the embeddings of one request."""
+        governor.acquire(self.model, sum(estimate_tokens(text) for text in texts), priority)
+        # Each attempt takes a slot; backoff sleeps between attempts do not hold one
+        self._request_limit.acquire()
+        overloaded = False
+        OPENAI_CALLS.inc(service="embedding")
         try:
             response = self.client.embeddings.create(
                 model=self.model,
-                input=texts
+                input=texts,
+                encoding_format=config.EMBEDDING_ENCODING_FORMAT,
+                # openai 1.3.7 has no dimensions argument; send it in the body
+                extra_body=self._extra_body
             )
-            return [item.embedding for item in response.data]
+            return _as_matrix(response.data)
         except (APIConnectionError, APITimeoutError) as e:
+            OPENAI_ERRORS.inc(service="embedding")
             # Convert to ConnectionError for consistent handling
             raise ConnectionError(f"OpenAI API connection error: {str(e)}") from e
+        except RateLimitError:
+            OPENAI_ERRORS.inc(service="embedding")
+            overloaded = True
+            raise
+        except Exception:
+            OPENAI_ERRORS.inc(service="embedding")
+            raise
+        finally:
+            self._request_limit.release(overloaded=overloaded)
     
-    def generate_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+    def _dispatch_requests(
+        self,
+        inputs: List[str],
+        slices: List[Tuple[int, int]],
+        priority: int = BULK
+    ) -> Iterator[np.ndarray]:
+        """
+        Send one request per slice in parallel and yield their embeddings in slice order.
+        
+        Requests not yet started are cancelled if the caller stops early (e.g.
+        because an earlier request failed).
+        """
+        if len(slices) == 1:
+            start, end = slices[0]
+            yield self._generate_embeddings_batch_with_retry(inputs[start:end], priority)
+            return
+        
+        futures = [
+            self._request_pool.submit(self._generate_embeddings_batch_with_retry, inputs[start:end], priority)
+            for start, end in slices
+        ]
+        try:
+            for future in futures:
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+    
+    def _embed_locally(self, texts: List[str]) -> np.ndarray:
+        """Embed texts with the local backend, LOCAL_EMBEDDING_BATCH_SIZE at a time."""
+        step = max(1, config.LOCAL_EMBEDDING_BATCH_SIZE)
+        embeddings = np.empty((len(texts), self.backend.dimensions), dtype=np.float32)
+        for start in range(0, len(texts), step):
+            embeddings[start:start + step] = self.backend.embed(texts[start:start + step])
+        return embeddings
+    
+    def generate_embeddings_batch(self, texts: List[str], priority: int = BULK) -> np.ndarray:
         """
         Generate embeddings for multiple texts.
         
+        Texts are split into requests within the per-request input and token
+        limits, which are sent in parallel (at most EMBEDDING_REQUEST_CONCURRENCY
+        at a time, fewer while rate limited). A failed request is retried on its
+        own without resending the others. Identical texts are embedded once.
+        
         Args:
             texts: List of texts to embed
+            priority: Rate governor priority; BULK (ingestion and migration)
+                leaves the interactive reserve to queries, which pass INTERACTIVE
             
         Returns:
-            List of embedding vectors
+            2-D float32 array with one row per text, in input order
         """
         if not texts:
-            return []
+            return np.empty((0, 0), dtype=np.float32)
+        
+        # Boilerplate, repeated headers and near-empty pages often produce
+        # byte-identical chunks; send each distinct text upstream only once
+        positions = {}
+        inverse = [positions.setdefault(text, len(positions)) for text in texts]
+        if len(positions) < len(texts):
+            EMBEDDING_INPUTS_DEDUPLICATED.inc(len(texts) - len(positions))
+            return self.generate_embeddings_batch(list(positions), priority)[inverse]
+        
+        if self.backend is not None:
+            return self._embed_locally(texts)
         
         try:
-            return self._generate_embeddings_batch_with_retry(texts)
+            inputs, slices = self._split_requests(texts)
+            embeddings = None
+            for (start, end), part in zip(slices, self._dispatch_requests(inputs, slices, priority)):
+                if len(part) != end - start:
+                    raise ValueError(f"Expected {end - start} embeddings, got {len(part)}")
+                if embeddings is None:
+                    embeddings = np.empty((len(texts), part.shape[1]), dtype=np.float32)
+                embeddings[start:end] = part
+            return embeddings
         except ConnectionError as e:
             # Connection errors after retries
             raise ConnectionError(f"Failed to connect to OpenAI API after retries: {str(e)}. Please check your internet connection and API key.")
@@ -142,4 +457,28 @@ class EmbeddingService:
                 raise ValueError(f"OpenAI API rate limit exceeded: {error_msg}. Please try again in a moment.")
             else:
                 raise ValueError(f"OpenAI API error: {error_msg}")
-
+    
+    def generate_chunk_embeddings(self, texts: List[str]) -> np.ndarray:
+        """
+        Generate embeddings for document chunks, reusing persistently cached ones.
+        
+        Only texts missing from the chunk embedding cache are sent to OpenAI.
+        
+        Args:
+            texts: Chunk texts
+            
+        Returns:
+            2-D float32 array with one row per text
+        """
+        if self.chunk_cache is None or not texts:
+            return self.generate_embeddings_batch(texts)
+        
+        vectors = self.chunk_cache.get_many(texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            fresh = self.generate_embeddings_batch(missing_texts)
+            self.chunk_cache.set_many(missing_texts, fresh)
+            for i, vector in zip(missing, fresh):
+                vectors[i] = vector
+        return np.stack(vectors).astype(np.float32, copy=False)
@@ -7,6 +7,7 @@ from database import get_db_session, Document, Chunk, init_db
 from document_processor import DocumentProcessor
 from embeddings import EmbeddingService
 from vector_store import VectorStore
+from cache import corpus_version
 
 
 def ingest_document(file_path: str) -> None:
@@ -76,13 +77,14 @@ def ingest_document(file_path: str) -> None:
         # Update chunks with document_id and generate embeddings
         print("Generating embeddings...")
         chunk_texts = [chunk["text"] for chunk in chunks]
-        embeddings = embedding_service.generate_embeddings_batch(chunk_texts)
+        embeddings = embedding_service.generate_chunk_embeddings(chunk_texts)
         
         # Prepare chunks for vector store
         vector_chunks = []
         for i, chunk in enumerate(chunks):
             chunk_id = f"doc_{document_id}_chunk_{chunk['chunk_index']}"
             chunk["id"] = chunk_id
+            # Row view into the batch array; no per-chunk copy
             chunk["embedding"] = embeddings[i]
             chunk["metadata"]["document_id"] = str(document_id)
             
@@ -107,6 +109,9 @@ def ingest_document(file_path: str) -> None:
         print("Indexing in vector database...")
         vector_store.add_chunks(vector_chunks)
         
+        # Invalidate answers cached by a running API server (it rereads the shared version)
+        corpus_version.bump()
+        
         print(f"\n✅ Successfully ingested document: {document_data['title']}")
         print(f"   Document ID: {document_id}")
         print(f"   Chunks: {len(chunks)}")
@@ -3,10 +3,13 @@ from pathlib import Path
 from datetime import datetime
 from typing import Dict, Any, Optional
 import os
+import time
 from database import get_db_session, Document, Chunk
 from document_processor import DocumentProcessor
 from embeddings import EmbeddingService
 from vector_store import VectorStore
+from cache import corpus_version
+from timing import StageTimer
 
 
 class IngestionService:
@@ -22,7 +25,8 @@ class IngestionService:
         self,
         file_path: str,
         custom_title: Optional[str] = None,
-        original_filename: Optional[str] = None
+        original_filename: Optional[str] = None,
+        timer: Optional[StageTimer] = None
     ) -> Dict[str, Any]:
         """
         Ingest a document into the system.
@@ -30,6 +34,9 @@ class IngestionService:
         Args:
             file_path: Path to document file
             custom_title: Optional custom title for the document
+            original_filename: Original upload filename, used as title fallback
+            timer: Optional request timer; records parse, chunk, embed,
+                sqlite and chroma stages
             
         Returns:
             Dict with ingestion results:
@@ -45,6 +52,7 @@ class IngestionService:
         # Convert to Path object but keep original string for processing
         file_path_obj = Path(file_path)
         file_path_str = str(file_path_obj.absolute())  # Use absolute path
+        timer = timer or StageTimer()
         db_session = get_db_session()
         
         try:
@@ -71,8 +79,10 @@ class IngestionService:
                 }
             
             # Check if document already exists (idempotency)
-            file_hash = self.processor.calculate_file_hash(file_path_str)
-            existing_doc = db_session.query(Document).filter_by(file_hash=file_hash).first()
+            with timer.stage("hash"):
+                file_hash = self.processor.calculate_file_hash(file_path_str)
+            with timer.stage("sqlite"):
+                existing_doc = db_session.query(Document).filter_by(file_hash=file_hash).first()
             
             if existing_doc:
                 return {
@@ -98,10 +108,11 @@ class IngestionService:
             
             # Process document
             try:
-                if file_path_obj.suffix.lower() == '.pdf':
-                    document_data = self.processor.process_pdf(file_path_str)
-                else:
-                    document_data = self.processor.process_text_file(file_path_str)
+                with timer.stage("parse"):
+                    if file_path_obj.suffix.lower() == '.pdf':
+                        document_data = self.processor.process_pdf(file_path_str)
+                    else:
+                        document_data = self.processor.process_text_file(file_path_str)
             except Exception as e:
                 return {
                     "success": False,
@@ -129,13 +140,15 @@ class IngestionService:
                     document_data["title"] = file_path_obj.stem
             
             # Create chunks
-            chunks = self.processor.create_chunks(document_data, document_id=0)
+            with timer.stage("chunk"):
+                chunks = self.processor.create_chunks(document_data, document_id=0)
             
             # Generate embeddings BEFORE saving document to database
             # This ensures we don't create documents with 0 chunks if embedding fails
             try:
                 chunk_texts = [chunk["text"] for chunk in chunks]
-                embeddings = self.embedding_service.generate_embeddings_batch(chunk_texts)
+                with timer.stage("embed"):
+                    embeddings = self.embedding_service.generate_chunk_embeddings(chunk_texts)
             except ConnectionError as e:
                 return {
                     "success": False,
@@ -171,6 +184,7 @@ class IngestionService:
                 file_hash=file_hash,
                 created_at=datetime.now().isoformat()
             )
+            sqlite_start = time.perf_counter()
             db_session.add(doc)
             db_session.commit()
             db_session.refresh(doc)
@@ -182,6 +196,7 @@ class IngestionService:
             for i, chunk in enumerate(chunks):
                 chunk_id = f"doc_{document_id}_chunk_{chunk['chunk_index']}"
                 chunk["id"] = chunk_id
+                # Row view into the batch array; no per-chunk copy
                 chunk["embedding"] = embeddings[i]
                 chunk["metadata"]["document_id"] = str(document_id)
                 
@@ -201,9 +216,14 @@ class IngestionService:
                 db_session.add(db_chunk)
             
             db_session.commit()
+            timer.add("sqlite", (time.perf_counter() - sqlite_start) * 1000)
             
             # Add to vector store
-            self.vector_store.add_chunks(vector_chunks)
+            with timer.stage("chroma"):
+                self.vector_store.add_chunks(vector_chunks)
+            
+            # Invalidate cached answers generated against the old corpus
+            corpus_version.bump()
             
             return {
                 "success": True,
@@ -1,8 +1,17 @@
 """LLM service for answer generation with citations."""
-from openai import OpenAI, APIConnectionError, APITimeoutError, APIError
+from openai import OpenAI, APIConnectionError, APITimeoutError, APIError, RateLimitError, InternalServerError
+from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 import config
 import re
-from typing import List, Dict, Any
+import threading
+from concurrency import SingleFlight, Cancelled
+from metrics import OPENAI_CALLS, OPENAI_ERRORS, OPENAI_CANCELLED, record_retry
+from deadline import Deadline, DeadlineExceeded, with_deadline, stop_at_deadline, wait_within_deadline
+from rate_governor import governor, INTERACTIVE, RateBudgetExhausted, estimate_tokens, wait_unless_rate_limited
+from typing import List, Dict, Any, Iterator, Optional
+
+
+MAX_ANSWER_TOKENS = 1000
 
 
 class LLMService:
@@ -12,13 +21,22 @@ class LLMService:
         """Initialize OpenAI client."""
         if not config.OPENAI_API_KEY:
             raise ValueError("OPENAI_API_KEY environment variable is required. Please set it in Railway Variables (Settings → Variables) or in your .env file for local development.")
-        self.client = OpenAI(api_key=config.OPENAI_API_KEY)
+        # No SDK retries: every resend goes through governor.acquire()
+        self.client = OpenAI(
+            api_key=config.OPENAI_API_KEY,
+            timeout=config.OPENAI_TIMEOUT_SECONDS,
+            max_retries=0,
+            http_client=governor.http_client()
+        )
         self.model = config.LLM_MODEL
+        self._inflight = SingleFlight()
     
     def generate_answer(
         self,
         query: str,
-        retrieved_chunks: List[Dict[str, Any]]
+        retrieved_chunks: List[Dict[str, Any]],
+        deadline: Optional[Deadline] = None,
+        cancelled: Optional[threading.Event] = None
     ) -> Dict[str, Any]:
         """
         Generate grounded answer with citations.
@@ -26,9 +44,16 @@ class LLMService:
         Args:
             query: User query
             retrieved_chunks: List of retrieved chunks with metadata
+            deadline: Optional request deadline; the completion is abandoned when it passes
+            cancelled: Optional event set when the caller has gone away; the
+                completion is then streamed so it can be abandoned between tokens
             
         Returns:
             Dict with answer text and citation mappings
+            
+        Raises:
+            DeadlineExceeded: If the completion cannot finish before the deadline
+            Cancelled: If cancelled was set before the completion finished
         """
         if not retrieved_chunks:
             return {
@@ -36,6 +61,216 @@ class LLMService:
                 "citations": []
             }
         
+        # Concurrent identical requests (same query over the same chunks) share one completion
+        key = (query, tuple(chunk["id"] for chunk in retrieved_chunks))
+        try:
+            return self._inflight.do(key, self._generate_answer_uncached, query, retrieved_chunks, deadline, cancelled)
+        except Cancelled:
+            if cancelled is not None and cancelled.is_set():
+                raise
+            # The caller whose completion this one shared went away; run our own
+            return self._generate_answer_uncached(query, retrieved_chunks, deadline, cancelled)
+        except DeadlineExceeded:
+            if deadline is not None and deadline.expired():
+                raise
+            # The shared completion ran out of its starter's time, not ours
+            return self._generate_answer_uncached(query, retrieved_chunks, deadline, cancelled)
+    
+    def _generate_answer_uncached(
+        self,
+        query: str,
+        retrieved_chunks: List[Dict[str, Any]],
+        deadline: Optional[Deadline] = None,
+        cancelled: Optional[threading.Event] = None
+    ) -> Dict[str, Any]:
+        """Call the chat completion API and extract citations."""
+        messages = self._build_messages(query, retrieved_chunks)
+        if deadline is not None:
+            deadline.check("llm")
+        
+        try:
+            if cancelled is None:
+                response = self._create_completion(messages, deadline=deadline)
+                answer_text = response.choices[0].message.content.strip()
+            else:
+                answer_text = self._complete_cancellable(messages, deadline, cancelled)
+            
+            # Extract citations from answer
+            citations = self._extract_citations(answer_text, retrieved_chunks)
+            
+            return {
+                "answer": answer_text,
+                "citations": citations
+            }
+        
+        except (Cancelled, DeadlineExceeded):
+            raise
+        except Exception as e:
+            OPENAI_ERRORS.inc(service="llm")
+            if deadline is not None and deadline.expired():
+                raise DeadlineExceeded("llm") from e
+            raise self._convert_error(e)
+    
+    @retry(
+        # Retries stop short of the request deadline; after a 429 the
+        # governor's budget wait paces the retry instead of a blind backoff
+        stop=stop_after_attempt(3) | stop_at_deadline(),
+        wait=wait_within_deadline(wait_unless_rate_limited(wait_exponential(multiplier=1, min=2, max=10))),
+        retry=retry_if_exception_type((APIConnectionError, APITimeoutError, RateLimitError, InternalServerError)),
+        before_sleep=record_retry("llm"),
+        reraise=True
+    )
+    def _create_completion(
+        self,
+        messages: List[Dict[str, str]],
+        deadline: Optional[Deadline] = None,
+        **options
+    ) -> Any:
+        """
+        Take rate limit budget and start one chat completion, retrying transient failures.
+        
+        Args:
+            messages: Chat completion messages
+            deadline: Optional request deadline; bounds the budget wait and the request
+            **options: Extra create() arguments (e.g. stream=True)
+            
+        Returns:
+            Completion, or the event stream when streaming
+        """
+        self._acquire_budget(messages, deadline)
+        OPENAI_CALLS.inc(service="llm")
+        return with_deadline(self.client, deadline).chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=0.1,
+            max_tokens=MAX_ANSWER_TOKENS,
+            **options
+        )
+    
+    def _complete_cancellable(
+        self,
+        messages: List[Dict[str, str]],
+        deadline: Optional[Deadline],
+        cancelled: threading.Event
+    ) -> str:
+        """
+        Run a completion as a stream so it can be abandoned part way.
+        
+        Args:
+            messages: Chat completion messages
+            deadline: Optional request deadline
+            cancelled: Checked before each delta
+            
+        Returns:
+            Stripped answer text
+            
+        Raises:
+            Cancelled: If cancelled is set before the completion finishes
+        """
+        if cancelled.is_set():
+            raise Cancelled("llm")
+        stream = self._create_completion(messages, deadline=deadline, stream=True)
+        try:
+            answer_parts = []
+            for event in stream:
+                if cancelled.is_set():
+                    OPENAI_CANCELLED.inc(service="llm")
+                    raise Cancelled("llm")
+                if event.choices and event.choices[0].delta.content:
+                    answer_parts.append(event.choices[0].delta.content)
+            return "".join(answer_parts).strip()
+        finally:
+            # Closing the HTTP response stops generation (and billing) upstream
+            stream.response.close()
+    
+    def generate_answer_stream(
+        self,
+        query: str,
+        retrieved_chunks: List[Dict[str, Any]],
+        cancelled: Optional[threading.Event] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Generate grounded answer incrementally.
+        
+        Yields events as the completion streams in:
+        - {"type": "token", "text": str} for each answer delta
+        - {"type": "citation", "citation": dict} as soon as a complete [n]
+          marker for a new chunk appears in the answer
+        - {"type": "answer", "answer": str, "citations": list} once at the end
+        
+        Args:
+            query: User query
+            retrieved_chunks: List of retrieved chunks with metadata
+            cancelled: Optional event set when the consumer has gone away; the
+                stream then ends at the next delta instead of running to completion
+            
+        Yields:
+            Event dicts as described above
+        """
+        if not retrieved_chunks:
+            result = self.generate_answer(query, retrieved_chunks)
+            yield {"type": "token", "text": result["answer"]}
+            yield {"type": "answer", **result}
+            return
+        
+        messages = self._build_messages(query, retrieved_chunks)
+        stream = None
+        
+        try:
+            stream = self._create_completion(messages, stream=True)
+            
+            answer_parts = []
+            emitted_ids = set()
+            for event in stream:
+                if cancelled is not None and cancelled.is_set():
+                    OPENAI_CANCELLED.inc(service="llm")
+                    return
+                if not event.choices:
+                    continue
+                delta = event.choices[0].delta.content
+                if not delta:
+                    continue
+                
+                answer_parts.append(delta)
+                yield {"type": "token", "text": delta}
+                
+                # A marker can only complete on a delta containing "]"
+                if "]" in delta:
+                    for citation in self._extract_citations("".join(answer_parts), retrieved_chunks):
+                        if citation["id"] not in emitted_ids:
+                            emitted_ids.add(citation["id"])
+                            yield {"type": "citation", "citation": citation}
+            
+            answer_text = "".join(answer_parts).strip()
+            yield {
+                "type": "answer",
+                "answer": answer_text,
+                "citations": self._extract_citations(answer_text, retrieved_chunks)
+            }
+        
+        except Exception as e:
+            OPENAI_ERRORS.inc(service="llm")
+            raise self._convert_error(e)
+        finally:
+            # Closing the HTTP response stops generation if the consumer left early
+            if stream is not None:
+                stream.response.close()
+    
+    def _build_messages(
+        self,
+        query: str,
+        retrieved_chunks: List[Dict[str, Any]]
+    ) -> List[Dict[str, str]]:
+        """
+        Build chat messages with numbered context for grounded answering.
+        
+        Args:
+            query: User query
+            retrieved_chunks: List of retrieved chunks with metadata
+            
+        Returns:
+            Chat completion messages
+        """
         # Build context from retrieved chunks
         context_parts = []
         for i, chunk in enumerate(retrieved_chunks, 1):
@@ -68,43 +303,66 @@ Question: {query}
 
 Answer:"""
         
+        return [
+            {"role": "system", "content": "You are a helpful assistant that provides accurate, cited answers based on document context."},
+            {"role": "user", "content": prompt}
+        ]
+    
+    def _acquire_budget(self, messages: List[Dict[str, str]], deadline: Optional[Deadline] = None) -> None:
+        """
+        Wait for rate limit budget for one completion.
+        
+        A completion is charged for its prompt plus the most tokens it may generate.
+        
+        Args:
+            messages: Chat completion messages
+            deadline: Optional request deadline; bounds the wait
+            
+        Raises:
+            DeadlineExceeded: If the deadline passes while waiting
+            ValueError: If there is still no budget after RATE_GOVERNOR_MAX_WAIT_SECONDS
+        """
+        tokens = sum(estimate_tokens(message["content"]) for message in messages) + MAX_ANSWER_TOKENS
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant that provides accurate, cited answers based on document context."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.1,
-                max_tokens=1000
+            governor.acquire(
+                self.model,
+                tokens,
+                INTERACTIVE,
+                timeout=deadline.remaining() if deadline is not None else config.RATE_GOVERNOR_MAX_WAIT_SECONDS
             )
-            
-            answer_text = response.choices[0].message.content.strip()
-            
-            # Extract citations from answer
-            citations = self._extract_citations(answer_text, retrieved_chunks)
-            
-            return {
-                "answer": answer_text,
-                "citations": citations
-            }
+        except RateBudgetExhausted as e:
+            if deadline is not None:
+                raise DeadlineExceeded("llm") from e
+            raise self._convert_error(e)
+    
+    def _convert_error(self, e: Exception) -> Exception:
+        """
+        Map OpenAI client errors to the exceptions callers handle.
         
-        except (APIConnectionError, APITimeoutError) as e:
-            raise ConnectionError(f"Failed to connect to OpenAI API: {str(e)}. Please check your internet connection and API key.")
-        except APIError as e:
-            error_msg = str(e)
+        Args:
+            e: Exception raised while calling the API
+            
+        Returns:
+            ConnectionError or ValueError with a user-facing message
+        """
+        if isinstance(e, (ConnectionError, ValueError)):
+            # Already mapped (by _acquire_budget)
+            return e
+        if isinstance(e, (APIConnectionError, APITimeoutError)):
+            return ConnectionError(f"Failed to connect to OpenAI API: {str(e)}. Please check your internet connection and API key.")
+        error_msg = str(e)
+        if isinstance(e, RateBudgetExhausted):
+            return ValueError(f"OpenAI API rate limit exceeded: {error_msg}. Please try again in a moment.")
+        if isinstance(e, APIError):
             if "api key" in error_msg.lower() or "authentication" in error_msg.lower() or "401" in error_msg or "403" in error_msg:
-                raise ValueError(f"OpenAI API authentication failed: {error_msg}. Please check your OPENAI_API_KEY.")
+                return ValueError(f"OpenAI API authentication failed: {error_msg}. Please check your OPENAI_API_KEY.")
             elif "rate limit" in error_msg.lower() or "429" in error_msg:
-                raise ValueError(f"OpenAI API rate limit exceeded: {error_msg}. Please try again in a moment.")
-            else:
-                raise ValueError(f"OpenAI API error: {error_msg}")
-        except Exception as e:
-            error_msg = str(e)
-            if "connection" in error_msg.lower() or "timeout" in error_msg.lower():
-                raise ConnectionError(f"Failed to connect to OpenAI API: {error_msg}. Please check your internet connection and API key.")
+                return ValueError(f"OpenAI API rate limit exceeded: {error_msg}. Please try again in a moment.")
             else:
-                raise ValueError(f"Error generating answer: {error_msg}")
+                return ValueError(f"OpenAI API error: {error_msg}")
+        if "connection" in error_msg.lower() or "timeout" in error_msg.lower():
+            return ConnectionError(f"Failed to connect to OpenAI API: {error_msg}. Please check your internet connection and API key.")
+        return ValueError(f"Error generating answer: {error_msg}")
     
     def _extract_citations(
         self,
@@ -0,0 +1,269 @@
+"""CLI tool to rebuild the vector store at a different embedding size or with a different backend."""
+import argparse
+import random
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import chromadb
+import numpy as np
+from chromadb.config import Settings
+import config
+from embeddings import EmbeddingService
+from embedding_backends import OPENAI_BACKEND
+from vector_store import COLLECTION_NAME, collection_metadata
+
+
+MIGRATING_NAME = f"{COLLECTION_NAME}_migrating"
+PREVIOUS_NAME = f"{COLLECTION_NAME}_previous"
+
+
+def truncate_vectors(vectors: np.ndarray, dimensions: int) -> np.ndarray:
+    """
+    Shorten embeddings by keeping their leading components and renormalizing.
+    
+    text-embedding-3 models are trained so that a prefix of the full vector is
+    itself a usable embedding; this is what the API's dimensions parameter does.
+    
+    Args:
+        vectors: 2-D array of full-size embeddings
+        dimensions: Components to keep
+    
+    Returns:
+        2-D float32 array of unit vectors
+    """
+    shortened = np.array(vectors[:, :dimensions], dtype=np.float32)
+    norms = np.linalg.norm(shortened, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return shortened / norms
+
+
+def _drop_collection(client: Any, name: str) -> None:
+    """Delete a collection if it exists."""
+    try:
+        client.delete_collection(name)
+    except ValueError:
+        pass
+
+
+def _search_ms(collection: Any, embedding: List[float], top_k: int) -> Tuple[List[str], float]:
+    """Query one vector; return result ids and latency in milliseconds."""
+    start = time.perf_counter()
+    results = collection.query(query_embeddings=[embedding], n_results=top_k, include=[])
+    return results["ids"][0], (time.perf_counter() - start) * 1000
+
+
+def _latency_summary(samples: List[float]) -> Dict[str, float]:
+    """Mean, p50 and p95 of latencies in milliseconds."""
+    values = np.array(samples)
+    return {
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95))
+    }
+
+
+def compare_collections(old: Any, new: Any, sample_size: int = 50, top_k: int = None) -> Dict[str, Any]:
+    """
+    Measure how well the new collection reproduces the old one's search results.
+    
+    Stored chunks are used as queries: each sampled chunk is searched in the old
+    collection with its old vector and in the new one with its new vector. The
+    chunk itself is left out of both result lists.
+    
+    Args:
+        old: Collection with the original embeddings
+        new: Collection with the migrated embeddings (same ids)
+        sample_size: Number of chunks to use as queries
+        top_k: Results compared per query (defaults to TOP_K)
+    
+    Returns:
+        recall_at_k (share of old top-k ids also in the new top-k) and
+        search latency summaries for both collections
+    """
+    if top_k is None:
+        top_k = config.TOP_K
+    ids = old.get(include=[])["ids"]
+    sample = random.sample(ids, min(sample_size, len(ids)))
+    if not sample:
+        return {"queries": 0, "top_k": top_k, "recall_at_k": None, "old": None, "new": None}
+    
+    old_vectors = old.get(ids=sample, include=["embeddings"])
+    new_vectors = new.get(ids=sample, include=["embeddings"])
+    old_by_id = dict(zip(old_vectors["ids"], old_vectors["embeddings"]))
+    new_by_id = dict(zip(new_vectors["ids"], new_vectors["embeddings"]))
+    n_results = min(top_k + 1, len(ids))
+    
+    recalls, old_ms, new_ms = [], [], []
+    for chunk_id in sample:
+        old_ids, elapsed_old = _search_ms(old, old_by_id[chunk_id], n_results)
+        new_ids, elapsed_new = _search_ms(new, new_by_id[chunk_id], n_results)
+        old_ms.append(elapsed_old)
+        new_ms.append(elapsed_new)
+        expected = [i for i in old_ids if i != chunk_id][:top_k]
+        found = set(i for i in new_ids if i != chunk_id)
+        if expected:
+            recalls.append(len(found.intersection(expected)) / len(expected))
+    
+    return {
+        "queries": len(sample),
+        "top_k": top_k,
+        "recall_at_k": float(np.mean(recalls)) if recalls else None,
+        "old": _latency_summary(old_ms),
+        "new": _latency_summary(new_ms)
+    }
+
+
+def migrate(
+    dimensions: Optional[int],
+    mode: str = "truncate",
+    batch_size: int = 1000,
+    sample_size: int = 50,
+    keep_previous: bool = False,
+    dry_run: bool = False,
+    client: Optional[Any] = None
+) -> Dict[str, Any]:
+    """
+    Rebuild the chunk collection with embeddings of a new size or backend.
+    
+    The new collection is built next to the old one and swapped in only once
+    it is complete, so an interrupted migration leaves the old index in place.
+    
+    Args:
+        dimensions: Target embedding size (None when re-embedding at the
+            configured backend's native size)
+        mode: "truncate" (shorten and renormalize stored vectors; no API calls)
+            or "reembed" (embed every chunk text again with EMBEDDING_BACKEND)
+        batch_size: Chunks copied per page
+        sample_size: Queries used for the recall and latency comparison
+        keep_previous: Keep the old collection as documents_previous
+        dry_run: Build and compare, then discard the new collection
+        client: Chroma client (defaults to the one at VECTOR_DB_PATH)
+    
+    Returns:
+        Report with the chunk count and the comparison from compare_collections
+    
+    Raises:
+        ValueError: If truncation is asked to grow vectors or has no target size
+    """
+    if mode == "truncate" and dimensions is None:
+        raise ValueError("Truncation needs a target size")
+    if client is None:
+        client = chromadb.PersistentClient(
+            path=config.VECTOR_DB_PATH,
+            settings=Settings(anonymized_telemetry=False)
+        )
+    old = client.get_collection(COLLECTION_NAME)
+    if mode == "reembed":
+        embedding_service = EmbeddingService(dimensions=dimensions)
+        backend = embedding_service.backend_name
+        # A local backend always knows its output size; record it even if unrequested
+        if embedding_service.backend is not None:
+            dimensions = embedding_service.backend.dimensions
+        else:
+            dimensions = embedding_service.dimensions
+    else:
+        # Truncated vectors still come from the backend that produced them
+        embedding_service = None
+        backend = (old.metadata or {}).get("embedding_backend", OPENAI_BACKEND)
+    _drop_collection(client, MIGRATING_NAME)
+    new = client.create_collection(MIGRATING_NAME, metadata=collection_metadata(dimensions, backend))
+    
+    try:
+        total = old.count()
+        for offset in range(0, total, batch_size):
+            page = old.get(
+                limit=batch_size,
+                offset=offset,
+                include=["embeddings", "documents", "metadatas"]
+            )
+            if not page["ids"]:
+                break
+            if embedding_service is not None:
+                vectors = embedding_service.generate_chunk_embeddings(page["documents"])
+            else:
+                vectors = np.asarray(page["embeddings"], dtype=np.float32)
+                if vectors.shape[1] < dimensions:
+                    raise ValueError(
+                        f"Cannot truncate {vectors.shape[1]}-dimension vectors to {dimensions}; use --mode reembed"
+                    )
+                vectors = truncate_vectors(vectors, dimensions)
+            new.add(
+                ids=page["ids"],
+                embeddings=vectors.tolist(),
+                documents=page["documents"],
+                metadatas=page["metadatas"]
+            )
+            print(f"  {min(offset + batch_size, total)}/{total} chunks")
+        
+        report = {"chunks": new.count(), "dimensions": dimensions, "backend": backend, "mode": mode}
+        report.update(compare_collections(old, new, sample_size=sample_size))
+    except BaseException:
+        _drop_collection(client, MIGRATING_NAME)
+        raise
+    
+    if dry_run:
+        _drop_collection(client, MIGRATING_NAME)
+        return report
+    
+    # Swap: old -> documents_previous, new -> documents
+    _drop_collection(client, PREVIOUS_NAME)
+    old.modify(name=PREVIOUS_NAME)
+    new.modify(name=COLLECTION_NAME)
+    if not keep_previous:
+        _drop_collection(client, PREVIOUS_NAME)
+    return report
+
+
+def main():
+    """Main CLI entry point."""
+    parser = argparse.ArgumentParser(description="Rebuild the vector store at a new embedding size or backend")
+    parser.add_argument(
+        "--dimensions",
+        type=int,
+        help="Target embedding size (e.g. 512); required for truncate, defaults to EMBEDDING_DIMENSIONS for reembed"
+    )
+    parser.add_argument(
+        "--mode",
+        choices=("truncate", "reembed"),
+        default="truncate",
+        help="Shorten stored vectors (no API calls) or embed every chunk again with EMBEDDING_BACKEND"
+    )
+    parser.add_argument("--batch-size", type=int, default=1000, help="Chunks copied per page")
+    parser.add_argument("--sample-size", type=int, default=50, help="Queries for the recall and latency comparison")
+    parser.add_argument("--keep-previous", action="store_true", help=f"Keep the old collection as {PREVIOUS_NAME}")
+    parser.add_argument("--dry-run", action="store_true", help="Build and compare, but keep the current index")
+    
+    args = parser.parse_args()
+    if args.mode == "truncate" and args.dimensions is None:
+        parser.error("--dimensions is required with --mode truncate")
+    if args.dimensions is not None and args.dimensions <= 0:
+        parser.error("--dimensions must be positive")
+    
+    print(f"Migrating vector store ({args.mode}, dimensions: {args.dimensions or 'default'})...")
+    report = migrate(
+        args.dimensions,
+        mode=args.mode,
+        batch_size=args.batch_size,
+        sample_size=args.sample_size,
+        keep_previous=args.keep_previous,
+        dry_run=args.dry_run
+    )
+    
+    print(f"\nChunks: {report['chunks']}")
+    if report["recall_at_k"] is not None:
+        print(f"Recall@{report['top_k']} vs. previous index: {report['recall_at_k']:.3f} over {report['queries']} queries")
+        print(
+            f"Search latency (mean / p50 / p95 ms): "
+            f"previous {report['old']['mean_ms']:.1f} / {report['old']['p50_ms']:.1f} / {report['old']['p95_ms']:.1f}, "
+            f"new {report['new']['mean_ms']:.1f} / {report['new']['p50_ms']:.1f} / {report['new']['p95_ms']:.1f}"
+        )
+    if args.dry_run:
+        print("\nDry run: the current index was left unchanged.")
+    else:
+        settings = f"EMBEDDING_BACKEND={report['backend']}"
+        if report["dimensions"] is not None:
+            settings += f" EMBEDDING_DIMENSIONS={report['dimensions']}"
+        print(f"\n✅ Index rebuilt. Run the API server with {settings} and restart it.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""Process-wide OpenAI rate governor fed by the rate-limit headers of every response."""
+import heapq
+import itertools
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Mapping, Optional, Tuple
+import httpx
+from openai import RateLimitError
+import config
+import metrics
+
+
+# Priorities: lower values are served first
+INTERACTIVE = 0
+BULK = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+# Fallback refill period when a response has no usable reset header (limits are per minute)
+WINDOW_SECONDS = 60.0
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_UNIT_SECONDS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+RATE_WAIT = metrics.histogram(
+    "rag_rate_governor_wait_seconds",
+    "Time OpenAI calls waited for request/token budget",
+    ("priority",)
+)
+RATE_LIMITED = metrics.counter(
+    "rag_rate_governor_rate_limited_total",
+    "HTTP 429 responses seen by the rate governor",
+    ("model",)
+)
+
+
+class RateBudgetExhausted(Exception):
+    """Raised when a call cannot get budget before its wait limit."""
+
+    def __init__(self, model: str, waited: float):
+        """
+        Initialize error.
+
+        Args:
+            model: Model whose budget was exhausted
+            waited: Seconds spent waiting
+        """
+        super().__init__(f"OpenAI rate limit budget for {model} still exhausted after waiting {waited:.1f}s")
+        self.model = model
+        self.waited = waited
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """
+    Seconds in a rate-limit reset header.
+
+    Args:
+        value: e.g. "6m0s", "1.5s", "20ms" or a plain number of seconds
+
+    Returns:
+        Seconds, or None if the value is missing or malformed
+    """
+    if not value:
+        return None
+    parts = _DURATION.findall(value)
+    if parts:
+        return sum(float(number) * _UNIT_SECONDS[unit] for number, unit in parts)
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of text (about four characters per token), for budgeting only."""
+    return len(text) // 4 + 1
+
+
+class _Bucket:
+    """
+    Locally estimated budget of one kind (requests or tokens) for one model.
+
+    The provider refills a budget continuously, reaching its limit at the
+    reset time it reports. Between responses the level is extrapolated at that
+    rate and lowered by the calls this process starts.
+    """
+
+    def __init__(self, limit: float, remaining: float, reset_seconds: Optional[float], now: float):
+        """Initialize from one response's headers."""
+        self.limit = limit
+        self.rate = limit / WINDOW_SECONDS
+        self.level = remaining
+        self.updated_at = now
+        self.update(limit, remaining, reset_seconds, now)
+
+    def update(self, limit: float, remaining: float, reset_seconds: Optional[float], now: float) -> None:
+        """Replace the estimate with the provider's numbers."""
+        self.limit = limit
+        if reset_seconds and remaining < limit:
+            self.rate = (limit - remaining) / reset_seconds
+        elif limit > 0:
+            self.rate = limit / WINDOW_SECONDS
+        self.level = remaining
+        self.updated_at = now
+
+    def available(self, now: float) -> float:
+        """Budget available at now."""
+        return min(self.limit, self.level + self.rate * (now - self.updated_at))
+
+    def delay(self, amount: float, reserve: float, now: float) -> float:
+        """
+        Seconds until amount is available while keeping reserve of the limit unused.
+
+        A call larger than the whole budget waits for a full budget rather
+        than forever.
+        """
+        floor = self.limit * reserve
+        amount = min(amount, self.limit - floor)
+        short = amount + floor - self.available(now)
+        if short <= 0:
+            return 0.0
+        if self.rate <= 0:
+            return WINDOW_SECONDS
+        return short / self.rate
+
+    def consume(self, amount: float, now: float) -> None:
+        """Take amount from the budget (the level may go negative)."""
+        self.level = self.available(now) - amount
+        self.updated_at = now
+
+
+class RateGovernor:
+    """
+    Request and token budgets per model, shared by every OpenAI client in the process.
+
+    Budgets are learned from the x-ratelimit-* headers of each response (via
+    the httpx client from http_client()). Calls ask acquire() for budget
+    before being sent and wait, in priority then arrival order, until the
+    estimate says they fit instead of being sent to fail with HTTP 429. Bulk
+    calls leave a share of each budget to interactive ones. A model whose
+    headers have not been seen yet is not throttled.
+    """
+
+    def __init__(self, interactive_reserve: float = 0.0, retry_after_seconds: float = 1.0):
+        """
+        Initialize governor.
+
+        Args:
+            interactive_reserve: Fraction of each budget bulk calls may not use
+            retry_after_seconds: Pause after a 429 that carries no retry-after header
+        """
+        self.interactive_reserve = min(max(interactive_reserve, 0.0), 1.0)
+        self.retry_after_seconds = retry_after_seconds
+        self._cond = threading.Condition()
+        self._budgets: Dict[str, Dict[str, _Bucket]] = {}
+        self._paused_until: Dict[str, float] = {}
+        self._waiters: Dict[str, List[Tuple[int, int]]] = {}
+        self._sequence = itertools.count()
+        self._local = threading.local()
+
+    def _delay(self, model: str, tokens: int, priority: int, now: float) -> float:
+        """Seconds until a call of this size and priority fits the model's budget."""
+        delay = self._paused_until.get(model, 0.0) - now
+        reserve = self.interactive_reserve if priority > INTERACTIVE else 0.0
+        budgets = self._budgets.get(model, {})
+        for kind, amount in (("requests", 1), ("tokens", tokens)):
+            bucket = budgets.get(kind)
+            if bucket is not None and amount:
+                delay = max(delay, bucket.delay(amount, reserve, now))
+        return max(delay, 0.0)
+
+    def acquire(
+        self,
+        model: str,
+        tokens: int = 0,
+        priority: int = INTERACTIVE,
+        timeout: Optional[float] = None
+    ) -> float:
+        """
+        Wait until the model's budget admits one request of about tokens tokens, then take it.
+
+        Args:
+            model: Model the request is for
+            tokens: Estimated tokens the request will be charged
+            priority: INTERACTIVE or BULK
+            timeout: Maximum seconds to wait (None waits as long as needed)
+
+        Returns:
+            Seconds waited
+
+        Raises:
+            RateBudgetExhausted: If timeout passes before the budget admits the call
+        """
+        # Responses on this thread are attributed to this model by the response hook
+        self._local.model = model
+        started = time.monotonic()
+        ticket = (priority, next(self._sequence))
+        with self._cond:
+            queue = self._waiters.setdefault(model, [])
+            heapq.heappush(queue, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    # Only the first waiter in line may take budget, so a large
+                    # bulk call is not overtaken forever by smaller ones
+                    wait = self._delay(model, tokens, priority, now) if queue[0] == ticket else None
+                    if wait == 0.0:
+                        break
+                    if timeout is not None:
+                        left = started + timeout - now
+                        if left <= 0:
+                            raise RateBudgetExhausted(model, now - started)
+                        wait = left if wait is None else min(wait, left)
+                    self._cond.wait(wait)
+
+                for kind, amount in (("requests", 1), ("tokens", tokens)):
+                    bucket = self._budgets.get(model, {}).get(kind)
+                    if bucket is not None and amount:
+                        bucket.consume(amount, now)
+            finally:
+                queue.remove(ticket)
+                heapq.heapify(queue)
+                self._cond.notify_all()
+
+        waited = time.monotonic() - started
+        RATE_WAIT.observe(waited, priority=PRIORITY_NAMES.get(priority, str(priority)))
+        return waited
+
+    def observe(self, model: str, headers: Mapping[str, str], status_code: int = 200) -> None:
+        """
+        Update a model's budgets from one response.
+
+        Args:
+            model: Model the request was for
+            headers: Response headers
+            status_code: HTTP status; 429 pauses the model until its retry-after time
+        """
+        now = time.monotonic()
+        with self._cond:
+            budgets = self._budgets.setdefault(model, {})
+            for kind in ("requests", "tokens"):
+                try:
+                    limit = float(headers[f"x-ratelimit-limit-{kind}"])
+                    remaining = float(headers[f"x-ratelimit-remaining-{kind}"])
+                except (KeyError, ValueError):
+                    continue
+                reset_seconds = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+                if kind in budgets:
+                    budgets[kind].update(limit, remaining, reset_seconds, now)
+                else:
+                    budgets[kind] = _Bucket(limit, remaining, reset_seconds, now)
+
+            if status_code == 429:
+                RATE_LIMITED.inc(model=model)
+                retry_after_ms = parse_duration(headers.get("retry-after-ms"))
+                retry_after = retry_after_ms / 1000 if retry_after_ms is not None else parse_duration(headers.get("retry-after"))
+                if retry_after is None:
+                    retry_after = self.retry_after_seconds
+                self._paused_until[model] = max(self._paused_until.get(model, 0.0), now + retry_after)
+            self._cond.notify_all()
+
+    def _on_response(self, response: httpx.Response) -> None:
+        """httpx response hook: feed headers to the model last acquired on this thread."""
+        model = getattr(self._local, "model", None)
+        if model is not None:
+            self.observe(model, response.headers, response.status_code)
+
+    def http_client(self) -> httpx.Client:
+        """
+        httpx client for an OpenAI client whose responses update this governor.
+
+        Returns:
+            Client with the same redirect and connection settings the OpenAI SDK uses by default
+        """
+        return httpx.Client(
+            timeout=config.OPENAI_TIMEOUT_SECONDS,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            follow_redirects=True,
+            event_hooks={"response": [self._on_response]}
+        )
+
+    def snapshot(self) -> Dict[Tuple[str, str], float]:
+        """Estimated budget available now per (model, kind)."""
+        now = time.monotonic()
+        with self._cond:
+            return {
+                (model, kind): bucket.available(now)
+                for model, budgets in self._budgets.items()
+                for kind, bucket in budgets.items()
+            }
+
+
+def wait_unless_rate_limited(fallback: Callable) -> Callable:
+    """
+    tenacity wait: retry a 429 at once and let acquire() pace it; use fallback for other errors.
+
+    Args:
+        fallback: Wait strategy for connection and server errors
+    """
+    def wait(retry_state) -> float:
+        outcome = retry_state.outcome
+        if outcome is not None and outcome.failed and isinstance(outcome.exception(), RateLimitError):
+            return 0.0
+        return fallback(retry_state)
+    return wait
+
+
+governor = RateGovernor(
+    interactive_reserve=config.RATE_GOVERNOR_INTERACTIVE_RESERVE,
+    retry_after_seconds=config.RATE_GOVERNOR_RETRY_AFTER_SECONDS
+)
+
+metrics.gauge(
+    "rag_rate_governor_budget_remaining",
+    "Estimated OpenAI budget available per model and kind (requests or tokens)",
+    ("model", "kind"),
+    callback=governor.snapshot
+)
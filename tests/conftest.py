@@ -0,0 +1,13 @@
+"""Shared test fixtures."""
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def clear_answer_cache():
+    """Keep cached answers from leaking between tests that mock the same embedding."""
+    import api
+    if api.answer_cache is not None:
+        api.answer_cache.clear()
+    yield
+    if api.answer_cache is not None:
+        api.answer_cache.clear()
@@ -0,0 +1,118 @@
+"""Tests for the semantic answer cache."""
+import time
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+from api import app
+from cache import AnswerCache, CorpusVersion, corpus_version
+
+
+RESULT = {"answer": "ML is AI [1].", "citations": [], "retrieved_chunks": []}
+
+
+def test_answer_cache_semantic_hit():
+    """Test near-identical query embeddings share a cached answer."""
+    cache = AnswerCache(similarity_threshold=0.95)
+    cache.set([1.0, 0.0, 0.0], RESULT, version=0)
+
+    hit = cache.get([0.99, 0.05, 0.0], version=0)
+    assert hit is not None
+    assert hit["result"] == RESULT
+    assert hit["stale"] is False
+
+    assert cache.get([0.0, 1.0, 0.0], version=0) is None
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_answer_cache_corpus_version_invalidates():
+    """Test answers are never served after the corpus changes."""
+    cache = AnswerCache()
+    cache.set([1.0, 0.0], RESULT, version=1)
+
+    assert cache.get([1.0, 0.0], version=2) is None
+    assert cache.size() == 0
+
+    # Answers generated against an older corpus are not stored
+    cache.set([1.0, 0.0], RESULT, version=1)
+    assert cache.get([1.0, 0.0], version=2) is None
+
+
+def test_answer_cache_lru_eviction():
+    """Test least recently used entries are evicted at capacity."""
+    cache = AnswerCache(max_size=2)
+    cache.set([1.0, 0.0, 0.0], {"answer": "a"}, version=0)
+    cache.set([0.0, 1.0, 0.0], {"answer": "b"}, version=0)
+    cache.get([1.0, 0.0, 0.0], version=0)  # Touch "a"
+    cache.set([0.0, 0.0, 1.0], {"answer": "c"}, version=0)
+
+    assert cache.size() == 2
+    assert cache.get([0.0, 1.0, 0.0], version=0) is None
+    assert cache.get([1.0, 0.0, 0.0], version=0)["result"]["answer"] == "a"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_answer_cache_stale_window():
+    """Test entries past TTL are served as stale, then expire."""
+    cache = AnswerCache(ttl_seconds=10, stale_ttl_seconds=10)
+    cache.set([1.0, 0.0], RESULT, version=0)
+
+    now = time.time()
+    with patch('cache.time.time', return_value=now + 15):
+        hit = cache.get([1.0, 0.0], version=0)
+    assert hit["stale"] is True
+
+    with patch('cache.time.time', return_value=now + 25):
+        assert cache.get([1.0, 0.0], version=0) is None
+
+
+def test_corpus_version_bump():
+    """Test corpus version increments."""
+    version = CorpusVersion()
+    assert version.get() == 0
+    assert version.bump() == 1
+    assert version.get() == 1
+
+
+def test_corpus_version_is_shared_through_database(tmp_path):
+    """Test a bump in one process (e.g. the ingest CLI) invalidates answers cached by another."""
+    path = str(tmp_path / "metadata.db")
+    server = CorpusVersion(path, refresh_seconds=60)
+    cli = CorpusVersion(path)
+    assert server.get() == 0
+
+    assert cli.bump() == 1
+    # Reread only once the refresh interval has passed
+    assert server.get() == 0
+    with patch('cache.time.monotonic', return_value=time.monotonic() + 61):
+        assert server.get() == 1
+    assert server.bump() == 2
+    assert CorpusVersion(path).get() == 2
+
+
+def test_query_uses_answer_cache():
+    """Test a repeated query skips search and the LLM."""
+    client = TestClient(app)
+    with patch('api.embedding_service') as mock_emb, \
+         patch('api.vector_store') as mock_store, \
+         patch('api.llm_service') as mock_llm:
+        mock_emb.generate_embedding.return_value = [0.3] * 1536
+        mock_store.search.return_value = [{
+            "id": "chunk_1",
+            "text": "ML is AI.",
+            "metadata": {"document_title": "AI", "page": 1},
+            "similarity_score": 0.9
+        }]
+        mock_llm.generate_answer.return_value = {"answer": "ML is AI [1].", "citations": []}
+
+        first = client.post("/query", json={"text": "What is ML?"})
+        second = client.post("/query", json={"text": "what is ml"})
+
+        assert mock_llm.generate_answer.call_count == 1
+        assert mock_store.search.call_count == 1
+        assert second.json()["answer"] == first.json()["answer"]
+
+        # A corpus change invalidates the cached answer
+        corpus_version.bump()
+        client.post("/query", json={"text": "What is ML?"})
+        assert mock_llm.generate_answer.call_count == 2
@@ -0,0 +1,199 @@
+"""Tests for abandoning work when the client goes away."""
+import asyncio
+import json
+import threading
+import pytest
+from unittest.mock import MagicMock, patch
+import api
+import concurrency
+import config
+from api import app
+from concurrency import AsyncSingleFlight, Cancelled, run_blocking, run_cancellable, STAGE_WORKERS, CANCELLED
+from llm_service import LLMService
+from metrics import OPENAI_CANCELLED
+
+
+CHUNKS = [{
+    "id": "chunk_1",
+    "text": "Machine learning is a subset of artificial intelligence.",
+    "metadata": {"document_title": "AI Basics", "page": 1},
+    "similarity_score": 0.9
+}]
+
+
+def make_stream_chunk(text):
+    """Build a streamed completion chunk."""
+    chunk = MagicMock()
+    chunk.choices = [MagicMock()]
+    chunk.choices[0].delta.content = text
+    return chunk
+
+
+async def test_async_singleflight_cancels_work_when_every_caller_leaves():
+    """Test shared work is cancelled once nobody is waiting for it."""
+    flight = AsyncSingleFlight()
+    cancelled = asyncio.Event()
+
+    async def work():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    first = asyncio.create_task(flight.do("key", work))
+    second = asyncio.create_task(flight.do("key", work))
+    await asyncio.sleep(0.01)
+    first.cancel()
+    await asyncio.sleep(0.01)
+    assert not cancelled.is_set()
+
+    second.cancel()
+    await asyncio.wait_for(cancelled.wait(), 1)
+
+
+async def test_run_cancellable_signals_running_call():
+    """Test a cancelled caller sets the running call's cancelled event."""
+    started = threading.Event()
+    seen = []
+    cancelled_before = CANCELLED.get(stage="llm")
+
+    def work(cancelled):
+        started.set()
+        seen.append(cancelled.wait(5))
+
+    task = asyncio.ensure_future(run_cancellable("llm", work))
+    await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    await asyncio.sleep(0.05)
+    assert seen == [True]
+    assert CANCELLED.get(stage="llm") - cancelled_before == 1
+
+
+async def test_cancelled_queued_call_never_runs():
+    """Test a call still waiting for a worker is dropped when its caller is cancelled."""
+    release = threading.Event()
+    ran = []
+    workers = STAGE_WORKERS["search"]
+
+    busy = [asyncio.ensure_future(run_blocking("search", release.wait, 5)) for _ in range(workers)]
+    await asyncio.sleep(0.05)
+    queued = asyncio.ensure_future(run_blocking("search", ran.append, 1))
+    await asyncio.sleep(0.01)
+    assert concurrency._load["search"].waiting == 1
+
+    queued.cancel()
+    await asyncio.sleep(0.01)
+    release.set()
+    await asyncio.gather(*busy)
+    await asyncio.sleep(0.05)
+
+    assert ran == []
+    assert concurrency._load["search"].waiting == 0
+
+
+def test_generate_answer_abandons_completion_when_cancelled():
+    """Test the completion stream is closed as soon as the caller goes away."""
+    cancelled = threading.Event()
+
+    def deltas():
+        yield make_stream_chunk("ML is")
+        cancelled.set()
+        yield make_stream_chunk(" a subset")
+        yield make_stream_chunk(" of AI [1].")
+
+    with patch.object(config, 'OPENAI_API_KEY', 'sk-test'), \
+         patch('llm_service.OpenAI') as mock_openai:
+        mock_client = MagicMock()
+        mock_openai.return_value = mock_client
+        stream = MagicMock()
+        stream.__iter__.return_value = deltas()
+        mock_client.chat.completions.create.return_value = stream
+        cancelled_before = OPENAI_CANCELLED.get(service="llm")
+
+        service = LLMService()
+        with pytest.raises(Cancelled):
+            service.generate_answer("What is ML?", CHUNKS, cancelled=cancelled)
+
+    assert mock_client.chat.completions.create.call_args.kwargs["stream"] is True
+    stream.response.close.assert_called_once()
+    assert OPENAI_CANCELLED.get(service="llm") - cancelled_before == 1
+
+
+def test_generate_answer_stream_stops_when_cancelled():
+    """Test a streamed answer ends at the next delta once cancelled."""
+    cancelled = threading.Event()
+
+    with patch.object(config, 'OPENAI_API_KEY', 'sk-test'), \
+         patch('llm_service.OpenAI') as mock_openai:
+        mock_client = MagicMock()
+        mock_openai.return_value = mock_client
+        stream = MagicMock()
+        stream.__iter__.return_value = iter([make_stream_chunk("ML"), make_stream_chunk(" is AI")])
+        mock_client.chat.completions.create.return_value = stream
+
+        events = LLMService().generate_answer_stream("What is ML?", CHUNKS, cancelled=cancelled)
+        assert next(events) == {"type": "token", "text": "ML"}
+        cancelled.set()
+        assert list(events) == []
+
+    stream.response.close.assert_called_once()
+
+
+async def test_query_disconnect_cancels_generation():
+    """Test /query stops answer generation when the client disconnects."""
+    generation_started = threading.Event()
+    generation_cancelled = []
+    disconnect = asyncio.Event()
+    sent = []
+
+    def generate_answer(query, chunks, cancelled=None, **kwargs):
+        generation_started.set()
+        generation_cancelled.append(cancelled.wait(5))
+        raise Cancelled("llm")
+
+    body = json.dumps({"text": "Disconnect test question"}).encode()
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/query",
+        "raw_path": b"/query",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        "client": ("test", 1),
+        "server": ("test", 80),
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    with patch('api.embedding_service') as mock_emb, \
+         patch('api.vector_store') as mock_store, \
+         patch('api.llm_service') as mock_llm:
+        mock_emb.generate_embedding.return_value = [0.3] * 1536
+        mock_store.search.return_value = CHUNKS
+        mock_llm.generate_answer.side_effect = generate_answer
+        cancelled_before = api.REQUESTS_CANCELLED.get(route="/query")
+
+        request = asyncio.ensure_future(app(scope, receive, send))
+        await asyncio.get_running_loop().run_in_executor(None, generation_started.wait, 5)
+        disconnect.set()
+        await asyncio.wait_for(request, 5)
+        await asyncio.sleep(0.05)
+
+    assert generation_cancelled == [True]
+    assert api.REQUESTS_CANCELLED.get(route="/query") - cancelled_before == 1
@@ -0,0 +1,168 @@
+"""Tests for running blocking work off the event loop."""
+import asyncio
+import threading
+import time
+import pytest
+import httpx
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from api import app
+import concurrency
+from concurrency import run_blocking, iterate_blocking, get_executor, StageOverloaded, STAGE_WORKERS, REJECTED, AdaptiveConcurrencyLimit, CONCURRENCY_BACKOFFS
+
+
+async def test_run_blocking_uses_stage_pool():
+    """Test blocking work runs in the stage's worker thread."""
+    thread_name = await run_blocking("search", lambda: threading.current_thread().name)
+    assert thread_name.startswith("rag-search")
+
+
+async def test_run_blocking_propagates_errors():
+    """Test exceptions raised in the worker reach the caller."""
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError, match="boom"):
+        await run_blocking("database", fail)
+
+
+def test_unknown_stage():
+    """Test unknown stage names are rejected."""
+    with pytest.raises(ValueError):
+        get_executor("nonexistent")
+
+
+async def test_health_not_blocked_by_slow_query():
+    """Test /health answers while a slow /query is in flight."""
+    def slow_embedding(text, **kwargs):
+        time.sleep(0.5)
+        return [0.1] * 1536
+
+    with patch('api.embedding_service') as mock_emb, \
+         patch('api.vector_store') as mock_store:
+        mock_emb.generate_embedding.side_effect = slow_embedding
+        mock_store.search.return_value = []
+
+        async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+            query_task = asyncio.create_task(client.post("/query", json={"text": "slow query"}))
+            await asyncio.sleep(0.05)
+
+            start = time.time()
+            health_response = await client.get("/health")
+            health_elapsed = time.time() - start
+
+            query_response = await query_task
+
+    assert health_response.status_code == 200
+    assert health_elapsed < 0.4, "Health check should not wait for the slow query"
+    assert query_response.status_code == 200
+
+
+async def test_full_stage_rejects_new_calls():
+    """Test calls beyond workers + queue size fail fast instead of queueing."""
+    release = threading.Event()
+    workers = STAGE_WORKERS["search"]
+    rejected_before = REJECTED.get(stage="search")
+
+    with patch.dict(concurrency.STAGE_QUEUE_SIZES, {"search": 1}):
+        busy = [asyncio.ensure_future(run_blocking("search", release.wait, 5)) for _ in range(workers + 1)]
+        await asyncio.sleep(0.05)
+        assert concurrency._load["search"].running == workers
+        assert concurrency._load["search"].waiting == 1
+
+        with pytest.raises(StageOverloaded) as excinfo:
+            await run_blocking("search", lambda: None)
+        assert excinfo.value.stage == "search"
+        assert excinfo.value.retry_after >= 1
+
+        release.set()
+        await asyncio.gather(*busy)
+
+    assert REJECTED.get(stage="search") - rejected_before == 1
+    assert concurrency._load["search"].waiting == 0
+    assert concurrency._load["search"].running == 0
+    # Capacity is available again once the queue drains
+    assert await run_blocking("search", lambda: "ok") == "ok"
+
+
+async def test_stream_steps_count_towards_stage_load():
+    """Test each step of an admitted stream is counted as running in its stage."""
+    load = concurrency._load["llm"]
+    release = threading.Event()
+
+    def events():
+        yield 1
+        release.wait(5)
+        yield 2
+
+    stream = iterate_blocking("llm", events())
+    assert await stream.__anext__() == 1
+    pending = asyncio.ensure_future(stream.__anext__())
+    await asyncio.sleep(0.05)
+    assert load.running == 1
+
+    release.set()
+    assert await pending == 2
+    await stream.aclose()
+    assert load.running == 0
+    assert load.waiting == 0
+
+
+def test_overloaded_stage_returns_503_with_retry_after():
+    """Test load shedding surfaces as 503 with Retry-After."""
+    client = TestClient(app)
+    with patch('api.embedding_service'), \
+         patch('api.vector_store'), \
+         patch('api.llm_service'), \
+         patch('api.run_blocking', side_effect=StageOverloaded("embedding", 3)):
+        response = client.post("/query", json={"text": "busy?"})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "3"
+    assert "busy" in response.json()["detail"]
+
+    metrics_text = client.get("/metrics").text
+    assert 'rag_stage_queue_depth{stage="embedding"}' in metrics_text
+    assert "# TYPE rag_stage_queue_wait_seconds histogram" in metrics_text
+
+
+def test_adaptive_limit_halves_on_overload_and_grows_back():
+    """Test the limit halves on overload and grows by about one per round of successes."""
+    limit = AdaptiveConcurrencyLimit("test_aimd", max_limit=8)
+    backoffs_before = CONCURRENCY_BACKOFFS.get(limiter="test_aimd")
+
+    limit.acquire()
+    limit.release(overloaded=True)
+    limit.acquire()
+    limit.release(overloaded=True)
+    assert limit.limit == 2
+    assert CONCURRENCY_BACKOFFS.get(limiter="test_aimd") - backoffs_before == 2
+
+    for _ in range(2):
+        limit.acquire()
+        limit.release()
+    assert limit.limit == pytest.approx(2.9)
+
+    for _ in range(100):
+        limit.acquire()
+        limit.release()
+    assert limit.limit == 8
+
+
+def test_adaptive_limit_blocks_callers_over_the_limit():
+    """Test a caller beyond the current limit waits until a slot is released."""
+    limit = AdaptiveConcurrencyLimit("test_block", max_limit=1)
+    limit.acquire()
+    acquired = threading.Event()
+
+    def second():
+        limit.acquire()
+        acquired.set()
+
+    thread = threading.Thread(target=second)
+    thread.start()
+    assert not acquired.wait(0.05)
+    limit.release()
+    assert acquired.wait(1)
+    limit.release()
+    thread.join()
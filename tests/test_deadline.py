@@ -0,0 +1,131 @@
+"""Tests for per-request deadlines."""
+import time
+import pytest
+from fastapi.testclient import TestClient
+from tenacity import wait_fixed
+from unittest.mock import MagicMock, patch
+from api import app
+from deadline import Deadline, DeadlineExceeded, MIN_ATTEMPT_SECONDS, with_deadline, stop_at_deadline, wait_within_deadline
+
+
+CHUNKS = [{
+    "id": "chunk_1",
+    "text": "Machine learning is a subset of artificial intelligence.",
+    "metadata": {"document_title": "AI Basics", "page": 1},
+    "similarity_score": 0.9
+}]
+
+
+@pytest.fixture
+def client():
+    """Create test client."""
+    return TestClient(app)
+
+
+def test_deadline_remaining_and_check():
+    """Test the remaining budget shrinks and check raises once it is spent."""
+    deadline = Deadline(10)
+    assert 9 < deadline.remaining() <= 10
+    deadline.check("embedding")
+
+    spent = Deadline(0)
+    assert spent.expired()
+    with pytest.raises(DeadlineExceeded) as exc_info:
+        spent.check("llm")
+    assert exc_info.value.stage == "llm"
+
+
+def test_with_deadline_limits_client_timeout():
+    """Test deadline-bound calls get the remaining time and no client retries."""
+    client = MagicMock()
+    assert with_deadline(client, None) is client
+
+    with_deadline(client, Deadline(5))
+    kwargs = client.with_options.call_args.kwargs
+    assert 4 < kwargs["timeout"] <= 5
+    assert kwargs["max_retries"] == 0
+
+
+def test_retry_wait_and_stop_respect_deadline():
+    """Test tenacity waits are capped and retries stop when the budget is spent."""
+    def state(deadline):
+        retry_state = MagicMock()
+        retry_state.kwargs = {"deadline": deadline}
+        return retry_state
+
+    wait = wait_within_deadline(wait_fixed(10))
+    assert wait(state(None)) == 10
+    assert wait(state(Deadline(1))) <= 1 - MIN_ATTEMPT_SECONDS
+
+    stop = stop_at_deadline()
+    assert not stop(state(None))
+    assert not stop(state(Deadline(5)))
+    assert stop(state(Deadline(0)))
+
+
+def test_query_returns_partial_result_when_llm_times_out(client):
+    """Test retrieved passages are returned with partial=true if generation runs out of time."""
+    with patch('api.embedding_service') as mock_emb, \
+         patch('api.vector_store') as mock_store, \
+         patch('api.llm_service') as mock_llm:
+        mock_emb.generate_embedding.return_value = [0.1] * 1536
+        mock_store.search.return_value = CHUNKS
+        mock_llm.generate_answer.side_effect = DeadlineExceeded("llm")
+
+        response = client.post("/query", json={"text": "What is ML?"}, headers={"X-Request-Deadline-Ms": "5000"})
+        repeat = client.post("/query", json={"text": "What is ML?"})
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["partial"] is True
+    assert data["retrieved_chunks"][0]["id"] == "chunk_1"
+    assert data["citations"] == []
+    # Partial answers are not cached
+    assert mock_llm.generate_answer.call_count == 2
+    assert repeat.json()["partial"] is True
+
+    deadline = mock_llm.generate_answer.call_args.kwargs["deadline"]
+    assert isinstance(deadline, Deadline)
+
+
+def test_partial_flag_survives_field_selection(client):
+    """Test a partial answer is flagged even when the client selected other fields."""
+    with patch('api.embedding_service') as mock_emb, \
+         patch('api.vector_store') as mock_store, \
+         patch('api.llm_service') as mock_llm:
+        mock_emb.generate_embedding.return_value = [0.1] * 1536
+        mock_store.search.return_value = CHUNKS
+        mock_llm.generate_answer.side_effect = DeadlineExceeded("llm")
+
+        data = client.post("/query", json={"text": "What is ML?", "fields": ["answer"]}).json()
+
+    assert set(data) == {"answer", "partial"}
+
+
+def test_query_times_out_with_504_when_retrieval_is_too_slow(client):
+    """Test a request whose embedding outlives the deadline fails fast with 504."""
+    def slow_embedding(text, timer=None, deadline=None):
+        time.sleep(1)
+        return [0.1] * 1536
+
+    with patch('api.embedding_service') as mock_emb, \
+         patch('api.vector_store') as mock_store, \
+         patch('api.llm_service') as mock_llm:
+        mock_emb.generate_embedding.side_effect = slow_embedding
+        start = time.perf_counter()
+        response = client.post("/query", json={"text": "What is ML?"}, headers={"X-Request-Deadline-Ms": "300"})
+        elapsed = time.perf_counter() - start
+
+    assert response.status_code == 504
+    assert "embedding" in response.json()["detail"]
+    assert elapsed < 0.9
+    mock_store.search.assert_not_called()
+    mock_llm.generate_answer.assert_not_called()
+
+
+@pytest.mark.parametrize("value", ["soon", "0", "-5"])
+def test_invalid_deadline_header_is_rejected(client, value):
+    """Test malformed deadline headers are a client error."""
+    response = client.post("/query", json={"text": "What is ML?"}, headers={"X-Request-Deadline-Ms": value})
+    assert response.status_code == 400
+    assert "X-Request-Deadline-Ms" in response.json()["detail"]
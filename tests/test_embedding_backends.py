@@ -0,0 +1,139 @@
+"""Tests for local embedding backends."""
+import shutil
+import tempfile
+import numpy as np
+import pytest
+from unittest.mock import patch
+import config
+from document_processor import DocumentProcessor
+from embedding_backends import HashingEmbeddingBackend, LocalEmbeddingBackend, create_backend
+from embeddings import EmbeddingService
+from vector_store import VectorStore
+
+
+@pytest.fixture
+def temp_vector_db():
+    """Create temporary vector database."""
+    temp_dir = tempfile.mkdtemp()
+    with patch.object(config, 'VECTOR_DB_PATH', temp_dir):
+        yield temp_dir
+    shutil.rmtree(temp_dir)
+
+
+def test_hashing_backend_embeds_unit_vectors():
+    """Test hashed vectors are deterministic unit vectors that reflect shared words."""
+    backend = HashingEmbeddingBackend(256)
+    texts = [
+        "Machine learning is a subset of artificial intelligence.",
+        "Machine learning is part of artificial intelligence.",
+        "The invoice is due at the end of the month.",
+        ""
+    ]
+
+    vectors = backend.embed(texts)
+
+    assert vectors.shape == (4, 256)
+    assert vectors.dtype == np.float32
+    np.testing.assert_allclose(np.linalg.norm(vectors[:3], axis=1), 1.0, rtol=1e-5)
+    assert not vectors[3].any()
+    assert vectors[0] @ vectors[1] > vectors[0] @ vectors[2]
+    np.testing.assert_array_equal(vectors, HashingEmbeddingBackend(256).embed(texts))
+
+
+def test_create_backend_rejects_unknown_and_unavailable_backends():
+    """Test misconfigured backends fail with a clear error."""
+    assert create_backend("openai") is None
+    with pytest.raises(ValueError, match="Unknown EMBEDDING_BACKEND"):
+        create_backend("word2vec")
+    with patch.dict("sys.modules", {"sentence_transformers": None}), \
+         pytest.raises(ValueError, match="sentence-transformers"):
+        create_backend("sentence-transformers")
+
+
+def test_local_backend_needs_no_api_key(tmp_path):
+    """Test the hashing backend embeds queries and batches without the OpenAI client."""
+    with patch.object(config, 'OPENAI_API_KEY', None), \
+         patch.object(config, 'EMBEDDING_BACKEND', 'hashing'), \
+         patch.object(config, 'LOCAL_EMBEDDING_BATCH_SIZE', 2), \
+         patch.object(config, 'CHUNK_EMBEDDING_CACHE_PATH', str(tmp_path / "embeddings.db")), \
+         patch('embeddings.OpenAI') as mock_openai:
+        service = EmbeddingService()
+        query = service.generate_embedding("What is machine learning?")
+        chunks = service.generate_chunk_embeddings(["first chunk", "second chunk", "third chunk"])
+
+    mock_openai.assert_not_called()
+    assert query.shape == (HashingEmbeddingBackend.DEFAULT_DIMENSIONS,)
+    assert chunks.shape == (3, HashingEmbeddingBackend.DEFAULT_DIMENSIONS)
+    np.testing.assert_array_equal(chunks[1], HashingEmbeddingBackend().embed(["second chunk"])[0])
+    assert service.chunk_cache.model == "hashing-v1-768"
+
+
+def test_vector_store_records_backend(temp_vector_db):
+    """Test a collection remembers its backend and refuses vectors from another one."""
+    with patch.object(config, 'EMBEDDING_BACKEND', 'hashing'):
+        store = VectorStore()
+        store.add_chunks([{
+            "id": "chunk_1",
+            "text": "Some text",
+            "embedding": HashingEmbeddingBackend().embed(["Some text"])[0],
+            "metadata": {"document_id": "1"}
+        }])
+    assert store.collection.metadata["embedding_backend"] == "hashing"
+
+    with pytest.raises(ValueError, match="--mode reembed"):
+        VectorStore()
+
+
+
+def test_incomplete_backend_cannot_be_created():
+    """Test a backend that does not implement embed() fails on creation, not on first use."""
+    class Incomplete(LocalEmbeddingBackend):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+def test_vector_store_records_local_backend_size(temp_vector_db):
+    """Test local backends record their output size, so a size change is caught at startup."""
+    VectorStore()
+    with patch.object(config, 'EMBEDDING_BACKEND', 'hashing'):
+        # The empty collection is relabelled for the new backend
+        store = VectorStore()
+        assert store.collection.metadata["embedding_backend"] == "hashing"
+        assert store.collection.metadata["embedding_dimensions"] == HashingEmbeddingBackend.DEFAULT_DIMENSIONS
+        store.add_chunks([{
+            "id": "chunk_1",
+            "text": "Some text",
+            "embedding": HashingEmbeddingBackend().embed(["Some text"])[0],
+            "metadata": {"document_id": "1"}
+        }])
+        assert VectorStore().collection.count() == 1
+
+        with patch.object(config, 'EMBEDDING_DIMENSIONS', 256), \
+             pytest.raises(ValueError, match="--mode reembed"):
+            VectorStore()
+
+
+def test_vector_store_records_size_of_first_local_vectors(temp_vector_db):
+    """Test a model whose size is unknown until loaded has it recorded with the first vectors."""
+    with patch.object(config, 'EMBEDDING_BACKEND', 'sentence-transformers'):
+        store = VectorStore()
+        assert "embedding_dimensions" not in store.collection.metadata
+        chunk = {"id": "chunk_1", "text": "Some text", "embedding": np.ones(5, dtype=np.float32), "metadata": {"document_id": "1"}}
+        store.add_chunks([chunk])
+        assert store.collection.metadata["embedding_dimensions"] == 5
+
+        with pytest.raises(ValueError, match="5-dimension"):
+            store.add_chunks([{**chunk, "id": "chunk_2", "embedding": np.ones(6, dtype=np.float32)}])
+
+
+def test_local_backend_chunks_without_tiktoken():
+    """Test ingestion with a local backend never loads the downloadable tiktoken encoding."""
+    text = "  Some words,\n\nsplit into   overlapping chunks. " * 40
+    with patch.object(config, 'EMBEDDING_BACKEND', 'hashing'), \
+         patch("document_processor.tiktoken.get_encoding", side_effect=AssertionError("network")):
+        processor = DocumentProcessor()
+        chunks = processor.chunk_text(text, chunk_size=50, chunk_overlap=0)
+
+    assert len(chunks) > 1
+    assert "".join(chunks) == text
@@ -0,0 +1,166 @@
+"""Tests for the query and chunk embedding caches."""
+import threading
+import numpy as np
+from unittest.mock import MagicMock, patch
+from cache import EmbeddingCache, ChunkEmbeddingCache
+from embeddings import EmbeddingService
+import config
+
+
+def test_lru_keeps_recently_used_entries():
+    """Test a query that keeps being read survives while one-off queries are evicted."""
+    cache = EmbeddingCache(max_size=2)
+    cache.set("hot", [1.0])
+    cache.set("one-off", [2.0])
+    assert cache.get("hot") == [1.0]
+
+    cache.set("another", [3.0])
+
+    assert cache.get("hot") == [1.0]
+    assert cache.get("one-off") is None
+    assert cache.evictions == 1
+
+
+def test_byte_budget_limits_memory():
+    """Test entries are evicted to stay within the memory budget."""
+    vector = np.zeros(256, dtype=np.float32)  # 1 KiB
+    cache = EmbeddingCache(max_size=100, max_bytes=3 * 1024)
+    for i in range(5):
+        cache.set(f"query {i}", vector)
+
+    assert cache.size() == 3
+    assert cache.bytes() == 3 * 1024
+    assert cache.get("query 0") is None
+    assert cache.get("query 4") is not None
+
+    # A vector larger than the whole budget is not cached at all
+    cache.set("huge", np.zeros(1024, dtype=np.float32))
+    assert cache.get("huge") is None
+    assert cache.size() == 3
+
+
+def test_ttl_expiration_is_counted():
+    """Test expired entries miss and are counted separately from evictions."""
+    cache = EmbeddingCache(ttl_seconds=60)
+    with patch("cache.time.time", return_value=1000.0):
+        cache.set("query", [0.1])
+    with patch("cache.time.time", return_value=1061.0):
+        assert cache.get("query") is None
+
+    stats = cache.stats()
+    assert stats["expirations"] == 1
+    assert stats["misses"] == 1
+    assert stats["evictions"] == 0
+    assert stats["size"] == 0
+    assert stats["bytes"] == 0
+
+
+def test_query_text_is_normalized():
+    """Test whitespace and case differences share one entry."""
+    cache = EmbeddingCache()
+    cache.set("What is   Machine Learning?", [0.5])
+
+    assert cache.get("  what is machine learning? ") == [0.5]
+    assert cache.size() == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_concurrent_access_keeps_cache_consistent():
+    """Test concurrent readers and writers never exceed limits or corrupt accounting."""
+    cache = EmbeddingCache(max_size=50)
+    errors = []
+
+    def worker(offset):
+        try:
+            for i in range(500):
+                key = f"query {(offset + i) % 80}"
+                if cache.get(key) is None:
+                    cache.set(key, [float(i)])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(n * 7,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert cache.size() <= 50
+    assert cache.bytes() == sum(entry["bytes"] for entry in cache.cache.values())
+    assert cache.hits + cache.misses == 8 * 500
+
+
+def test_chunk_cache_persists_across_instances(tmp_path):
+    """Test stored chunk embeddings survive a restart and are keyed by model."""
+    path = str(tmp_path / "embeddings.db")
+    cache = ChunkEmbeddingCache(path, "model-a")
+    cache.set_many(["first chunk", "second chunk"], np.array([[1.0, 2.0], [3.0, 4.0]], dtype=np.float32))
+    cache.close()
+
+    reopened = ChunkEmbeddingCache(path, "model-a")
+    vectors = reopened.get_many(["second chunk", "new chunk", "first chunk"])
+    assert vectors[0].tolist() == [3.0, 4.0]
+    assert vectors[1] is None
+    assert vectors[2].dtype == np.float32
+    assert reopened.stats()["hit_ratio"] == 2 / 3
+
+    assert ChunkEmbeddingCache(path, "model-b").get_many(["first chunk"]) == [None]
+
+
+def test_chunk_cache_evicts_least_recently_used(tmp_path):
+    """Test entry and byte limits evict the entries read or written longest ago."""
+    vector = np.zeros(4, dtype=np.float32)  # 16 bytes
+    cache = ChunkEmbeddingCache(str(tmp_path / "embeddings.db"), "model", max_entries=3, max_bytes=40)
+    with patch("cache.time.time", side_effect=[1.0, 2.0, 3.0]):
+        cache.set_many(["a"], [vector])
+        cache.set_many(["b"], [vector])
+        cache.get_many(["a"])
+    with patch("cache.time.time", return_value=4.0):
+        cache.set_many(["c"], [vector])
+
+    stats = cache.stats()
+    assert stats["size"] == 2
+    assert stats["bytes"] == 32
+    assert stats["evictions"] == 1
+    assert [v is not None for v in cache.get_many(["a", "b", "c"])] == [True, False, True]
+
+
+def test_chunk_cache_tracks_size_without_rescanning(tmp_path):
+    """Test running totals account for replaced and duplicate entries and are restored on reopen."""
+    path = str(tmp_path / "embeddings.db")
+    vector = np.zeros(4, dtype=np.float32)  # 16 bytes
+    cache = ChunkEmbeddingCache(path, "model", max_entries=3)
+    cache.set_many(["a", "b", "a"], [vector, vector, vector])
+    cache.set_many(["b", "c"], [vector, np.zeros(8, dtype=np.float32)])
+    assert (cache.stats()["size"], cache.stats()["bytes"]) == (3, 64)
+    cache.close()
+
+    reopened = ChunkEmbeddingCache(path, "model", max_entries=3)
+    reopened.set_many(["d"], [vector])
+    stats = reopened.stats()
+    assert (stats["size"], stats["bytes"], stats["evictions"]) == (3, 64, 1)
+
+
+def test_chunk_embeddings_only_embed_cache_misses(tmp_path):
+    """Test re-embedding a document only sends chunks whose text changed upstream."""
+    with patch.object(config, 'OPENAI_API_KEY', 'sk-test'), \
+         patch.object(config, 'CHUNK_EMBEDDING_CACHE_PATH', str(tmp_path / "embeddings.db")), \
+         patch('embeddings.OpenAI') as mock_openai:
+        mock_client = MagicMock()
+        mock_openai.return_value = mock_client
+
+        def create(model, input, **kwargs):
+            response = MagicMock()
+            response.data = [MagicMock(embedding=[float(len(text)), 1.0]) for text in input]
+            return response
+        mock_client.embeddings.create.side_effect = create
+
+        service = EmbeddingService()
+        service.generate_chunk_embeddings(["one", "three"])
+        embeddings = service.generate_chunk_embeddings(["one", "seven", "three"])
+
+    assert mock_client.embeddings.create.call_args.kwargs["input"] == ["seven"]
+    assert mock_client.embeddings.create.call_count == 2
+    assert embeddings.dtype == np.float32
+    assert embeddings[:, 0].tolist() == [3.0, 5.0, 5.0]
@@ -1,7 +1,16 @@
 """Tests for embedding service."""
+import base64
+import numpy as np
 import pytest
+from tenacity import wait_none
+from unittest.mock import MagicMock, patch
+from openai import InternalServerError, RateLimitError
+import threading
+import time
 from embeddings import EmbeddingService
 import config
+from metrics import EMBEDDING_INPUTS_DEDUPLICATED
+from rate_governor import INTERACTIVE, BULK
 
 
 @pytest.fixture
@@ -15,9 +24,9 @@ def test_generate_embedding(embedding_service):
     text = "This is a test query"
     embedding = embedding_service.generate_embedding(text)
     
-    assert isinstance(embedding, list), "Embedding should be a list"
+    assert isinstance(embedding, np.ndarray), "Embedding should be an array"
     assert len(embedding) > 0, "Embedding should have dimensions"
-    assert all(isinstance(x, (int, float)) for x in embedding), "All values should be numbers"
+    assert embedding.dtype == np.float32, "Embedding should be float32"
 
 
 def test_generate_embeddings_batch(embedding_service):
@@ -25,15 +34,189 @@ def test_generate_embeddings_batch(embedding_service):
     texts = ["First text", "Second text", "Third text"]
     embeddings = embedding_service.generate_embeddings_batch(texts)
     
-    assert len(embeddings) == len(texts), "Should generate one embedding per text"
-    assert all(len(emb) > 0 for emb in embeddings), "All embeddings should have dimensions"
+    assert embeddings.shape[0] == len(texts), "Should generate one embedding per text"
+    assert embeddings.shape[1] > 0, "All embeddings should have dimensions"
+    assert embeddings.dtype == np.float32, "Embeddings should be float32"
     
     # Check that embeddings are different
-    assert embeddings[0] != embeddings[1], "Different texts should produce different embeddings"
+    assert not np.array_equal(embeddings[0], embeddings[1]), "Different texts should produce different embeddings"
 
 
 def test_generate_embeddings_batch_empty(embedding_service):
     """Test batch embedding with empty list."""
     embeddings = embedding_service.generate_embeddings_batch([])
-    assert embeddings == [], "Empty list should return empty list"
+    assert len(embeddings) == 0, "Empty list should return no embeddings"
 
+
+
+def test_base64_embeddings_are_decoded_to_float32():
+    """Test base64 responses are requested and decoded, with JSON floats as a fallback."""
+    vectors = np.array([[0.5, -1.0, 2.0], [0.25, 0.0, -0.75]], dtype="<f4")
+    
+    with patch.object(config, 'OPENAI_API_KEY', 'sk-test'), \
+         patch('embeddings.OpenAI') as mock_openai:
+        mock_client = MagicMock()
+        mock_openai.return_value = mock_client
+        response = MagicMock()
+        response.data = [
+            MagicMock(embedding=base64.b64encode(vectors[0].tobytes()).decode()),
+            MagicMock(embedding=vectors[1].tolist())
+        ]
+        mock_client.embeddings.create.return_value = response
+        
+        embeddings = EmbeddingService(use_cache=False).generate_embeddings_batch(["a", "b"])
+    
+    assert mock_client.embeddings.create.call_args.kwargs["encoding_format"] == "base64"
+    assert embeddings.dtype == np.float32
+    assert embeddings.flags["C_CONTIGUOUS"]
+    np.testing.assert_array_equal(embeddings, vectors)
+
+
+class WordTokenizer:
+    """Stand-in encoder with one token per whitespace-separated word."""
+
+    def encode_batch(self, texts, disallowed_special=()):
+        return [text.split() for text in texts]
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+@pytest.fixture
+def mocked_service():
+    """EmbeddingService whose client embeds each input as [number of words]."""
+    with patch.object(config, 'OPENAI_API_KEY', 'sk-test'), \
+         patch('embeddings.OpenAI') as mock_openai, \
+         patch('embeddings._tokenizer', return_value=WordTokenizer()):
+        mock_client = MagicMock()
+        mock_openai.return_value = mock_client
+
+        def create(model, input, **kwargs):
+            response = MagicMock()
+            response.data = [MagicMock(embedding=[float(len(text.split()))]) for text in input]
+            return response
+        mock_client.embeddings.create.side_effect = create
+
+        yield EmbeddingService(use_cache=False), mock_client
+
+
+def test_batch_is_split_within_request_limits(mocked_service):
+    """Test inputs are packed into requests under the input and token caps, in order."""
+    service, mock_client = mocked_service
+    texts = [f"w{i} " * n for i, n in enumerate((3, 3, 3, 1, 1, 1, 1, 20))]
+
+    with patch.object(config, 'EMBEDDING_REQUEST_MAX_INPUTS', 3), \
+         patch.object(config, 'EMBEDDING_REQUEST_MAX_TOKENS', 7), \
+         patch.object(config, 'EMBEDDING_INPUT_MAX_TOKENS', 5):
+        embeddings = service.generate_embeddings_batch(texts)
+
+    requests = [call.kwargs["input"] for call in mock_client.embeddings.create.call_args_list]
+    assert sorted(len(r) for r in requests) == [2, 3, 3]
+    # The over-long input was truncated to the per-input limit
+    assert embeddings[:, 0].tolist() == [3, 3, 3, 1, 1, 1, 1, 5]
+
+
+def test_small_batch_is_sent_without_tokenizing(mocked_service):
+    """Test a batch that clearly fits in one request skips the tokenizer."""
+    service, mock_client = mocked_service
+
+    with patch('embeddings._tokenizer') as tokenizer:
+        service.generate_embeddings_batch(["one", "two words"])
+
+    tokenizer.assert_not_called()
+    assert mock_client.embeddings.create.call_count == 1
+
+
+def test_failed_sub_batch_is_retried_alone(mocked_service):
+    """Test a transient failure only resends the request that failed."""
+    service, mock_client = mocked_service
+    create = mock_client.embeddings.create.side_effect
+    failures = [InternalServerError("overloaded", response=MagicMock(status_code=500), body=None)]
+
+    def flaky(model, input, **kwargs):
+        if input == ["c c c"] and failures:
+            raise failures.pop()
+        return create(model, input, **kwargs)
+    mock_client.embeddings.create.side_effect = flaky
+
+    with patch.object(config, 'EMBEDDING_REQUEST_MAX_INPUTS', 1), \
+         patch.object(EmbeddingService._generate_embeddings_batch_with_retry.retry, 'wait', wait_none()):
+        embeddings = service.generate_embeddings_batch(["a", "b b", "c c c"])
+
+    requests = sorted(call.kwargs["input"] for call in mock_client.embeddings.create.call_args_list)
+    assert requests == [["a"], ["b b"], ["c c c"], ["c c c"]]
+    assert embeddings[:, 0].tolist() == [1, 2, 3]
+
+
+def test_sub_batches_are_sent_in_parallel(mocked_service):
+    """Test split requests overlap in time up to the concurrency cap, keeping output order."""
+    service, mock_client = mocked_service
+    create = mock_client.embeddings.create.side_effect
+    lock = threading.Lock()
+    active = [0]
+    peak = [0]
+
+    def slow(model, input, **kwargs):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        return create(model, input, **kwargs)
+    mock_client.embeddings.create.side_effect = slow
+    texts = [f"w{i} " * (i % 5 + 1) for i in range(12)]
+
+    with patch.object(config, 'EMBEDDING_REQUEST_MAX_INPUTS', 1):
+        embeddings = service.generate_embeddings_batch(texts)
+
+    assert embeddings[:, 0].tolist() == [i % 5 + 1 for i in range(12)]
+    assert 1 < peak[0] <= config.EMBEDDING_REQUEST_CONCURRENCY
+
+
+def test_rate_limited_requests_lower_concurrency(mocked_service):
+    """Test a 429 halves the request concurrency limit before the request is retried."""
+    service, mock_client = mocked_service
+    create = mock_client.embeddings.create.side_effect
+    failures = [RateLimitError("slow down", response=MagicMock(status_code=429), body=None)]
+
+    def limited(model, input, **kwargs):
+        if failures:
+            raise failures.pop()
+        return create(model, input, **kwargs)
+    mock_client.embeddings.create.side_effect = limited
+    start_limit = service._request_limit.limit
+
+    with patch.object(EmbeddingService._generate_embeddings_batch_with_retry.retry, 'wait', wait_none()):
+        embeddings = service.generate_embeddings_batch(["a", "b b"])
+
+    assert embeddings[:, 0].tolist() == [1, 2]
+    assert service._request_limit.limit < start_limit
+
+
+def test_identical_texts_are_embedded_once(mocked_service):
+    """Test repeated chunk texts are sent once and the vector is shared by every copy."""
+    service, mock_client = mocked_service
+    saved_before = EMBEDDING_INPUTS_DEDUPLICATED.get()
+    texts = ["header", "body text", "header", "footer page", "header", "body text"]
+
+    embeddings = service.generate_embeddings_batch(texts)
+
+    assert mock_client.embeddings.create.call_args.kwargs["input"] == ["header", "body text", "footer page"]
+    assert embeddings.shape == (6, 1)
+    assert embeddings[:, 0].tolist() == [1, 2, 1, 2, 1, 2]
+    assert EMBEDDING_INPUTS_DEDUPLICATED.get() - saved_before == 3
+
+
+def test_batch_priority_reaches_the_rate_governor(mocked_service):
+    """Test batches default to bulk priority and query batches can ask for interactive."""
+    service, _ = mocked_service
+
+    with patch('embeddings.governor') as governor, \
+         patch.object(config, 'EMBEDDING_REQUEST_MAX_INPUTS', 1):
+        service.generate_chunk_embeddings(["first chunk", "second chunk"])
+        assert [call.args[2] for call in governor.acquire.call_args_list] == [BULK, BULK]
+
+        governor.acquire.reset_mock()
+        service.generate_embeddings_batch(["first?", "second?"], INTERACTIVE)
+        assert [call.args[2] for call in governor.acquire.call_args_list] == [INTERACTIVE, INTERACTIVE]
@@ -1,4 +1,5 @@
 """Tests for error handling across the system."""
+import numpy as np
 import pytest
 from fastapi.testclient import TestClient
 from api import app
@@ -162,5 +163,5 @@ def test_embedding_service_with_cache():
         # Second call - should use cache
         embedding2 = service.generate_embedding("test query")
         assert mock_client.embeddings.create.call_count == 1  # No additional call
-        assert embedding1 == embedding2
+        assert np.array_equal(embedding1, embedding2)
 
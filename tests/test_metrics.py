@@ -0,0 +1,89 @@
+"""Tests for the Prometheus metrics endpoint."""
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch, MagicMock
+from api import app
+from metrics import Counter, Gauge, Histogram, OPENAI_CALLS, OPENAI_ERRORS, OPENAI_RETRIES
+from embeddings import EmbeddingService
+import config
+
+
+@pytest.fixture
+def client():
+    """Create test client."""
+    return TestClient(app)
+
+
+def test_counter_and_gauge_render():
+    """Test counters and gauges render in exposition format."""
+    calls = Counter("test_calls_total", "Test calls", ("service",))
+    calls.inc(service="a")
+    calls.inc(2, service="a")
+    assert 'test_calls_total{service="a"} 3' in calls.render()
+    assert "# TYPE test_calls_total counter" in calls.render()
+
+    size = Gauge("test_size", "Test size", callback=lambda: {(): 7})
+    assert "test_size 7" in size.render()
+
+    with pytest.raises(ValueError):
+        calls.inc(other="x")
+
+
+def test_histogram_cumulative_buckets():
+    """Test histogram buckets are cumulative with sum and count."""
+    latency = Histogram("test_latency_seconds", "Test latency", ("route",), buckets=(0.1, 1.0))
+    latency.observe(0.05, route="/q")
+    latency.observe(0.5, route="/q")
+    latency.observe(5.0, route="/q")
+
+    text = latency.render()
+    assert 'test_latency_seconds_bucket{route="/q",le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{route="/q",le="1"} 2' in text
+    assert 'test_latency_seconds_bucket{route="/q",le="+Inf"} 3' in text
+    assert 'test_latency_seconds_count{route="/q"} 3' in text
+
+
+def test_metrics_endpoint_exposes_route_and_stage_latency(client):
+    """Test /metrics includes per-route and per-stage histograms."""
+    with patch('api.embedding_service') as mock_emb, \
+         patch('api.vector_store') as mock_store:
+        mock_emb.generate_embedding.return_value = [0.1] * 1536
+        mock_store.search.return_value = []
+        client.post("/query", json={"text": "metrics query"})
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert 'rag_http_request_duration_seconds_count{method="POST",route="/query",status="200"}' in text
+    assert 'rag_stage_duration_seconds_bucket{stage="embedding"' in text
+    assert "# TYPE rag_http_requests_in_flight gauge" in text
+    assert "# TYPE rag_openai_calls_total counter" in text
+
+
+def test_embedding_service_counts_calls_and_retries():
+    """Test OpenAI calls, retries and errors are counted by service."""
+    from openai import APIConnectionError
+
+    calls_before = OPENAI_CALLS.get(service="embedding")
+    errors_before = OPENAI_ERRORS.get(service="embedding")
+    retries_before = OPENAI_RETRIES.get(service="embedding")
+
+    with patch.object(config, 'OPENAI_API_KEY', 'sk-test'), \
+         patch('embeddings.OpenAI') as mock_openai, \
+         patch('tenacity.nap.time.sleep'):
+        mock_client = MagicMock()
+        mock_openai.return_value = mock_client
+        mock_response = MagicMock()
+        mock_response.data = [MagicMock(embedding=[0.1] * 8)]
+        mock_client.embeddings.create.side_effect = [
+            APIConnectionError(request=MagicMock()),
+            mock_response
+        ]
+
+        service = EmbeddingService(use_cache=False)
+        service.generate_embedding("retry me")
+
+    assert OPENAI_CALLS.get(service="embedding") - calls_before == 2
+    assert OPENAI_ERRORS.get(service="embedding") - errors_before == 1
+    assert OPENAI_RETRIES.get(service="embedding") - retries_before == 1
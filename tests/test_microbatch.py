@@ -0,0 +1,133 @@
+"""Tests for micro-batching of concurrent calls."""
+import threading
+import time
+import pytest
+from unittest.mock import MagicMock, patch
+from concurrency import MicroBatcher, BATCH_SIZE, BATCH_WAIT
+from deadline import Deadline, DeadlineExceeded
+from embeddings import EmbeddingService
+import config
+
+
+def run_concurrently(func, args_list):
+    """Call func once per argument tuple from separate threads; return results in order."""
+    results = [None] * len(args_list)
+
+    def call(index, args):
+        try:
+            results[index] = func(*args)
+        except Exception as e:
+            results[index] = e
+
+    threads = [threading.Thread(target=call, args=(i, args)) for i, args in enumerate(args_list)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_microbatcher_combines_concurrent_calls():
+    """Test concurrent submissions become one call and results are routed back."""
+    calls = []
+
+    def double(items):
+        calls.append(list(items))
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher("test_combine", double, max_batch_size=100, max_wait_seconds=0.1)
+    results = run_concurrently(batcher.submit, [(i,) for i in range(5)])
+
+    assert results == [0, 2, 4, 6, 8]
+    assert len(calls) == 1
+    assert sorted(calls[0]) == [0, 1, 2, 3, 4]
+    assert BATCH_SIZE.count(batcher="test_combine") == 1
+    assert BATCH_WAIT.count(batcher="test_combine") == 5
+
+
+def test_microbatcher_sends_full_batch_without_waiting():
+    """Test a batch is sent as soon as it reaches max_batch_size."""
+    calls = []
+    batcher = MicroBatcher("test_full", lambda items: calls.append(len(items)) or items, max_batch_size=2, max_wait_seconds=5)
+
+    start = time.perf_counter()
+    results = run_concurrently(batcher.submit, [("a",), ("b",)])
+
+    assert time.perf_counter() - start < 1
+    assert sorted(results) == ["a", "b"]
+    assert calls == [2]
+
+
+def test_microbatcher_shares_errors():
+    """Test a failed batch fails every caller in it."""
+    def fail(items):
+        raise ValueError("upstream failed")
+
+    batcher = MicroBatcher("test_error", fail, max_batch_size=10, max_wait_seconds=0.05)
+    results = run_concurrently(batcher.submit, [(1,), (2,)])
+
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+@pytest.fixture
+def service_and_client():
+    """EmbeddingService with a mocked OpenAI client returning one vector per input."""
+    with patch.object(config, 'OPENAI_API_KEY', 'sk-test'), \
+         patch.object(config, 'EMBEDDING_BATCH_MAX_WAIT_MS', 50), \
+         patch('embeddings.OpenAI') as mock_openai:
+        mock_client = MagicMock()
+        mock_openai.return_value = mock_client
+
+        def create(model, input, **kwargs):
+            response = MagicMock()
+            response.data = [MagicMock(embedding=[float(len(text))]) for text in input]
+            return response
+        mock_client.embeddings.create.side_effect = create
+        mock_client.with_options.return_value = mock_client
+
+        yield EmbeddingService(use_cache=False), mock_client
+
+
+def test_concurrent_query_embeddings_share_one_request(service_and_client):
+    """Test different texts embedded concurrently go out as one batched request."""
+    service, mock_client = service_and_client
+    texts = ["a", "bb", "ccc", "dddd"]
+
+    results = run_concurrently(service.generate_embedding, [(text,) for text in texts])
+
+    assert [result.tolist() for result in results] == [[1.0], [2.0], [3.0], [4.0]]
+    assert mock_client.embeddings.create.call_count == 1
+    assert sorted(mock_client.embeddings.create.call_args.kwargs["input"]) == texts
+
+
+def test_batched_request_uses_most_patient_deadline(service_and_client):
+    """Test the shared request is bounded by the latest deadline among its callers."""
+    service, mock_client = service_and_client
+    short, long = Deadline(5), Deadline(30)
+
+    run_concurrently(service.generate_embedding, [("a", None, short), ("bb", None, long)])
+
+    assert mock_client.embeddings.create.call_count == 1
+    assert mock_client.with_options.call_args.kwargs["timeout"] > 5
+
+
+def test_waiting_caller_gives_up_at_its_deadline():
+    """Test a caller waiting on another caller's batch stops at its own deadline."""
+    release = threading.Event()
+
+    def slow(items):
+        release.wait(5)
+        return items
+
+    batcher = MicroBatcher("test_deadline", slow, max_batch_size=2, max_wait_seconds=1)
+    with patch.object(config, 'OPENAI_API_KEY', 'sk-test'), patch('embeddings.OpenAI'):
+        service = EmbeddingService(use_cache=False)
+    service._batcher = batcher
+
+    leader = threading.Thread(target=batcher.submit, args=(("leader", None),))
+    leader.start()
+    time.sleep(0.05)
+    with pytest.raises(DeadlineExceeded):
+        service.generate_embedding("follower", deadline=Deadline(0.3))
+    release.set()
+    leader.join()
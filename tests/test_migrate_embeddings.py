@@ -0,0 +1,131 @@
+"""Tests for reduced-dimension embeddings and the index migration tool."""
+import shutil
+import tempfile
+import numpy as np
+import pytest
+from unittest.mock import MagicMock, patch
+import config
+from embeddings import EmbeddingService
+from migrate_embeddings import migrate, truncate_vectors, PREVIOUS_NAME
+from vector_store import VectorStore, COLLECTION_NAME
+
+
+@pytest.fixture
+def temp_vector_db():
+    """Create temporary vector database."""
+    temp_dir = tempfile.mkdtemp()
+    with patch.object(config, 'VECTOR_DB_PATH', temp_dir):
+        yield temp_dir
+    shutil.rmtree(temp_dir)
+
+
+def fill_store(count=30, dim=16):
+    """Add random unit-vector chunks to a fresh full-size store."""
+    store = VectorStore()
+    vectors = np.random.default_rng(0).normal(size=(count, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    store.add_chunks([
+        {
+            "id": f"chunk_{i}",
+            "text": f"Chunk number {i}",
+            "embedding": vectors[i],
+            "metadata": {"document_id": "1", "page": i}
+        }
+        for i in range(count)
+    ])
+    return store
+
+
+def test_truncate_vectors_renormalizes():
+    """Test shortened vectors keep their leading components at unit length."""
+    vectors = np.array([[3.0, 4.0, 12.0], [0.0, 0.0, 1.0]], dtype=np.float32)
+    shortened = truncate_vectors(vectors, 2)
+
+    assert shortened.dtype == np.float32
+    np.testing.assert_allclose(shortened[0], [0.6, 0.8], rtol=1e-6)
+    # A prefix of zeros stays zero instead of dividing by zero
+    np.testing.assert_array_equal(shortened[1], [0.0, 0.0])
+
+
+def test_dimensions_are_requested_and_part_of_chunk_cache_key(tmp_path):
+    """Test the configured size is sent upstream and cached chunk vectors are kept apart per size."""
+    with patch.object(config, 'OPENAI_API_KEY', 'sk-test'), \
+         patch.object(config, 'CHUNK_EMBEDDING_CACHE_PATH', str(tmp_path / "embeddings.db")), \
+         patch('embeddings.OpenAI') as mock_openai:
+        mock_client = MagicMock()
+        mock_openai.return_value = mock_client
+        mock_client.embeddings.create.side_effect = lambda model, input, **kwargs: MagicMock(
+            data=[MagicMock(embedding=[1.0] * (kwargs["extra_body"] or {}).get("dimensions", 4)) for _ in input]
+        )
+
+        assert EmbeddingService().generate_chunk_embeddings(["text"]).shape == (1, 4)
+        reduced = EmbeddingService(dimensions=2).generate_chunk_embeddings(["text"])
+
+    assert mock_client.embeddings.create.call_args.kwargs["extra_body"] == {"dimensions": 2}
+    assert reduced.shape == (1, 2)
+    assert mock_client.embeddings.create.call_count == 2
+
+
+def test_migrate_truncates_and_swaps_collection(temp_vector_db):
+    """Test the index is rebuilt at the new size and reopens under the new configuration."""
+    fill_store()
+
+    report = migrate(8, sample_size=10, keep_previous=True)
+
+    assert report["chunks"] == 30
+    assert report["queries"] == 10
+    assert 0.0 <= report["recall_at_k"] <= 1.0
+    assert report["old"]["p95_ms"] >= 0 and report["new"]["mean_ms"] >= 0
+
+    with pytest.raises(ValueError, match="EMBEDDING_DIMENSIONS"):
+        VectorStore()
+    with patch.object(config, 'EMBEDDING_DIMENSIONS', 8):
+        store = VectorStore()
+    assert store.collection.metadata["embedding_dimensions"] == 8
+    stored = store.collection.get(ids=["chunk_3"], include=["embeddings", "documents"])
+    assert len(stored["embeddings"][0]) == 8
+    assert stored["documents"] == ["Chunk number 3"]
+    assert store.client.get_collection(PREVIOUS_NAME).count() == 30
+
+
+def test_migrate_dry_run_keeps_current_index(temp_vector_db):
+    """Test a dry run reports a comparison without replacing the index."""
+    store = fill_store()
+
+    report = migrate(8, sample_size=5, dry_run=True)
+
+    assert report["queries"] == 5
+    collection = store.client.get_collection(COLLECTION_NAME)
+    assert "embedding_dimensions" not in collection.metadata
+    assert [c.name for c in store.client.list_collections()] == [COLLECTION_NAME]
+
+
+def test_migrate_reembeds_chunk_texts(temp_vector_db):
+    """Test reembed mode embeds stored chunk texts at the new size."""
+    fill_store(count=5)
+    service = MagicMock(dimensions=4, backend_name="openai", backend=None)
+    service.generate_chunk_embeddings.side_effect = lambda texts: np.ones((len(texts), 4), dtype=np.float32)
+
+    with patch('migrate_embeddings.EmbeddingService', return_value=service) as mock_service:
+        report = migrate(4, mode="reembed", sample_size=3)
+
+    mock_service.assert_called_once_with(dimensions=4)
+    texts = service.generate_chunk_embeddings.call_args.args[0]
+    assert sorted(texts) == sorted(f"Chunk number {i}" for i in range(5))
+    assert report["chunks"] == 5
+
+
+def test_empty_collection_adopts_new_size(temp_vector_db):
+    """Test an empty index opened under a new size keeps the vectors ingested next."""
+    VectorStore()
+    with patch.object(config, 'EMBEDDING_DIMENSIONS', 8):
+        store = VectorStore()
+        assert store.collection.metadata["embedding_dimensions"] == 8
+        store.add_chunks([{
+            "id": "chunk_1",
+            "text": "Some text",
+            "embedding": np.ones(8, dtype=np.float32),
+            "metadata": {"document_id": "1"}
+        }])
+        # Restarting with the same setting must accept what was just written
+        assert VectorStore().collection.count() == 1
@@ -0,0 +1,109 @@
+"""Tests for the batch query endpoint."""
+import pytest
+from fastapi.testclient import TestClient
+from api import app
+from unittest.mock import patch
+import config
+from rate_governor import INTERACTIVE
+
+
+def make_chunk(chunk_id, score):
+    """Build a retrieved chunk."""
+    return {
+        "id": chunk_id,
+        "text": f"Text of {chunk_id}",
+        "metadata": {"document_title": "Doc", "page": 1},
+        "similarity_score": score
+    }
+
+
+@pytest.fixture
+def client():
+    """Create test client."""
+    return TestClient(app)
+
+
+def test_query_batch_single_embedding_and_search_call(client):
+    """Test all queries share one embeddings call and one search call."""
+    with patch('api.embedding_service') as mock_emb, \
+         patch('api.vector_store') as mock_store, \
+         patch('api.llm_service') as mock_llm:
+        mock_emb.generate_embeddings_batch.return_value = [[0.1] * 1536, [0.2] * 1536]
+        mock_store.search_batch.return_value = [
+            [make_chunk("a", 0.9)],
+            [make_chunk("b", 0.8)]
+        ]
+        mock_llm.generate_answer.side_effect = lambda query, chunks: {
+            "answer": f"Answer to {query} [1]",
+            "citations": [{"id": chunks[0]["id"]}]
+        }
+
+        response = client.post("/query/batch", json={"queries": ["first?", "second?"]})
+
+        assert response.status_code == 200
+        mock_emb.generate_embeddings_batch.assert_called_once_with(["first?", "second?"], INTERACTIVE)
+        mock_store.search_batch.assert_called_once()
+        mock_emb.generate_embedding.assert_not_called()
+        mock_store.search.assert_not_called()
+
+    data = response.json()
+    assert data["total"] == 2
+    assert data["succeeded"] == 2
+    assert [r["index"] for r in data["results"]] == [0, 1]
+    assert data["results"][0]["answer"] == "Answer to first? [1]"
+    assert data["results"][1]["citations"][0]["id"] == "b"
+
+
+def test_query_batch_per_item_errors(client):
+    """Test empty queries and LLM failures only fail their own item."""
+    def answer(query, chunks):
+        if query == "bad?":
+            raise ValueError("LLM API Error")
+        return {"answer": "ok", "citations": []}
+
+    with patch('api.embedding_service') as mock_emb, \
+         patch('api.vector_store') as mock_store, \
+         patch('api.llm_service') as mock_llm:
+        mock_emb.generate_embeddings_batch.return_value = [[0.1] * 1536, [0.2] * 1536]
+        mock_store.search_batch.return_value = [[make_chunk("a", 0.9)], [make_chunk("b", 0.9)]]
+        mock_llm.generate_answer.side_effect = answer
+
+        response = client.post("/query/batch", json={"queries": ["good?", "  ", "bad?"]})
+
+        mock_emb.generate_embeddings_batch.assert_called_once_with(["good?", "bad?"], INTERACTIVE)
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert results[0]["success"] is True
+    assert results[1]["success"] is False
+    assert "empty" in results[1]["error"].lower()
+    assert results[2]["success"] is False
+    assert "LLM API Error" in results[2]["error"]
+    assert results[2]["retrieved_chunks"][0]["id"] == "b"
+    assert response.json()["succeeded"] == 1
+
+
+def test_query_batch_low_similarity_skips_llm(client):
+    """Test items with no relevant chunks do not call the LLM."""
+    with patch('api.embedding_service') as mock_emb, \
+         patch('api.vector_store') as mock_store, \
+         patch('api.llm_service') as mock_llm:
+        mock_emb.generate_embeddings_batch.return_value = [[0.1] * 1536]
+        mock_store.search_batch.return_value = [[make_chunk("a", 0.1)]]
+
+        response = client.post("/query/batch", json={"queries": ["vague?"]})
+
+        mock_llm.generate_answer.assert_not_called()
+
+    result = response.json()["results"][0]
+    assert result["success"] is True
+    assert "relevance is low" in result["answer"].lower()
+
+
+def test_query_batch_validation(client):
+    """Test empty and oversized batches are rejected."""
+    assert client.post("/query/batch", json={"queries": []}).status_code == 400
+
+    with patch.object(config, 'BATCH_QUERY_MAX_SIZE', 2):
+        response = client.post("/query/batch", json={"queries": ["a", "b", "c"]})
+    assert response.status_code == 400
@@ -0,0 +1,115 @@
+"""Tests for /query response shaping and compression."""
+import pytest
+from fastapi.testclient import TestClient
+from api import app
+from unittest.mock import patch
+
+
+CHUNKS = [
+    {
+        "id": f"chunk_{i}",
+        "text": "Machine learning is a subset of artificial intelligence. " * 10,
+        "metadata": {"document_title": "AI Basics", "page": i},
+        "similarity_score": 0.9
+    }
+    for i in range(1, 4)
+]
+
+ANSWER = {
+    "answer": "ML is a subset of AI [1].",
+    "citations": [{
+        "id": "chunk_1",
+        "document_title": "AI Basics",
+        "page": 1,
+        "text": CHUNKS[0]["text"],
+        "similarity_score": 0.9
+    }]
+}
+
+
+@pytest.fixture
+def client():
+    """Create test client."""
+    return TestClient(app)
+
+
+def run_query(client, body, **kwargs):
+    """POST /query with mocked services."""
+    with patch('api.embedding_service') as mock_emb, \
+         patch('api.vector_store') as mock_store, \
+         patch('api.llm_service') as mock_llm:
+        mock_emb.generate_embedding.return_value = [0.1] * 1536
+        mock_store.search.return_value = CHUNKS
+        mock_llm.generate_answer.return_value = ANSWER
+        return client.post("/query", json=body, **kwargs)
+
+
+def test_default_response_is_complete(client):
+    """Test the default response keeps every field and full text."""
+    data = run_query(client, {"text": "What is ML?"}).json()
+    assert set(data) == {"answer", "citations", "retrieved_chunks", "latency_ms", "partial", "timings"}
+    assert data["citations"][0]["text"] == CHUNKS[0]["text"]
+    assert data["retrieved_chunks"][0]["text"] == CHUNKS[0]["text"]
+
+
+def test_field_selection_and_citation_references(client):
+    """Test compact mode returns only the answer and text-free citations."""
+    response = run_query(client, {
+        "text": "What is ML?",
+        "fields": ["answer", "citations"],
+        "citation_text": False
+    })
+    assert response.status_code == 200
+    assert "Server-Timing" in response.headers
+    data = response.json()
+    assert set(data) == {"answer", "citations"}
+    assert "text" not in data["citations"][0]
+    assert data["citations"][0]["id"] == "chunk_1"
+
+
+def test_snippet_truncation_leaves_cache_untouched(client):
+    """Test snippets are truncated without modifying the cached answer."""
+    data = run_query(client, {"text": "Truncate please", "snippet_chars": 20}).json()
+    assert len(data["retrieved_chunks"][0]["text"]) <= 23
+    assert data["citations"][0]["text"].endswith("...")
+
+    # Same question again is served from the answer cache with full text
+    data = run_query(client, {"text": "Truncate please"}).json()
+    assert data["timings"]["answer_cached"] is True
+    assert data["citations"][0]["text"] == CHUNKS[0]["text"]
+
+
+def test_unknown_field_rejected(client):
+    """Test unknown field names are a 400."""
+    response = client.post("/query", json={"text": "What?", "fields": ["answer", "bogus"]})
+    assert response.status_code == 400
+    assert "bogus" in response.json()["detail"]
+
+
+def test_gzip_negotiation(client):
+    """Test large JSON responses are gzipped when the client accepts it."""
+    response = run_query(client, {"text": "Compress me"}, headers={"Accept-Encoding": "gzip"})
+    assert response.headers.get("content-encoding") == "gzip"
+    assert response.json()["answer"] == ANSWER["answer"]
+
+
+def test_event_stream_not_gzipped(client):
+    """Test SSE responses bypass compression so tokens are not buffered."""
+    with patch('api.embedding_service') as mock_emb, \
+         patch('api.vector_store') as mock_store, \
+         patch('api.llm_service') as mock_llm:
+        mock_emb.generate_embedding.return_value = [0.1] * 1536
+        mock_store.search.return_value = CHUNKS
+        mock_llm.generate_answer_stream.return_value = iter([
+            {"type": "token", "text": "ML [1]."},
+            {"type": "answer", "answer": "ML [1].", "citations": []},
+        ])
+        response = client.post(
+            "/query/stream",
+            json={"text": "Stream me"},
+            headers={"Accept-Encoding": "gzip"}
+        )
+
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+    assert "event: done" in response.text
@@ -0,0 +1,144 @@
+"""Tests for the streaming query endpoint."""
+import json
+import pytest
+from fastapi.testclient import TestClient
+from api import app
+from unittest.mock import patch, MagicMock
+from llm_service import LLMService
+import config
+
+
+CHUNKS = [
+    {
+        "id": "chunk_1",
+        "text": "Machine learning is a subset of AI.",
+        "metadata": {"document_title": "AI Basics", "page": 1},
+        "similarity_score": 0.9
+    },
+    {
+        "id": "chunk_2",
+        "text": "There are three types of ML.",
+        "metadata": {"document_title": "AI Basics", "page": 2},
+        "similarity_score": 0.85
+    }
+]
+
+
+@pytest.fixture
+def client():
+    """Create test client."""
+    return TestClient(app)
+
+
+def parse_sse(body: str):
+    """Parse an SSE body into (event, data) tuples."""
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def make_stream_chunk(text):
+    """Build a fake streamed completion chunk."""
+    chunk = MagicMock()
+    chunk.choices = [MagicMock()]
+    chunk.choices[0].delta.content = text
+    return chunk
+
+
+def test_query_stream_event_order(client):
+    """Test chunks arrive first, then tokens and citations, then done."""
+    with patch('api.embedding_service') as mock_emb, \
+         patch('api.vector_store') as mock_store, \
+         patch('api.llm_service') as mock_llm:
+        mock_emb.generate_embedding.return_value = [0.1] * 1536
+        mock_store.search.return_value = CHUNKS
+        citation = {"id": "chunk_1", "document_title": "AI Basics", "page": 1,
+                    "text": CHUNKS[0]["text"], "similarity_score": 0.9}
+        mock_llm.generate_answer_stream.return_value = iter([
+            {"type": "token", "text": "ML is AI "},
+            {"type": "token", "text": "[1]."},
+            {"type": "citation", "citation": citation},
+            {"type": "answer", "answer": "ML is AI [1].", "citations": [citation]},
+        ])
+
+        response = client.post("/query/stream", json={"text": "What is ML?"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(response.text)
+    names = [name for name, _ in events]
+    assert names == ["chunks", "token", "token", "citation", "done"]
+    assert len(events[0][1]["retrieved_chunks"]) == 2
+    done = events[-1][1]
+    assert done["answer"] == "ML is AI [1]."
+    assert done["citations"][0]["id"] == "chunk_1"
+    assert "embedding_ms" in done["timings"]
+    assert "first_token_ms" in done["timings"]
+
+
+def test_query_stream_no_chunks(client):
+    """Test streaming falls back to the no-results answer."""
+    with patch('api.embedding_service') as mock_emb, \
+         patch('api.vector_store') as mock_store:
+        mock_emb.generate_embedding.return_value = [0.1] * 1536
+        mock_store.search.return_value = []
+
+        response = client.post("/query/stream", json={"text": "Anything?"})
+
+    events = parse_sse(response.text)
+    assert [name for name, _ in events] == ["chunks", "token", "done"]
+    assert "couldn't find" in events[-1][1]["answer"].lower()
+
+
+def test_query_stream_empty_text(client):
+    """Test empty text is rejected before streaming."""
+    response = client.post("/query/stream", json={"text": "  "})
+    assert response.status_code == 400
+
+
+def test_query_stream_llm_error(client):
+    """Test generation failure is reported as an error event."""
+    def failing_stream(query, chunks, cancelled=None):
+        yield {"type": "token", "text": "Partial"}
+        raise ValueError("LLM API Error")
+
+    with patch('api.embedding_service') as mock_emb, \
+         patch('api.vector_store') as mock_store, \
+         patch('api.llm_service') as mock_llm:
+        mock_emb.generate_embedding.return_value = [0.1] * 1536
+        mock_store.search.return_value = CHUNKS
+        mock_llm.generate_answer_stream.side_effect = failing_stream
+
+        response = client.post("/query/stream", json={"text": "What is ML?"})
+
+    events = parse_sse(response.text)
+    assert events[-1][0] == "error"
+    assert "LLM API Error" in events[-1][1]["detail"]
+
+
+def test_generate_answer_stream_emits_citations_incrementally():
+    """Test citations are emitted as soon as each marker completes."""
+    with patch.object(config, 'OPENAI_API_KEY', 'sk-test'), \
+         patch('llm_service.OpenAI') as mock_openai:
+        mock_client = MagicMock()
+        mock_openai.return_value = mock_client
+        stream = MagicMock()
+        stream.__iter__.return_value = iter([
+            make_stream_chunk("ML [1"),
+            make_stream_chunk("] is AI. Types ["),
+            make_stream_chunk("2] and [1]."),
+        ])
+        mock_client.chat.completions.create.return_value = stream
+
+        service = LLMService()
+        events = list(service.generate_answer_stream("What is ML?", CHUNKS))
+
+    types = [e["type"] for e in events]
+    assert types == ["token", "token", "citation", "token", "citation", "answer"]
+    assert events[2]["citation"]["id"] == "chunk_1"
+    assert events[4]["citation"]["id"] == "chunk_2"
+    assert events[-1]["answer"] == "ML [1] is AI. Types [2] and [1]."
+    assert len(events[-1]["citations"]) == 2
+    stream.response.close.assert_called_once()
@@ -0,0 +1,174 @@
+"""Tests for the shared OpenAI rate governor."""
+import threading
+import time
+import httpx
+import pytest
+from unittest.mock import patch
+from openai import OpenAI
+import config
+from embeddings import EmbeddingService
+from llm_service import LLMService
+from rate_governor import RateGovernor, RateBudgetExhausted, INTERACTIVE, BULK, parse_duration
+
+
+def headers(limit_requests, remaining_requests, reset_requests, limit_tokens=None, remaining_tokens=None, reset_tokens=None):
+    """Rate limit headers as sent by the API."""
+    values = {
+        "x-ratelimit-limit-requests": str(limit_requests),
+        "x-ratelimit-remaining-requests": str(remaining_requests),
+        "x-ratelimit-reset-requests": reset_requests
+    }
+    if limit_tokens is not None:
+        values.update({
+            "x-ratelimit-limit-tokens": str(limit_tokens),
+            "x-ratelimit-remaining-tokens": str(remaining_tokens),
+            "x-ratelimit-reset-tokens": reset_tokens
+        })
+    return values
+
+
+def test_parse_duration():
+    """Test reset headers in the API's duration format are read as seconds."""
+    assert parse_duration("6m0s") == 360
+    assert parse_duration("1.5s") == 1.5
+    assert parse_duration("20ms") == pytest.approx(0.02)
+    assert parse_duration("2") == 2
+    assert parse_duration("") is None
+    assert parse_duration("soon") is None
+
+
+def test_unknown_model_is_not_throttled():
+    """Test calls pass straight through until a response has reported budgets."""
+    governor = RateGovernor()
+    assert governor.acquire("text-embedding-3-small", tokens=10**6, timeout=0) == pytest.approx(0, abs=0.01)
+
+
+def test_exhausted_budget_paces_calls():
+    """Test a call waits for the budget to refill instead of being sent to fail."""
+    governor = RateGovernor()
+    # Empty request budget refilling at 10 per second
+    governor.observe("gpt-4", headers(10, 0, "1s"))
+
+    with pytest.raises(RateBudgetExhausted):
+        governor.acquire("gpt-4", timeout=0.01)
+    waited = governor.acquire("gpt-4")
+
+    assert 0.05 <= waited < 0.5
+
+
+def test_token_budget_counts_estimated_tokens():
+    """Test calls are charged their estimated tokens against the token budget."""
+    governor = RateGovernor()
+    governor.observe("gpt-4", headers(100, 100, "0s", limit_tokens=1000, remaining_tokens=1000, reset_tokens="60s"))
+
+    governor.acquire("gpt-4", tokens=900, timeout=0)
+    with pytest.raises(RateBudgetExhausted):
+        governor.acquire("gpt-4", tokens=200, timeout=0)
+    assert governor.snapshot()[("gpt-4", "tokens")] == pytest.approx(100, abs=1)
+
+
+def test_bulk_calls_leave_a_reserve_for_interactive_ones():
+    """Test bulk calls stop short of the interactive reserve."""
+    governor = RateGovernor(interactive_reserve=0.2)
+    governor.observe("text-embedding-3-small", headers(10, 2, "60s"))
+
+    with pytest.raises(RateBudgetExhausted):
+        governor.acquire("text-embedding-3-small", priority=BULK, timeout=0.05)
+    governor.acquire("text-embedding-3-small", priority=INTERACTIVE, timeout=0)
+
+
+def test_interactive_calls_go_first():
+    """Test an interactive call queued behind a bulk call is served before it."""
+    governor = RateGovernor()
+    governor.observe("text-embedding-3-small", headers(10, 0, "1s"))
+    served = []
+
+    def call(priority):
+        governor.acquire("text-embedding-3-small", priority=priority)
+        served.append((priority, time.monotonic()))
+
+    bulk = threading.Thread(target=call, args=(BULK,))
+    interactive = threading.Thread(target=call, args=(INTERACTIVE,))
+    bulk.start()
+    time.sleep(0.02)
+    interactive.start()
+    bulk.join(2)
+    interactive.join(2)
+
+    assert [priority for priority, _ in sorted(served, key=lambda item: item[1])] == [INTERACTIVE, BULK]
+
+
+def test_rate_limited_response_pauses_model():
+    """Test a 429 holds back further calls until its retry-after time."""
+    governor = RateGovernor()
+    governor.observe("gpt-4", {"retry-after-ms": "100"}, status_code=429)
+
+    with pytest.raises(RateBudgetExhausted):
+        governor.acquire("gpt-4", timeout=0.01)
+    assert governor.acquire("gpt-4") >= 0.05
+    # Other models are unaffected
+    assert governor.acquire("whisper-1", timeout=0) < 0.05
+
+
+def test_response_headers_update_budget():
+    """Test responses of an OpenAI client update the budget of the model acquired on its thread."""
+    governor = RateGovernor()
+
+    def handler(request):
+        return httpx.Response(
+            200,
+            headers=headers(3000, 2999, "20s", limit_tokens=1000000, remaining_tokens=999990, reset_tokens="6s"),
+            json={"object": "list", "data": [], "model": "text-embedding-3-small", "usage": {"prompt_tokens": 1, "total_tokens": 1}}
+        )
+
+    http_client = httpx.Client(transport=httpx.MockTransport(handler), event_hooks={"response": [governor._on_response]})
+    client = OpenAI(api_key="sk-test", http_client=http_client)
+    governor.acquire("text-embedding-3-small", tokens=5)
+    client.embeddings.create(model="text-embedding-3-small", input=["text"], encoding_format="float")
+
+    budget = governor.snapshot()
+    assert budget[("text-embedding-3-small", "requests")] == pytest.approx(2999, abs=1)
+    assert budget[("text-embedding-3-small", "tokens")] == pytest.approx(999990, abs=100)
+
+
+def rate_limited_once(body):
+    """Transport answering 429 to the first request and body to the rest; returns (handler, requests seen)."""
+    seen = []
+
+    def handler(request):
+        seen.append(request)
+        if len(seen) == 1:
+            return httpx.Response(429, headers={"retry-after-ms": "10"}, json={"error": {"message": "Rate limit reached", "type": "requests"}})
+        return httpx.Response(200, json=body)
+    return handler, seen
+
+
+@pytest.mark.parametrize("service", ["embedding", "llm"])
+def test_rate_limited_call_is_resent_through_the_governor(service):
+    """Test a 429 is retried by acquiring budget again, not by the SDK's own retries."""
+    if service == "embedding":
+        body = {"object": "list", "data": [{"object": "embedding", "index": 0, "embedding": [0.5, 0.5]}], "model": "text-embedding-3-small", "usage": {"prompt_tokens": 1, "total_tokens": 1}}
+    else:
+        body = {
+            "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": "gpt-4",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "Answer [1]"}}]
+        }
+    handler, seen = rate_limited_once(body)
+
+    with patch.object(config, 'OPENAI_API_KEY', 'sk-test'), \
+         patch.object(config, 'EMBEDDING_BACKEND', 'openai'), \
+         patch.object(config, 'EMBEDDING_ENCODING_FORMAT', 'float'), \
+         patch('embeddings.governor') as embedding_governor, \
+         patch('llm_service.governor') as llm_governor:
+        for governor in (embedding_governor, llm_governor):
+            governor.http_client.side_effect = lambda: httpx.Client(transport=httpx.MockTransport(handler))
+            governor.acquire.return_value = 0.0
+        if service == "embedding":
+            EmbeddingService(use_cache=False).generate_chunk_embeddings(["text"])
+            acquire = embedding_governor.acquire
+        else:
+            LLMService().generate_answer("question?", [{"id": "chunk_1", "text": "Context", "metadata": {}}])
+            acquire = llm_governor.acquire
+
+    assert len(seen) == 2
+    assert acquire.call_count == 2
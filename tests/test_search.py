@@ -0,0 +1,125 @@
+"""Tests for the retrieval-only search endpoint."""
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+from api import app
+from cache import corpus_version
+import config
+
+
+RANKED = [
+    {
+        "id": f"chunk_{i}",
+        "text": f"Passage number {i} about machine learning.",
+        "metadata": {"document_id": str(i % 3), "document_title": f"Doc {i % 3}", "page": i},
+        "similarity_score": round(0.95 - i * 0.05, 2)
+    }
+    for i in range(12)
+]
+
+
+@pytest.fixture
+def client():
+    """Create test client."""
+    return TestClient(app)
+
+
+def ranked_search(query_embedding, top_k=None, where=None, **kwargs):
+    """Vector store stand-in returning the first top_k ranked chunks."""
+    return RANKED[:top_k]
+
+
+def search(client, body):
+    """POST /search with mocked services; returns (response, vector store mock, llm mock)."""
+    with patch('api.embedding_service') as mock_emb, \
+         patch('api.vector_store') as mock_store, \
+         patch('api.llm_service') as mock_llm:
+        mock_emb.generate_embedding.return_value = [0.1] * 1536
+        mock_store.search.side_effect = ranked_search
+        response = client.post("/search", json=body)
+    return response, mock_store, mock_llm
+
+
+def test_search_returns_ranked_passages_without_llm(client):
+    """Test /search returns top_k passages and never calls the LLM."""
+    response, mock_store, mock_llm = search(client, {"text": "machine learning", "top_k": 3})
+
+    assert response.status_code == 200
+    data = response.json()
+    assert [r["id"] for r in data["results"]] == ["chunk_0", "chunk_1", "chunk_2"]
+    assert data["next_cursor"]
+    assert "search_ms" in data["timings"]
+    mock_llm.generate_answer.assert_not_called()
+    assert mock_store.search.call_args.kwargs["where"] is None
+
+
+def test_search_cursor_pagination(client):
+    """Test following next_cursor walks the ranked list without gaps or repeats."""
+    seen = []
+    body = {"text": "machine learning", "top_k": 5}
+    while True:
+        data = search(client, body)[0].json()
+        seen.extend(r["id"] for r in data["results"])
+        if not data["next_cursor"]:
+            break
+        body = dict(body, cursor=data["next_cursor"])
+
+    assert seen == [chunk["id"] for chunk in RANKED]
+
+
+def test_search_min_similarity_ends_pagination(client):
+    """Test results below min_similarity are dropped and no further page is offered."""
+    data = search(client, {"text": "machine learning", "top_k": 10, "min_similarity": 0.8})[0].json()
+
+    assert [r["similarity_score"] for r in data["results"]] == [0.95, 0.9, 0.85, 0.8]
+    assert data["next_cursor"] is None
+
+
+def test_search_document_filters(client):
+    """Test document filters are passed to the vector store."""
+    _, mock_store, _ = search(client, {"text": "machine learning", "document_ids": [1, 2]})
+
+    assert mock_store.search.call_args.kwargs["where"] == {"document_id": {"$in": ["1", "2"]}}
+
+
+def test_search_accepts_document_ids_from_listing(client):
+    """Test integer document ids, as returned by /documents, are accepted."""
+    response, mock_store, _ = search(client, {"text": "machine learning", "document_ids": [1]})
+
+    assert response.status_code == 200
+    assert mock_store.search.call_args.kwargs["where"] == {"document_id": {"$in": ["1"]}}
+
+
+def test_search_snippet_chars(client):
+    """Test passages can be truncated for type-ahead payloads."""
+    data = search(client, {"text": "machine learning", "top_k": 2, "snippet_chars": 10})[0].json()
+
+    assert all(len(r["text"]) <= 13 and r["text"].endswith("...") for r in data["results"])
+
+
+def test_search_cursor_is_bound_to_search(client):
+    """Test a cursor cannot be reused with different parameters or after documents change."""
+    cursor = search(client, {"text": "machine learning", "top_k": 2})[0].json()["next_cursor"]
+
+    other = search(client, {"text": "deep learning", "top_k": 2, "cursor": cursor})[0]
+    assert other.status_code == 400
+
+    assert search(client, {"text": "machine learning", "cursor": "not-a-cursor"})[0].status_code == 400
+
+    corpus_version.bump()
+    stale = search(client, {"text": "machine learning", "top_k": 2, "cursor": cursor})[0]
+    assert stale.status_code == 409
+
+
+@pytest.mark.parametrize("body", [
+    {"text": "   "},
+    {"text": "machine learning", "top_k": 0},
+    {"text": "machine learning", "top_k": config.SEARCH_MAX_TOP_K + 1},
+    {"text": "machine learning", "snippet_chars": -1},
+])
+def test_search_validation(client, body):
+    """Test invalid requests are rejected before any work is done."""
+    response, mock_store, _ = search(client, body)
+
+    assert response.status_code == 400
+    mock_store.search.assert_not_called()
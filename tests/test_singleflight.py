@@ -0,0 +1,218 @@
+"""Tests for in-flight request coalescing."""
+import asyncio
+import threading
+import time
+import pytest
+import httpx
+from unittest.mock import patch, MagicMock
+from api import app
+from openai import APITimeoutError
+from concurrency import SingleFlight, AsyncSingleFlight
+from deadline import Deadline, DeadlineExceeded
+from embeddings import EmbeddingService
+import config
+
+
+def test_singleflight_shares_result_across_threads():
+    """Test concurrent callers with the same key run the function once."""
+    flight = SingleFlight()
+    calls = []
+    barrier = threading.Barrier(5)
+    results = []
+
+    def slow(value):
+        calls.append(value)
+        time.sleep(0.2)
+        return value * 2
+
+    def worker():
+        barrier.wait()
+        results.append(flight.do("key", slow, 21))
+
+    threads = [threading.Thread(target=worker) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [21]
+    assert results == [42] * 5
+    assert flight.coalesced == 4
+
+
+def test_singleflight_shares_exception():
+    """Test waiting callers receive the leader's exception."""
+    flight = SingleFlight()
+    errors = []
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.1)
+        raise ValueError("upstream failed")
+
+    def follower():
+        started.wait()
+        try:
+            flight.do("key", failing)
+        except ValueError as e:
+            errors.append(str(e))
+
+    thread = threading.Thread(target=follower)
+    thread.start()
+    with pytest.raises(ValueError):
+        flight.do("key", failing)
+    thread.join()
+
+    assert errors == ["upstream failed"]
+
+
+async def test_async_singleflight_survives_caller_cancellation():
+    """Test cancelling one waiter does not cancel the shared work."""
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return "done"
+
+    first = asyncio.create_task(flight.do("key", work))
+    second = asyncio.create_task(flight.do("key", work))
+    await asyncio.sleep(0.01)
+    first.cancel()
+
+    assert await second == "done"
+    assert calls == [1]
+
+
+def test_embedding_service_coalesces_identical_texts():
+    """Test concurrent identical embeddings make one API call."""
+    with patch.object(config, 'OPENAI_API_KEY', 'sk-test'), \
+         patch('embeddings.OpenAI') as mock_openai:
+        mock_client = MagicMock()
+        mock_openai.return_value = mock_client
+
+        def create(**kwargs):
+            time.sleep(0.2)
+            response = MagicMock()
+            response.data = [MagicMock(embedding=[0.1] * 8)]
+            return response
+        mock_client.embeddings.create.side_effect = create
+
+        service = EmbeddingService(use_cache=False)
+        threads = [threading.Thread(target=service.generate_embedding, args=("same text",)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert mock_client.embeddings.create.call_count == 1
+
+
+def test_coalesced_embedding_outlives_the_leaders_deadline():
+    """Test a caller without a deadline is not failed by the deadline of the call it joined."""
+    with patch.object(config, 'OPENAI_API_KEY', 'sk-test'), \
+         patch('embeddings.OpenAI') as mock_openai:
+        mock_client = MagicMock()
+        mock_openai.return_value = mock_client
+        started = threading.Event()
+
+        def create(**kwargs):
+            if not started.is_set():
+                started.set()
+                time.sleep(0.4)
+                raise APITimeoutError(request=httpx.Request("POST", "https://api.openai.com/v1/embeddings"))
+            response = MagicMock()
+            response.data = [MagicMock(embedding=[0.1] * 8)]
+            return response
+        mock_client.embeddings.create.side_effect = create
+        mock_client.with_options.return_value = mock_client
+
+        service = EmbeddingService(use_cache=False)
+        leader_errors = []
+
+        def leader():
+            try:
+                service.generate_embedding("same text", deadline=Deadline(0.3))
+            except DeadlineExceeded as e:
+                leader_errors.append(e)
+
+        thread = threading.Thread(target=leader)
+        thread.start()
+        started.wait(1)
+        embedding = service.generate_embedding("same text")
+        thread.join()
+
+    assert len(leader_errors) == 1
+    assert embedding.tolist() == pytest.approx([0.1] * 8)
+    assert mock_client.embeddings.create.call_count == 2
+
+
+async def test_coalesced_query_outlives_the_leaders_deadline():
+    """Test a query joining a run with a tiny client deadline still gets a full answer."""
+    def generate_answer(query, chunks, **kwargs):
+        generate_answer.calls += 1
+        if generate_answer.calls == 1:
+            time.sleep(1.0)
+        return {"answer": "ML is AI [1].", "citations": []}
+    generate_answer.calls = 0
+
+    with patch('api.embedding_service') as mock_emb, \
+         patch('api.vector_store') as mock_store, \
+         patch('api.llm_service') as mock_llm, \
+         patch('api.answer_cache', None):
+        mock_emb.generate_embedding.return_value = [0.4] * 1536
+        mock_store.search.return_value = [{
+            "id": "chunk_1",
+            "text": "ML is AI.",
+            "metadata": {"document_title": "AI", "page": 1},
+            "similarity_score": 0.9
+        }]
+        mock_llm.generate_answer.side_effect = generate_answer
+
+        async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+            hurried = asyncio.ensure_future(
+                client.post("/query", json={"text": "What is ML?"}, headers={"X-Request-Deadline-Ms": "600"})
+            )
+            for _ in range(100):
+                if generate_answer.calls:
+                    break
+                await asyncio.sleep(0.01)
+            patient = await client.post("/query", json={"text": "What is ML?"})
+            hurried = await hurried
+
+    assert hurried.json()["partial"] is True
+    assert patient.status_code == 200
+    assert patient.json()["answer"] == "ML is AI [1]."
+    assert not patient.json().get("partial")
+
+
+async def test_identical_queries_share_one_pipeline():
+    """Test concurrent identical /query requests embed and answer once."""
+    def slow_embedding(text, **kwargs):
+        time.sleep(0.2)
+        return [0.4] * 1536
+
+    with patch('api.embedding_service') as mock_emb, \
+         patch('api.vector_store') as mock_store, \
+         patch('api.llm_service') as mock_llm, \
+         patch('api.answer_cache', None):
+        mock_emb.generate_embedding.side_effect = slow_embedding
+        mock_store.search.return_value = [{
+            "id": "chunk_1",
+            "text": "ML is AI.",
+            "metadata": {"document_title": "AI", "page": 1},
+            "similarity_score": 0.9
+        }]
+        mock_llm.generate_answer.return_value = {"answer": "ML is AI [1].", "citations": []}
+
+        async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+            responses = await asyncio.gather(*(
+                client.post("/query", json={"text": text})
+                for text in ["What is ML?", "what is ML?", "What  is ML?"]
+            ))
+
+        assert all(r.status_code == 200 for r in responses)
+        assert mock_emb.generate_embedding.call_count == 1
+        assert mock_llm.generate_answer.call_count == 1
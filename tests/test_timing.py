@@ -0,0 +1,113 @@
+"""Tests for per-stage latency breakdowns."""
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch, MagicMock
+from api import app
+from timing import StageTimer
+from embeddings import EmbeddingService
+import config
+
+
+@pytest.fixture
+def client():
+    """Create test client."""
+    return TestClient(app)
+
+
+def test_stage_timer_breakdown():
+    """Test stages accumulate and render as JSON and Server-Timing."""
+    timer = StageTimer()
+    with timer.stage("embedding"):
+        pass
+    timer.add("search", 5.0)
+    timer.add("search", 2.5)
+    timer.annotate("embedding_cached", True)
+
+    breakdown = timer.to_dict()
+    assert breakdown["search_ms"] == 7.5
+    assert "embedding_ms" in breakdown
+    assert breakdown["embedding_cached"] is True
+    assert "total_ms" in breakdown
+
+    header = timer.server_timing_header()
+    assert header.startswith("embedding;dur=")
+    assert "search;dur=7.5" in header
+    assert "total;dur=" in header
+
+
+def test_query_timings_and_server_timing_header(client):
+    """Test /query returns a stage breakdown and Server-Timing header."""
+    with patch('api.embedding_service') as mock_emb, \
+         patch('api.vector_store') as mock_store, \
+         patch('api.llm_service') as mock_llm:
+        mock_emb.generate_embedding.return_value = [0.5] * 1536
+        mock_store.search.return_value = [{
+            "id": "chunk_1",
+            "text": "ML is AI.",
+            "metadata": {"document_title": "AI", "page": 1},
+            "similarity_score": 0.9
+        }]
+        mock_llm.generate_answer.return_value = {"answer": "ML is AI [1].", "citations": []}
+
+        response = client.post("/query", json={"text": "What is ML?"})
+
+    assert response.status_code == 200
+    timings = response.json()["timings"]
+    for stage in ("embedding_ms", "search_ms", "filter_ms", "llm_ms", "total_ms"):
+        assert stage in timings
+    assert timings["answer_cached"] is False
+
+    header = response.headers["server-timing"]
+    for stage in ("embedding", "search", "llm", "total"):
+        assert f"{stage};dur=" in header
+
+
+def test_embedding_service_reports_cache_hit():
+    """Test the embedding service annotates whether the cache was used."""
+    with patch.object(config, 'OPENAI_API_KEY', 'sk-test'), \
+         patch('embeddings.OpenAI') as mock_openai:
+        mock_client = MagicMock()
+        mock_openai.return_value = mock_client
+        mock_response = MagicMock()
+        mock_response.data = [MagicMock(embedding=[0.1] * 8)]
+        mock_client.embeddings.create.return_value = mock_response
+
+        service = EmbeddingService(use_cache=True)
+        first, second = StageTimer(), StageTimer()
+        service.generate_embedding("cached text", timer=first)
+        service.generate_embedding("cached text", timer=second)
+
+    assert first.flags["embedding_cached"] is False
+    assert second.flags["embedding_cached"] is True
+
+
+def test_transcribe_server_timing(client):
+    """Test /transcribe reports read and transcription stages."""
+    with patch('api.transcription_service') as mock_service:
+        mock_service.transcribe_audio.return_value = {"transcript": "hello", "confidence": None, "language": "en"}
+        response = client.post("/transcribe", files={"audio": ("a.webm", b"audio", "audio/webm")})
+
+    assert response.status_code == 200
+    assert "transcription_ms" in response.json()["timings"]
+    assert "transcription;dur=" in response.headers["server-timing"]
+
+
+def test_upload_passes_timer_to_ingestion(client):
+    """Test /documents/upload reports ingestion stages recorded by the service."""
+    def ingest(path, custom_title=None, original_filename=None, timer=None):
+        for stage in ("parse", "chunk", "embed", "sqlite", "chroma"):
+            timer.add(stage, 1.0)
+        return {
+            "success": True, "document_id": 1, "title": "t", "chunks_created": 1,
+            "message": "ok", "error": None, "already_exists": False
+        }
+
+    with patch('api.ingestion_service') as mock_service:
+        mock_service.ingest_document.side_effect = ingest
+        response = client.post("/documents/upload", files={"file": ("t.txt", b"content", "text/plain")})
+
+    assert response.status_code == 200
+    timings = response.json()["timings"]
+    for stage in ("write_ms", "parse_ms", "chunk_ms", "embed_ms", "sqlite_ms", "chroma_ms"):
+        assert stage in timings
+    assert "chroma;dur=1.0" in response.headers["server-timing"]
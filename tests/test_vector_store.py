@@ -1,8 +1,10 @@
 """Tests for vector store."""
+import numpy as np
 import pytest
 import tempfile
 import shutil
-from vector_store import VectorStore
+from vector_store import VectorStore, metadata_filter
+from deadline import Deadline, DeadlineExceeded
 import config
 
 
@@ -62,3 +64,83 @@ def test_add_and_search_chunks(temp_vector_db):
     assert all("metadata" in r for r in results), "Results should have metadata"
     assert all("similarity_score" in r for r in results), "Results should have similarity scores"
 
+
+
+def test_search_batch(temp_vector_db):
+    """Test searching many query vectors in one call."""
+    store = VectorStore()
+    
+    store.add_chunks([
+        {
+            "id": "test_chunk_1",
+            "text": "First",
+            "embedding": [1.0, 0.0, 0.0],
+            "metadata": {"document_title": "Test Doc", "page": 1}
+        },
+        {
+            "id": "test_chunk_2",
+            "text": "Second",
+            "embedding": [0.0, 1.0, 0.0],
+            "metadata": {"document_title": "Test Doc", "page": 2}
+        }
+    ])
+    
+    results = store.search_batch([[0.0, 1.0, 0.0], [1.0, 0.0, 0.0]], top_k=1)
+    
+    assert len(results) == 2, "Should return one result list per query"
+    assert results[0][0]["id"] == "test_chunk_2"
+    assert results[1][0]["id"] == "test_chunk_1"
+    assert store.search_batch([]) == []
+
+
+def test_float32_array_embeddings(temp_vector_db):
+    """Test rows of a float32 batch array can be stored and searched with a 2-D array."""
+    store = VectorStore()
+    embeddings = np.eye(3, dtype=np.float32)
+    
+    store.add_chunks([
+        {
+            "id": f"test_chunk_{i}",
+            "text": f"Chunk {i}",
+            "embedding": embeddings[i],
+            "metadata": {"document_title": "Test Doc", "page": i}
+        }
+        for i in range(3)
+    ])
+    
+    results = store.search_batch(embeddings[[2, 0]], top_k=1)
+    
+    assert [r[0]["id"] for r in results] == ["test_chunk_2", "test_chunk_0"]
+    assert store.search(embeddings[1], top_k=1)[0]["id"] == "test_chunk_1"
+    assert store.search_batch(np.empty((0, 3), dtype=np.float32)) == []
+
+
+def test_search_with_document_filter(temp_vector_db):
+    """Test results can be restricted to some documents."""
+    store = VectorStore()
+    
+    store.add_chunks([
+        {
+            "id": f"chunk_{i}",
+            "text": f"Chunk {i}",
+            "embedding": [1.0, i / 10, 0.0],
+            "metadata": {"document_id": str(i % 2), "document_title": f"Doc {i % 2}", "page": i}
+        }
+        for i in range(4)
+    ])
+    
+    results = store.search([1.0, 0.0, 0.0], top_k=10, where=metadata_filter(document_ids=["1"]))
+    assert [r["id"] for r in results] == ["chunk_1", "chunk_3"]
+    
+    where = metadata_filter(document_ids=["0", "1"], document_titles=["Doc 0"])
+    assert [r["id"] for r in store.search([1.0, 0.0, 0.0], top_k=10, where=where)] == ["chunk_0", "chunk_2"]
+    assert metadata_filter() is None
+
+
+def test_search_checks_deadline(temp_vector_db):
+    """Test an exhausted deadline stops the search before querying."""
+    store = VectorStore()
+    
+    with pytest.raises(DeadlineExceeded):
+        store.search([1.0, 0.0, 0.0], deadline=Deadline(0))
+    assert store.search([1.0, 0.0, 0.0], deadline=Deadline(5)) == []
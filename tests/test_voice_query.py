@@ -0,0 +1,117 @@
+"""Tests for the single-round-trip voice query endpoint."""
+import json
+import pytest
+from fastapi.testclient import TestClient
+from api import app
+from unittest.mock import patch
+
+
+CHUNKS = [
+    {
+        "id": "chunk_1",
+        "text": "Machine learning is a subset of AI.",
+        "metadata": {"document_title": "AI Basics", "page": 1},
+        "similarity_score": 0.9
+    }
+]
+
+AUDIO = {"audio": ("question.webm", b"fake audio data", "audio/webm")}
+
+
+@pytest.fixture
+def client():
+    """Create test client."""
+    return TestClient(app)
+
+
+def test_voice_query_returns_transcript_and_answer(client):
+    """Test one request transcribes, retrieves and answers."""
+    with patch('api.transcription_service') as mock_transcription, \
+         patch('api.embedding_service') as mock_emb, \
+         patch('api.vector_store') as mock_store, \
+         patch('api.llm_service') as mock_llm:
+        mock_transcription.transcribe_audio.return_value = {
+            "transcript": " What is machine learning? ",
+            "confidence": None,
+            "language": "en"
+        }
+        mock_emb.generate_embedding.return_value = [0.1] * 1536
+        mock_store.search.return_value = CHUNKS
+        mock_llm.generate_answer.return_value = {
+            "answer": "ML is a subset of AI [1].",
+            "citations": [{"id": "chunk_1", "document_title": "AI Basics", "page": 1}]
+        }
+
+        response = client.post("/voice-query", files=AUDIO)
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["transcript"] == "What is machine learning?"
+    assert data["answer"] == "ML is a subset of AI [1]."
+    assert data["retrieved_chunks"][0]["id"] == "chunk_1"
+    assert "transcription_ms" in data["timings"]
+    assert "llm_ms" in data["timings"]
+    assert "transcription;dur=" in response.headers["Server-Timing"]
+    mock_emb.generate_embedding.assert_called_once()
+    assert mock_emb.generate_embedding.call_args[0][0] == "What is machine learning?"
+
+
+def test_voice_query_stream(client):
+    """Test streaming mode sends the transcript before the answer events."""
+    with patch('api.transcription_service') as mock_transcription, \
+         patch('api.embedding_service') as mock_emb, \
+         patch('api.vector_store') as mock_store, \
+         patch('api.llm_service') as mock_llm:
+        mock_transcription.transcribe_audio.return_value = {
+            "transcript": "What is ML?", "confidence": None, "language": "en"
+        }
+        mock_emb.generate_embedding.return_value = [0.1] * 1536
+        mock_store.search.return_value = CHUNKS
+        mock_llm.generate_answer_stream.return_value = iter([
+            {"type": "token", "text": "ML is AI."},
+            {"type": "answer", "answer": "ML is AI.", "citations": []},
+        ])
+
+        response = client.post("/voice-query?stream=true", files=AUDIO)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = []
+    for block in response.text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    assert [name for name, _ in events] == ["transcript", "chunks", "token", "done"]
+    assert events[0][1]["transcript"] == "What is ML?"
+    assert "transcription_ms" in events[-1][1]["timings"]
+
+
+def test_voice_query_no_speech(client):
+    """Test an empty transcript is a 400 and nothing is retrieved."""
+    with patch('api.transcription_service') as mock_transcription, \
+         patch('api.embedding_service') as mock_emb:
+        mock_transcription.transcribe_audio.return_value = {
+            "transcript": "   ", "confidence": None, "language": "en"
+        }
+
+        response = client.post("/voice-query", files=AUDIO)
+
+    assert response.status_code == 400
+    assert "no speech" in response.json()["detail"].lower()
+    mock_emb.generate_embedding.assert_not_called()
+
+
+def test_voice_query_empty_audio(client):
+    """Test empty audio is rejected."""
+    response = client.post("/voice-query", files={"audio": ("empty.webm", b"", "audio/webm")})
+    assert response.status_code == 400
+
+
+def test_voice_query_transcription_error(client):
+    """Test transcription errors keep the /transcribe status codes."""
+    with patch('api.transcription_service') as mock_transcription:
+        mock_transcription.transcribe_audio.side_effect = ValueError("OpenAI API error: bad audio")
+
+        response = client.post("/voice-query", files=AUDIO)
+
+    assert response.status_code == 400
+    assert "bad audio" in response.json()["detail"]
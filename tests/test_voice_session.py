@@ -0,0 +1,219 @@
+"""Tests for the streaming voice session."""
+import asyncio
+import io
+import wave
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from api import app
+from unittest.mock import patch
+from voice_session import UtteranceDetector, VoiceSession, pcm16_to_wav, frame_energy
+
+
+SAMPLE_RATE = 16000
+FRAME_MS = 20
+
+
+def speech_frame(ms=FRAME_MS):
+    """A loud 440 Hz tone frame."""
+    t = np.arange(int(SAMPLE_RATE * ms / 1000)) / SAMPLE_RATE
+    return (0.3 * np.sin(2 * np.pi * 440 * t) * 32767).astype("<i2").tobytes()
+
+
+def silence_frame(ms=FRAME_MS):
+    """A silent frame."""
+    return b"\x00\x00" * int(SAMPLE_RATE * ms / 1000)
+
+
+CHUNKS = [
+    {
+        "id": "chunk_1",
+        "text": "Machine learning is a subset of AI.",
+        "metadata": {"document_title": "AI Basics", "page": 1},
+        "similarity_score": 0.9
+    }
+]
+
+
+def test_pcm16_to_wav():
+    """Test PCM is wrapped in a valid mono 16-bit WAV."""
+    pcm = speech_frame(100)
+    with wave.open(io.BytesIO(pcm16_to_wav(pcm, SAMPLE_RATE))) as wav:
+        assert wav.getnchannels() == 1
+        assert wav.getsampwidth() == 2
+        assert wav.getframerate() == SAMPLE_RATE
+        assert wav.readframes(wav.getnframes()) == pcm
+
+
+def test_frame_energy():
+    """Test speech is louder than silence."""
+    assert frame_energy(silence_frame()) == 0.0
+    assert frame_energy(speech_frame()) > 0.1
+
+
+def test_detector_segments_and_end_of_speech():
+    """Test segments are cut while speaking and silence ends the utterance."""
+    detector = UtteranceDetector(
+        sample_rate=SAMPLE_RATE, energy_threshold=0.01, end_silence_ms=400,
+        segment_ms=200, max_utterance_ms=10000, pause_ms=100, preroll_ms=40
+    )
+
+    events = []
+    for _ in range(10):
+        events += detector.feed(silence_frame())
+    assert events == []
+    assert not detector.speaking
+
+    for _ in range(15):  # 300 ms of speech
+        events += detector.feed(speech_frame())
+    assert [kind for kind, _ in events] == ["segment"]
+    assert detector.speaking
+
+    for _ in range(25):  # 500 ms of silence
+        events += detector.feed(silence_frame())
+    assert [kind for kind, _ in events] == ["segment", "segment", "end"]
+    assert not detector.speaking
+
+    utterance = events[-1][1]
+    # Pre-roll + speech + silence up to the end threshold
+    assert len(utterance) == 2 * int(SAMPLE_RATE * (40 + 300 + 400) / 1000)
+
+
+def test_detector_flush_and_odd_frames():
+    """Test stop ends the utterance and odd-length frames are realigned."""
+    detector = UtteranceDetector(sample_rate=SAMPLE_RATE, energy_threshold=0.01)
+    frame = speech_frame()
+    detector.feed(frame[:101])
+    detector.feed(frame[101:])
+    assert detector.speaking
+    events = detector.flush()
+    assert [kind for kind, _ in events] == ["end"]
+    assert len(events[0][1]) % 2 == 0
+    assert detector.flush() == []
+
+
+def run_session(websocket, transcripts):
+    """Speak, pause until a partial transcript arrives, then fall silent."""
+    for _ in range(25):
+        websocket.send_bytes(speech_frame())
+    for _ in range(15):
+        websocket.send_bytes(silence_frame())
+    messages = [websocket.receive_json()]
+    assert messages[0]["event"] == "partial_transcript"
+
+    for _ in range(25):
+        websocket.send_bytes(silence_frame())
+    while messages[-1]["event"] not in ("done", "error"):
+        messages.append(websocket.receive_json())
+    return messages
+
+
+@pytest.mark.parametrize("final_text,speculative_hit", [
+    ("What is machine learning?", True),
+    ("What is machine learning used for?", False),
+])
+def test_voice_websocket_speculative_retrieval(final_text, speculative_hit):
+    """Test retrieval on the partial transcript is reused when the final matches."""
+    def transcribe(audio, **kwargs):
+        # The first call is the partial segment, the second the whole utterance
+        transcribe.calls += 1
+        text = "what is machine learning" if transcribe.calls == 1 else final_text
+        return {"transcript": text, "confidence": None, "language": "en"}
+    transcribe.calls = 0
+
+    with patch('api.transcription_service') as mock_transcription, \
+         patch('api.embedding_service') as mock_emb, \
+         patch('api.vector_store') as mock_store, \
+         patch('api.llm_service') as mock_llm:
+        mock_transcription.transcribe_audio.side_effect = transcribe
+        mock_emb.generate_embedding.return_value = [0.1] * 1536
+        mock_store.search.return_value = CHUNKS
+        mock_llm.generate_answer_stream.return_value = iter([
+            {"type": "token", "text": "ML is AI [1]."},
+            {"type": "answer", "answer": "ML is AI [1].", "citations": []},
+        ])
+
+        client = TestClient(app)
+        with client.websocket_connect("/ws/voice") as websocket:
+            messages = run_session(websocket, transcribe)
+
+        searched = [call.args[0] for call in mock_emb.generate_embedding.call_args_list]
+
+    events = [message["event"] for message in messages]
+    assert events == ["partial_transcript", "transcript", "chunks", "token", "done"]
+    assert messages[0]["data"]["text"] == "what is machine learning"
+    assert messages[1]["data"] == {"transcript": final_text, "final": True}
+    assert mock_transcription.transcribe_audio.call_args.kwargs["filename"] == "audio.wav"
+
+    done = messages[-1]["data"]
+    assert done["answer"] == "ML is AI [1]."
+    assert done["timings"]["speculative_retrieval"] is speculative_hit
+    if speculative_hit:
+        assert searched == ["what is machine learning"]
+    else:
+        assert searched == ["what is machine learning", final_text]
+
+
+async def test_superseded_speculative_retrievals_are_cancelled():
+    """Test retrievals on outdated partial transcripts stop instead of running to completion."""
+    texts = iter(["what is", "machine learning", "how do I reset my password"])
+    started, cancelled = [], []
+
+    async def send(event, data):
+        pass
+
+    async def transcribe(audio, timer):
+        return {"transcript": next(texts)}
+
+    async def retrieve(query, timer):
+        started.append(query)
+        if query == "how do I reset my password":
+            return CHUNKS
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled.append(query)
+            raise
+
+    async def answer(query, chunks, timer, start_time):
+        yield "done", {}
+
+    session = VoiceSession(send, transcribe, retrieve, answer)
+    session._handle("segment", speech_frame())
+    session._handle("segment", speech_frame())
+    while len(started) < 2:
+        await asyncio.sleep(0.01)
+    session._handle("end", speech_frame())
+    await asyncio.wait_for(session.wait(), 2)
+
+    assert started == ["what is", "what is machine learning", "how do I reset my password"]
+    assert cancelled == ["what is", "what is machine learning"]
+
+
+def test_voice_websocket_stop_and_bad_control():
+    """Test stop ends the utterance and invalid control messages are reported."""
+    with patch('api.transcription_service') as mock_transcription:
+        mock_transcription.transcribe_audio.return_value = {
+            "transcript": "", "confidence": None, "language": "en"
+        }
+
+        client = TestClient(app)
+        with client.websocket_connect("/ws/voice") as websocket:
+            websocket.send_text("not json")
+            assert websocket.receive_json()["event"] == "error"
+            # Valid JSON that is not an object is rejected the same way
+            for control in ("5", "[]", '"x"'):
+                websocket.send_text(control)
+                assert websocket.receive_json()["data"]["detail"] == "Control messages must be JSON objects"
+
+            websocket.send_json({"type": "start", "sample_rate": 5})
+            assert "sample_rate" in websocket.receive_json()["data"]["detail"]
+
+            websocket.send_bytes(speech_frame())
+            websocket.send_json({"type": "stop"})
+            assert websocket.receive_json() == {
+                "event": "transcript", "data": {"transcript": "", "final": True}
+            }
+            message = websocket.receive_json()
+            assert message["event"] == "error"
+            assert "no speech" in message["data"]["detail"].lower()
@@ -0,0 +1,67 @@
+"""Per-stage latency tracking for request pipelines."""
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+import time
+from metrics import STAGE_DURATION
+
+
+class StageTimer:
+    """Records how long each pipeline stage took for one request."""
+
+    def __init__(self):
+        """Start the request clock."""
+        self.start = time.perf_counter()
+        self.stages: Dict[str, float] = {}  # stage name -> milliseconds
+        self.flags: Dict[str, Any] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Time a block of work as a named stage.
+
+        Args:
+            name: Stage name (repeated stages accumulate)
+        """
+        stage_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - stage_start) * 1000)
+
+    def add(self, name: str, duration_ms: float) -> None:
+        """Add time to a stage."""
+        self.stages[name] = self.stages.get(name, 0.0) + duration_ms
+        STAGE_DURATION.observe(duration_ms / 1000, stage=name)
+
+    def annotate(self, name: str, value: Any) -> None:
+        """Attach a non-duration fact to the breakdown (e.g. embedding_cached)."""
+        self.flags[name] = value
+
+    def total_ms(self) -> float:
+        """Milliseconds since the timer was created."""
+        return (time.perf_counter() - self.start) * 1000
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Breakdown for JSON responses.
+
+        Returns:
+            Dict with "<stage>_ms" per stage, annotations, and total_ms
+        """
+        breakdown: Dict[str, Any] = {
+            f"{name}_ms": round(duration, 2) for name, duration in self.stages.items()
+        }
+        breakdown.update(self.flags)
+        breakdown["total_ms"] = round(self.total_ms(), 2)
+        return breakdown
+
+    def server_timing_header(self) -> str:
+        """
+        Breakdown as a Server-Timing header value.
+
+        Returns:
+            e.g. 'embedding;dur=12.3, search;dur=4.1, total;dur=18.0'
+        """
+        metrics = [f"{name};dur={duration:.1f}" for name, duration in self.stages.items()]
+        metrics.append(f"total;dur={self.total_ms():.1f}")
+        return ", ".join(metrics)
@@ -3,6 +3,9 @@ from openai import OpenAI, APIConnectionError, APITimeoutError, APIError
 import config
 from typing import Optional
 import io
+from metrics import OPENAI_CALLS, OPENAI_ERRORS
+from deadline import Deadline, DeadlineExceeded, with_deadline
+from rate_governor import governor, INTERACTIVE, RateBudgetExhausted
 
 
 class TranscriptionService:
@@ -12,13 +15,19 @@ class TranscriptionService:
         """Initialize OpenAI client."""
         if not config.OPENAI_API_KEY:
             raise ValueError("OPENAI_API_KEY environment variable is required. Please set it in Railway Variables (Settings → Variables) or in your .env file for local development.")
-        self.client = OpenAI(api_key=config.OPENAI_API_KEY)
+        self.client = OpenAI(
+            api_key=config.OPENAI_API_KEY,
+            timeout=config.OPENAI_TIMEOUT_SECONDS,
+            http_client=governor.http_client()
+        )
         self.model = "whisper-1"  # OpenAI Whisper model
     
     def transcribe_audio(
         self,
         audio_file: bytes,
-        language: Optional[str] = "en"
+        language: Optional[str] = "en",
+        filename: str = "audio.webm",
+        deadline: Optional[Deadline] = None
     ) -> dict:
         """
         Transcribe audio file to text.
@@ -26,17 +35,36 @@ class TranscriptionService:
         Args:
             audio_file: Audio file bytes
             language: Language code (default: "en")
+            filename: Name sent with the upload; its extension tells the API the format
+            deadline: Optional request deadline; the upload is abandoned when it passes
             
         Returns:
             Dict with transcript, confidence, and language
+            
+        Raises:
+            DeadlineExceeded: If transcription cannot finish before the deadline
         """
+        if deadline is not None:
+            deadline.check("transcription")
+        try:
+            # Whisper is limited by requests per minute only
+            governor.acquire(
+                self.model,
+                priority=INTERACTIVE,
+                timeout=deadline.remaining() if deadline is not None else config.RATE_GOVERNOR_MAX_WAIT_SECONDS
+            )
+        except RateBudgetExhausted as e:
+            if deadline is not None:
+                raise DeadlineExceeded("transcription") from e
+            raise ValueError(f"OpenAI API rate limit exceeded: {e}. Please try again in a moment.")
+        OPENAI_CALLS.inc(service="transcription")
         try:
             # Create a file-like object from bytes
             audio_file_obj = io.BytesIO(audio_file)
-            audio_file_obj.name = "audio.webm"  # Set filename for OpenAI API
+            audio_file_obj.name = filename  # Set filename for OpenAI API
             
             # Call Whisper API
-            transcript = self.client.audio.transcriptions.create(
+            transcript = with_deadline(self.client, deadline).audio.transcriptions.create(
                 model=self.model,
                 file=audio_file_obj,
                 language=language if language else None
@@ -49,8 +77,12 @@ class TranscriptionService:
             }
         
         except (APIConnectionError, APITimeoutError) as e:
+            OPENAI_ERRORS.inc(service="transcription")
+            if deadline is not None and deadline.expired():
+                raise DeadlineExceeded("transcription") from e
             raise ConnectionError(f"Failed to connect to OpenAI API: {str(e)}. Please check your internet connection and API key.")
         except APIError as e:
+            OPENAI_ERRORS.inc(service="transcription")
             error_msg = str(e)
             if "api key" in error_msg.lower() or "authentication" in error_msg.lower() or "401" in error_msg or "403" in error_msg:
                 raise ValueError(f"OpenAI API authentication failed: {error_msg}. Please check your OPENAI_API_KEY.")
@@ -59,6 +91,7 @@ class TranscriptionService:
             else:
                 raise ValueError(f"OpenAI API error: {error_msg}")
         except Exception as e:
+            OPENAI_ERRORS.inc(service="transcription")
             error_msg = str(e)
             if "connection" in error_msg.lower() or "timeout" in error_msg.lower():
                 raise ConnectionError(f"Failed to connect to OpenAI API: {error_msg}. Please check your internet connection and API key.")
@@ -1,25 +1,144 @@
 """Vector database integration using ChromaDB."""
 import chromadb
+import numpy as np
 from chromadb.config import Settings
 import config
-from typing import List, Dict, Any
-import uuid
+from deadline import Deadline
+from typing import List, Dict, Any, Optional
+from embedding_backends import OPENAI_BACKEND, output_dimensions
+
+
+COLLECTION_NAME = "documents"
+
+
+def collection_metadata(dimensions: Optional[int], backend: str = OPENAI_BACKEND) -> Dict[str, Any]:
+    """
+    Metadata for a new chunk collection.
+    
+    Args:
+        dimensions: Embedding dimensionality the collection is built for
+            (None for the backend's native size)
+        backend: Embedding backend that produces the collection's vectors
+    """
+    metadata = {"hnsw:space": "cosine", "embedding_backend": backend}
+    if dimensions is not None:
+        metadata["embedding_dimensions"] = dimensions
+    return metadata
+
+
+def metadata_filter(
+    document_ids: Optional[List[int]] = None,
+    document_titles: Optional[List[str]] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Build a Chroma where clause restricting results to some documents.
+    
+    Args:
+        document_ids: Keep chunks of these document IDs
+        document_titles: Keep chunks of documents with these titles
+        
+    Returns:
+        where clause, or None if no filter was given
+    """
+    conditions = []
+    if document_ids:
+        conditions.append({"document_id": {"$in": [str(document_id) for document_id in document_ids]}})
+    if document_titles:
+        conditions.append({"document_title": {"$in": list(document_titles)}})
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
 
 
 class VectorStore:
     """Manages vector storage and retrieval."""
     
     def __init__(self):
-        """Initialize ChromaDB client and collection."""
+        """
+        Initialize ChromaDB client and collection.
+        
+        Raises:
+            ValueError: If the collection holds vectors from a different backend
+                or of a different size than configured (run migrate_embeddings.py first)
+        """
         self.client = chromadb.PersistentClient(
             path=config.VECTOR_DB_PATH,
             settings=Settings(anonymized_telemetry=False)
         )
-        self.collection = self.client.get_or_create_collection(
-            name="documents",
-            metadata={"hnsw:space": "cosine"}
+        expected = collection_metadata(
+            output_dimensions(config.EMBEDDING_BACKEND, config.EMBEDDING_DIMENSIONS),
+            config.EMBEDDING_BACKEND
+        )
+        try:
+            # get_or_create_collection would overwrite the stored metadata
+            self.collection = self.client.get_collection(name=COLLECTION_NAME)
+        except ValueError:
+            self.collection = self.client.get_or_create_collection(name=COLLECTION_NAME, metadata=expected)
+        self._check_embeddings(expected)
+    
+    def _check_embeddings(self, expected: Dict[str, Any]) -> None:
+        """
+        Fail fast if stored vectors came from a different backend or size than configured.
+        
+        An empty collection is relabelled with the current configuration instead,
+        so the vectors ingested next are recorded correctly.
+        
+        Args:
+            expected: Metadata a new collection would get under the current configuration
+        """
+        metadata = self.collection.metadata or {}
+        # Collections created before backends were recorded hold OpenAI embeddings
+        backend = metadata.get("embedding_backend", OPENAI_BACKEND)
+        dimensions = metadata.get("embedding_dimensions")
+        expected_dimensions = expected.get("embedding_dimensions")
+        # For OpenAI, no recorded size means the model's native one; for a local
+        # model it means the size is not known yet (add_chunks records it)
+        same_size = dimensions == expected_dimensions or (
+            backend != OPENAI_BACKEND and (dimensions is None or expected_dimensions is None)
+        )
+        if backend == config.EMBEDDING_BACKEND and same_size:
+            return
+        if self.collection.count() == 0:
+            self.collection.modify(metadata=expected)
+            return
+        if backend != config.EMBEDDING_BACKEND:
+            raise ValueError(
+                f"Vector store holds {backend} embeddings but EMBEDDING_BACKEND is {config.EMBEDDING_BACKEND}. "
+                f"Run: python migrate_embeddings.py --mode reembed"
+            )
+        if backend != OPENAI_BACKEND:
+            raise ValueError(
+                f"Vector store holds {dimensions}-dimension {backend} embeddings but the configured size is "
+                f"{expected_dimensions}. Run: python migrate_embeddings.py --mode reembed"
+            )
+        raise ValueError(
+            f"Vector store holds {dimensions or 'full-size'} embeddings but EMBEDDING_DIMENSIONS is "
+            f"{config.EMBEDDING_DIMENSIONS or 'unset'}. "
+            f"Run: python migrate_embeddings.py --dimensions {config.EMBEDDING_DIMENSIONS or '<size>'}"
         )
     
+    def _check_width(self, width: int) -> None:
+        """
+        Reject vectors of a size the collection does not hold.
+        
+        A local backend's size is recorded with the first vectors added if it
+        was not known when the collection was created.
+        
+        Raises:
+            ValueError: If the collection records a different size
+        """
+        metadata = self.collection.metadata or {}
+        dimensions = metadata.get("embedding_dimensions")
+        if dimensions is None:
+            if metadata.get("embedding_backend", OPENAI_BACKEND) != OPENAI_BACKEND:
+                self.collection.modify(metadata={**metadata, "embedding_dimensions": width})
+            return
+        if dimensions != width:
+            raise ValueError(
+                f"Vector store holds {dimensions}-dimension embeddings, not {width}. "
+                f"Run: python migrate_embeddings.py --mode reembed"
+            )
+    
     def add_chunks(self, chunks: List[Dict[str, Any]]) -> None:
         """
         Add chunks to vector store.
@@ -32,48 +151,92 @@ class VectorStore:
         
         ids = [chunk["id"] for chunk in chunks]
         texts = [chunk["text"] for chunk in chunks]
-        embeddings = [chunk["embedding"] for chunk in chunks]
+        embeddings = np.asarray([chunk["embedding"] for chunk in chunks], dtype=np.float32)
         metadatas = [chunk["metadata"] for chunk in chunks]
+        self._check_width(embeddings.shape[1])
         
+        # Chroma only accepts Python lists; convert the stacked array in one pass
         self.collection.add(
             ids=ids,
-            embeddings=embeddings,
+            embeddings=embeddings.tolist(),
             documents=texts,
             metadatas=metadatas
         )
     
-    def search(self, query_embedding: List[float], top_k: int = None) -> List[Dict[str, Any]]:
+    def search(
+        self,
+        query_embedding: np.ndarray,
+        top_k: int = None,
+        where: Optional[Dict[str, Any]] = None,
+        deadline: Optional[Deadline] = None
+    ) -> List[Dict[str, Any]]:
         """
         Search for similar chunks.
         
         Args:
             query_embedding: Query vector
             top_k: Number of results to return
+            where: Optional metadata filter (see metadata_filter)
+            deadline: Optional request deadline; checked before querying
             
         Returns:
-            List of chunks with similarity scores
+            List of chunks with similarity scores, most similar first
+            
+        Raises:
+            DeadlineExceeded: If the deadline has (nearly) passed
         """
+        if deadline is not None:
+            deadline.check("search")
+        if top_k is None:
+            top_k = config.TOP_K
+        
+        return self.search_batch([query_embedding], top_k=top_k, where=where)[0]
+    
+    def search_batch(
+        self,
+        query_embeddings: np.ndarray,
+        top_k: int = None,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Search for similar chunks for many queries in one collection query.
+        
+        Args:
+            query_embeddings: Query vectors (2-D array or sequence of 1-D arrays)
+            top_k: Number of results to return per query
+            where: Optional metadata filter applied to every query
+            
+        Returns:
+            One list of chunks with similarity scores per query, in input order
+        """
+        if len(query_embeddings) == 0:
+            return []
+        
         if top_k is None:
             top_k = config.TOP_K
         
         results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=top_k
+            query_embeddings=np.asarray(query_embeddings, dtype=np.float32).tolist(),
+            n_results=top_k,
+            where=where
         )
         
         # Format results
-        chunks = []
-        if results["ids"] and len(results["ids"][0]) > 0:
-            for i in range(len(results["ids"][0])):
-                chunk = {
-                    "id": results["ids"][0][i],
-                    "text": results["documents"][0][i],
-                    "metadata": results["metadatas"][0][i],
-                    "similarity_score": 1 - results["distances"][0][i]  # Convert distance to similarity
-                }
-                chunks.append(chunk)
-        
-        return chunks
+        all_chunks = []
+        for q in range(len(query_embeddings)):
+            chunks = []
+            if results["ids"] and len(results["ids"]) > q:
+                for i in range(len(results["ids"][q])):
+                    chunk = {
+                        "id": results["ids"][q][i],
+                        "text": results["documents"][q][i],
+                        "metadata": results["metadatas"][q][i],
+                        "similarity_score": 1 - results["distances"][q][i]  # Convert distance to similarity
+                    }
+                    chunks.append(chunk)
+            all_chunks.append(chunks)
+        
+        return all_chunks
     
     def delete_document(self, document_id: str) -> int:
         """
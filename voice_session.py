@@ -0,0 +1,369 @@
+"""Streamed voice sessions: end-of-speech detection, rolling transcription and speculative retrieval."""
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+import asyncio
+import io
+import re
+import time
+import wave
+import numpy as np
+from timing import StageTimer
+import config
+
+
+BYTES_PER_SAMPLE = 2  # 16-bit PCM
+
+
+def pcm16_to_wav(pcm: bytes, sample_rate: int) -> bytes:
+    """
+    Wrap raw PCM audio in a WAV container for the transcription API.
+
+    Args:
+        pcm: 16-bit little-endian mono PCM samples
+        sample_rate: Samples per second
+
+    Returns:
+        WAV file bytes
+    """
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(BYTES_PER_SAMPLE)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+
+def frame_energy(pcm: bytes) -> float:
+    """
+    Root-mean-square energy of a PCM frame.
+
+    Args:
+        pcm: 16-bit little-endian mono PCM samples
+
+    Returns:
+        RMS level between 0.0 (silence) and 1.0 (full scale)
+    """
+    if len(pcm) < BYTES_PER_SAMPLE:
+        return 0.0
+    samples = np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32768.0
+    return float(np.sqrt(np.mean(samples * samples)))
+
+
+class UtteranceDetector:
+    """
+    Split a stream of PCM frames into utterances using an energy threshold.
+
+    While the user speaks, a "segment" is emitted every segment_ms of audio and
+    at the first short pause (pause_ms), so the partial transcript usually covers
+    the whole question before the user has finished. Once trailing silence
+    reaches end_silence_ms (or the utterance hits max_utterance_ms) the whole
+    utterance is emitted as "end" and the detector resets for the next one.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = config.VOICE_SAMPLE_RATE,
+        energy_threshold: float = config.VOICE_ENERGY_THRESHOLD,
+        end_silence_ms: int = config.VOICE_END_SILENCE_MS,
+        segment_ms: int = config.VOICE_SEGMENT_MS,
+        max_utterance_ms: int = config.VOICE_MAX_UTTERANCE_MS,
+        pause_ms: int = 250,
+        preroll_ms: int = 300
+    ):
+        """
+        Initialize detector.
+
+        Args:
+            sample_rate: Samples per second of incoming audio
+            energy_threshold: RMS level above which a frame counts as speech
+            end_silence_ms: Trailing silence that ends an utterance
+            segment_ms: Audio per partial segment while speaking
+            max_utterance_ms: Utterances are force-ended at this length
+            pause_ms: Silence after which the audio so far is cut as a segment
+            preroll_ms: Audio kept from before speech starts so onsets are not clipped
+        """
+        self.sample_rate = sample_rate
+        self.energy_threshold = energy_threshold
+        self.end_silence_bytes = self._ms_to_bytes(end_silence_ms)
+        self.segment_bytes = self._ms_to_bytes(segment_ms)
+        self.max_utterance_bytes = self._ms_to_bytes(max_utterance_ms)
+        self.pause_bytes = self._ms_to_bytes(pause_ms)
+        self.preroll_bytes = self._ms_to_bytes(preroll_ms)
+        self._remainder = b""
+        self.reset()
+
+    def _ms_to_bytes(self, ms: int) -> int:
+        """Byte length of ms milliseconds of audio."""
+        return int(self.sample_rate * ms / 1000) * BYTES_PER_SAMPLE
+
+    def reset(self) -> None:
+        """Discard the current utterance."""
+        self._audio = bytearray()
+        self._speaking = False
+        self._silence_bytes = 0
+        self._segment_start = 0
+
+    @property
+    def speaking(self) -> bool:
+        """Whether an utterance is in progress."""
+        return self._speaking
+
+    def feed(self, frame: bytes) -> List[Tuple[str, bytes]]:
+        """
+        Add a frame of audio.
+
+        Args:
+            frame: 16-bit little-endian mono PCM (any length)
+
+        Returns:
+            List of ("segment", pcm) and ("end", pcm) events, in order
+        """
+        data = self._remainder + frame
+        usable = len(data) - len(data) % BYTES_PER_SAMPLE
+        self._remainder = data[usable:]
+        data = data[:usable]
+        if not data:
+            return []
+
+        events = []
+        is_speech = frame_energy(data) >= self.energy_threshold
+        self._audio.extend(data)
+
+        if not self._speaking:
+            if not is_speech:
+                # Keep only the pre-roll while waiting for speech
+                if len(self._audio) > self.preroll_bytes:
+                    del self._audio[:len(self._audio) - self.preroll_bytes]
+                return events
+            self._speaking = True
+            self._segment_start = 0
+
+        self._silence_bytes = 0 if is_speech else self._silence_bytes + len(data)
+
+        if self._silence_bytes >= self.end_silence_bytes or len(self._audio) >= self.max_utterance_bytes:
+            events.append(("end", bytes(self._audio)))
+            self.reset()
+        elif len(self._audio) - self._silence_bytes > self._segment_start and (
+            len(self._audio) - self._segment_start >= self.segment_bytes
+            # A pause after speech is likely the end of a phrase
+            or self._silence_bytes >= self.pause_bytes
+        ):
+            events.append(("segment", bytes(self._audio[self._segment_start:])))
+            self._segment_start = len(self._audio)
+        return events
+
+    def flush(self) -> List[Tuple[str, bytes]]:
+        """
+        End the current utterance now (e.g. the client pressed stop).
+
+        Returns:
+            [("end", pcm)] if speech was in progress, otherwise []
+        """
+        if not self._speaking:
+            self.reset()
+            return []
+        audio = bytes(self._audio)
+        self.reset()
+        return [("end", audio)]
+
+
+def _same_question(partial: str, final: str) -> bool:
+    """Whether a partial transcript matches the final one (ignoring case and punctuation)."""
+    def words(text: str) -> List[str]:
+        return re.sub(r"[^\w\s]", "", text.lower()).split()
+    return words(partial) == words(final)
+
+
+def _error_detail(error: Exception) -> str:
+    """User-facing message for an error raised by a pipeline callback."""
+    return str(getattr(error, "detail", None) or error)
+
+
+class _Utterance:
+    """Partial transcription state for one utterance."""
+
+    def __init__(self):
+        """Initialize empty state."""
+        self.segment_tasks: List[asyncio.Task] = []
+        self.partial_texts: List[str] = []
+        self.speculative: Optional[Tuple[str, asyncio.Task]] = None  # (partial text, retrieval task)
+        self.finished = False
+
+
+class VoiceSession:
+    """
+    Turns a stream of PCM frames into answered questions.
+
+    While the user speaks, each segment is transcribed as soon as it is cut and
+    the running partial transcript is used to start retrieval speculatively.
+    When the detector reports end of speech the whole utterance is transcribed;
+    if the final transcript matches the last partial one, the speculative
+    retrieval result is reused, otherwise retrieval runs again on the final text.
+    Speculative retrievals that can no longer be reused are cancelled.
+
+    Pipeline stages are passed in as callbacks so the session does not depend on
+    how the API reaches its services.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[str, Any], Awaitable[None]],
+        transcribe: Callable[[bytes, StageTimer], Awaitable[Dict[str, Any]]],
+        retrieve: Callable[[str, StageTimer], Awaitable[List[Dict[str, Any]]]],
+        answer: Callable[[str, List[Dict[str, Any]], StageTimer, float], AsyncIterator[Tuple[str, Any]]],
+        detector: Optional[UtteranceDetector] = None
+    ):
+        """
+        Initialize session.
+
+        Args:
+            send: Coroutine sending one (event name, data) message to the client
+            transcribe: Coroutine transcribing WAV bytes; returns dict with transcript
+            retrieve: Coroutine returning retrieved chunks for a query
+            answer: Async generator of (event name, data) answer events
+            detector: Utterance detector (default: configured 16 kHz detector)
+        """
+        self._send_callback = send
+        self._transcribe = transcribe
+        self._retrieve = retrieve
+        self._answer = answer
+        self.detector = detector or UtteranceDetector()
+        self._utterance = _Utterance()
+        self._tasks: Set[asyncio.Task] = set()
+        self._send_lock = asyncio.Lock()
+
+    async def feed_audio(self, frame: bytes) -> None:
+        """Process one frame of 16-bit mono PCM from the client."""
+        for kind, pcm in self.detector.feed(frame):
+            self._handle(kind, pcm)
+
+    async def stop(self) -> None:
+        """End the current utterance now."""
+        for kind, pcm in self.detector.flush():
+            self._handle(kind, pcm)
+
+    async def wait(self) -> None:
+        """Wait for all transcription and answer work started so far."""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    async def close(self) -> None:
+        """Cancel outstanding work (the client went away)."""
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def _spawn(self, coro: Awaitable[Any]) -> asyncio.Task:
+        """Run coro as a tracked background task."""
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+
+        def done(finished: asyncio.Task) -> None:
+            self._tasks.discard(finished)
+            if not finished.cancelled():
+                finished.exception()  # Mark retrieved; failures are reported to the client
+
+        task.add_done_callback(done)
+        return task
+
+    async def _send(self, event: str, data: Any) -> None:
+        """Send one message (serialized so concurrent tasks do not interleave)."""
+        async with self._send_lock:
+            await self._send_callback(event, data)
+
+    def _wav(self, pcm: bytes) -> bytes:
+        """WAV bytes for PCM at the detector's sample rate."""
+        return pcm16_to_wav(pcm, self.detector.sample_rate)
+
+    def _handle(self, kind: str, pcm: bytes) -> None:
+        """Start work for a detector event."""
+        utterance = self._utterance
+        if kind == "segment":
+            previous = utterance.segment_tasks[-1] if utterance.segment_tasks else None
+            utterance.segment_tasks.append(
+                self._spawn(self._transcribe_segment(pcm, previous, utterance))
+            )
+        else:
+            self._utterance = _Utterance()
+            self._spawn(self._finish_utterance(pcm, utterance))
+
+    async def _transcribe_segment(
+        self,
+        pcm: bytes,
+        previous: Optional[asyncio.Task],
+        utterance: _Utterance
+    ) -> None:
+        """Transcribe one segment, publish the partial transcript and retrieve on it."""
+        try:
+            result = await self._transcribe(self._wav(pcm), StageTimer())
+        except Exception:
+            # Partial transcripts are best effort; the final transcript decides
+            result = {"transcript": ""}
+        if previous is not None:
+            # Segments are transcribed concurrently but published in order
+            await asyncio.gather(previous, return_exceptions=True)
+        if utterance.finished:
+            return
+
+        utterance.partial_texts.append((result.get("transcript") or "").strip())
+        partial = " ".join(text for text in utterance.partial_texts if text)
+        if not partial:
+            return
+        await self._send("partial_transcript", {"text": partial})
+        if utterance.speculative is not None:
+            # Only retrieval on the latest partial transcript can be reused
+            utterance.speculative[1].cancel()
+        utterance.speculative = (partial, self._spawn(self._retrieve(partial, StageTimer())))
+
+    @staticmethod
+    def _cancel_speculative(utterance: _Utterance) -> None:
+        """Cancel the utterance's speculative retrieval, if any."""
+        if utterance.speculative is not None:
+            utterance.speculative[1].cancel()
+            utterance.speculative = None
+
+    async def _finish_utterance(self, pcm: bytes, utterance: _Utterance) -> None:
+        """Transcribe the whole utterance, reuse or redo retrieval, and stream the answer."""
+        start_time = time.time()
+        timer = StageTimer()
+        try:
+            result = await self._transcribe(self._wav(pcm), timer)
+        except Exception as e:
+            utterance.finished = True
+            self._cancel_speculative(utterance)
+            await self._send("error", {"detail": _error_detail(e)})
+            return
+
+        # Partial transcripts still in flight are superseded by the final one
+        utterance.finished = True
+        for task in utterance.segment_tasks:
+            task.cancel()
+
+        transcript = (result.get("transcript") or "").strip()
+        if utterance.speculative is not None and not _same_question(utterance.speculative[0], transcript):
+            # Retrieval for a different question would only hold embedding and search capacity
+            self._cancel_speculative(utterance)
+        await self._send("transcript", {"transcript": transcript, "final": True})
+        if not transcript:
+            await self._send("error", {"detail": "No speech detected in audio"})
+            return
+
+        retrieved_chunks = None
+        if utterance.speculative is not None:
+            try:
+                with timer.stage("speculative_wait"):
+                    retrieved_chunks = await utterance.speculative[1]
+            except Exception:
+                retrieved_chunks = None
+        timer.annotate("speculative_retrieval", retrieved_chunks is not None)
+
+        try:
+            if retrieved_chunks is None:
+                retrieved_chunks = await self._retrieve(transcript, timer)
+        except Exception as e:
+            await self._send("error", {"detail": _error_detail(e)})
+            return
+
+        async for event, data in self._answer(transcript, retrieved_chunks, timer, start_time):
+            await self._send(event, data)